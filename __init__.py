@@ -36,6 +36,19 @@ from .aw_api_tool import AWAPITool
 from .model_return import ModelReturn
 from .api_key_manager import APIKeyManager
 from .addon_utils import AddonUtils
+from .rig_transfer import RigTransfer
+from .trace_export import TraceExport
+from .bulk_fetch import BulkFetch
+from .draw_call_optimizer import OptimizeDrawCalls
+from .prune_bones import PruneBones
+from .clip_playback import ClipPlayback
+from .point_cache import BakePointCache, ToggleCacheProxy, PointCacheBake
+from .bounds import BoundsService
+from .fingerprint import UploadCache
+from .background_export import BackgroundExport
+from .asset_library import AssetLibrary
+from .asset_manifest import AssetManifest
+from .texture_loader import TextureLoader
 from pathlib import Path
 
 # Information required to register the addon in Blender.
@@ -43,7 +56,7 @@ bl_info = {
     "name": "Animate Anything Window",
     "author": "Anything World",
     "version": (1, 0),
-    "blender": (2, 80, 0),
+    "blender": (3, 2, 0),
     "description": "Opens a Animate Anything in Blender",
     "category": "AI Tool",
 }
@@ -109,6 +122,18 @@ def register():
     bpy.utils.register_class(APIKeyManager)
     bpy.utils.register_class(KeyPreferences)
     bpy.utils.register_class(ModelReturn)
+    bpy.utils.register_class(RigTransfer)
+    bpy.utils.register_class(TraceExport)
+    bpy.utils.register_class(BulkFetch)
+    bpy.utils.register_class(OptimizeDrawCalls)
+    bpy.utils.register_class(PruneBones)
+    bpy.utils.register_class(BakePointCache)
+    bpy.utils.register_class(ToggleCacheProxy)
+    BoundsService.register()
+    ClipPlayback.register()
+    UploadCache.register()
+    AssetManifest.register()
+    TextureLoader.register()
     
     prefs = bpy.context.preferences.addons[__package__].preferences
     APIKeyManager.set_api_key(APIKeyManager, prefs.api_key)
@@ -122,6 +147,19 @@ def unregister():
     bpy.utils.unregister_class(APIKeyManager)
     bpy.utils.unregister_class(KeyPreferences)
     bpy.utils.unregister_class(ModelReturn)
+    bpy.utils.unregister_class(RigTransfer)
+    bpy.utils.unregister_class(TraceExport)
+    bpy.utils.unregister_class(ToggleCacheProxy)
+    bpy.utils.unregister_class(BakePointCache)
+    bpy.utils.unregister_class(PruneBones)
+    bpy.utils.unregister_class(OptimizeDrawCalls)
+    bpy.utils.unregister_class(BulkFetch)
+    ClipPlayback.unregister()
+    BoundsService.unregister()
+    BackgroundExport.cancel_all()
+    AssetLibrary.cancel_all()
+    PointCacheBake.cancel_all()
+    TextureLoader.unregister()
 
 if __name__ == "__main__":
     register()
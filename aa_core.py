@@ -1,6 +1,5 @@
 import threading
 import os
-import shutil
 # Third-party imports
 import bpy
 
@@ -10,6 +9,16 @@ from .aw_api_tool import AWAPITool
 from .api_key_manager import APIKeyManager
 from .aa_panel import AW_PT_AAPanel
 from .global_values import GlobalValues
+from .preflight import Preflight
+from .decimator import MeshDecimator
+from .bounds import BoundsService
+from .workspace import WorkspaceManager
+from .tracing import Tracer
+from .background_export import BackgroundExport
+from .fingerprint import GeometryFingerprint, UploadCache
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
 
 
 class AAWindow(bpy.types.Operator):
@@ -51,21 +60,6 @@ class AAWindow(bpy.types.Operator):
         symmetry = context.scene.symmetry
         server_name = context.scene.my_addon_name
         
-        # clean the temp folder
-        temp_dir = bpy.app.tempdir
-        # Iterate over each item in the temporary directory
-        for item in os.listdir(temp_dir):
-            item_path = os.path.join(temp_dir, item)
-            try:
-                # Check if the item is a file and delete it
-                if os.path.isfile(item_path):
-                    os.unlink(item_path)
-                # Check if the item is a directory and delete it along with its contents
-                elif os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
-            except Exception as e:
-                print(e)
-                
         if server_name == "":
             self.report({'ERROR'}, "Please enter the model name")
             AW_PT_AAPanel.message_handler("Please enter the model name")
@@ -78,7 +72,7 @@ class AAWindow(bpy.types.Operator):
             return {'CANCELLED'}
 
         # Store the size of the model
-        GlobalValues.sent_model_size = active_obj.dimensions
+        GlobalValues.sent_model_size = BoundsService.dimensions(active_obj)
         
         # if user not create model else use the user name
         if not create_model:
@@ -102,29 +96,89 @@ class AAWindow(bpy.types.Operator):
             AW_PT_AAPanel.message_handler("Missing API Key")
             return {'CANCELLED'}
         
-        if not self.check_vertex_count():
+        if not self.check_vertex_count(allow_decimation=context.scene.auto_decimate):
             return {'CANCELLED'}
         
-        print("Type of Object: " + object_type)
+        fingerprint = None
+        if not self.preflight_report.over_budget:
+            objects = Preflight().collect_hierarchy([bpy.data.objects[name] for name in self.preflight_report.roots])
+            with Tracer.span("fingerprint", model=active_obj.name):
+                fingerprint = GeometryFingerprint.compute(objects, {'model_type': object_type, 'symmetry': symmetry})
+            if context.scene.reuse_uploads and self.reuse_upload(context, api_key, fingerprint):
+                return {'FINISHED'}
+
+        log.debug("Type of object: %s", object_type)
         if active_obj is not None:
             self.report({'INFO'}, "Selected Object: " + active_obj.name)
 
             self.report({'INFO'}, "convert to glb")
-            model_path = bpy.app.tempdir
+            # Every upload gets its own directory, other jobs may still be using theirs
+            workspace = WorkspaceManager.create("upload")
+            model_path = workspace.path
+
+            if context.scene.background_export and not self.preflight_report.over_budget:
+                GlobalValues.decimation = None
+                upload_args = {'server_name': server_name, 'symmetry': symmetry, 'model_type': object_type,
+                               'improvements': improvements, 'author': context.scene.author_name}
+                roots = [bpy.data.objects[name] for name in self.preflight_report.roots]
+                GlobalValues.sent_model_size = BoundsService.dimensions(roots)
+                try:
+                    BackgroundExport(workspace, active_obj.name, fingerprint).start(roots, api_key, upload_args)
+                except (OSError, RuntimeError) as e:
+                    workspace.release()
+                    self.report({'ERROR'}, "Could not start the background export: " + str(e))
+                    AW_PT_AAPanel.message_handler("Could not start the background export: " + str(e))
+                    return {'CANCELLED'}
+                AW_PT_AAPanel.message_handler("Exporting in the background, you can keep working.")
+                return {'FINISHED'}
             
-            exporter = Exporter()
-            exporter.export_selected_object_and_children(model_path)
+            with Tracer.span("export", job_id=workspace.job_id, model=active_obj.name):
+                if self.preflight_report.over_budget:
+                    self.export_decimated(context, model_path, active_obj.name)
+                else:
+                    GlobalValues.decimation = None
+                    exporter = Exporter()
+                    exporter.export_selected_object_and_children(model_path)
             # Start the asynchronous request
             threading.Thread(target=self.async_send_model, args=(
-                api_key, model_path, active_obj.name ,server_name,symmetry,object_type,improvements,context.scene.author_name)).start()
+                api_key, model_path, active_obj.name ,server_name,symmetry,object_type,improvements,context.scene.author_name, workspace, fingerprint)).start()
         return {'FINISHED'}
     
     
-    def check_vertex_count(self, threshold = 100000):
+    def reuse_upload(self, context, api_key, fingerprint):
+        """
+        Reuse the result of an identical earlier upload instead of spending credits again.
+        :param context: The context object containing information about the current Blender session.
+        :type context: bpy.types.Context
+        :param api_key: The API key of the upload, only its own earlier uploads are reused.
+        :type api_key: str
+        :param fingerprint: The fingerprint of the export hierarchy.
+        :type fingerprint: str
+        :return: True if an earlier upload is reused.
+        :rtype: bool
+        """
+        entry = UploadCache.get(api_key, fingerprint)
+        if entry is None:
+            return False
+        model_id = entry["model_id"]
+        log.info("Unchanged model, reusing upload %s", model_id, extra={"fields": {"fingerprint": fingerprint}})
+        self.report({'INFO'}, "Unchanged model, reusing the upload " + model_id)
+        AW_PT_AAPanel.message_handler("This model was already uploaded with the same settings, reusing its result. Untick 'Reuse unchanged uploads' to send it again.")
+        GlobalValues.sendedModel_id = model_id
+        GlobalValues.sent_job_id = ""
+        GlobalValues.decimation = None
+        context.window_manager.my_last_model = model_id
+        AW_PT_AAPanel.loading = True
+        bpy.app.timers.register(lambda: AWAPITool.check_model_was_processed(AWAPITool), first_interval=0.1)
+        return True
+
+    def check_vertex_count(self, threshold = 100000, allow_decimation = False):
         """ 
-        Check the vertex count of the selected object.
+        Run the preflight analysis over the selected objects and all their children.
         :param threshold: The threshold for the vertex count.
         :type threshold: int
+        :param allow_decimation: Accept models over the threshold, they are decimated before export.
+        :type allow_decimation: bool
         """
         obj = bpy.context.object
 
@@ -133,27 +187,68 @@ class AAWindow(bpy.types.Operator):
             self.report({'INFO'},"No object selected.")
             return False
 
-        # Make sure the object is of mesh type
-        if obj.type != 'MESH':
-            self.report({'INFO'},f"The selected object '{obj.name}' is not a mesh.")
-            AW_PT_AAPanel.message_handler(f"The selected object '{obj.name}' is not a mesh.")
-            return False
+        roots = list(bpy.context.selected_objects)
+        if obj not in roots:
+            roots.insert(0, obj)
 
-        # Get the number of vertices
-        vertex_count = len(obj.data.vertices)
+        with Tracer.span("preflight", model=obj.name):
+            report = Preflight().analyse(roots, vertex_budget=threshold)
+        self.preflight_report = report
 
         # Output result
-        print(f"Object '{obj.name}' has {vertex_count} vertices.")
-        
-        if vertex_count > threshold:
-            self.report({'INFO'},f"The object exceeds {threshold} vertices.")
-            AW_PT_AAPanel.message_handler(f"The object exceeds {threshold} vertices.")
+        log.info("Preflight '%s': %s", obj.name, report.summary(), extra={"fields": {"stage": "preflight"}})
+        for warning in report.warnings:
+            self.report({'WARNING'}, warning)
+
+        if allow_decimation and report.over_budget and len(report.errors) == 1:
+            self.report({'INFO'}, f"The model has {report.vertex_count} vertices, a decimated copy will be sent.")
+            AW_PT_AAPanel.message_handler(f"The model has {report.vertex_count} vertices, a decimated copy will be sent.")
+            return True
+
+        if not report.passed:
+            message = " ".join(report.errors)
+            heaviest = report.heaviest_objects()
+            if report.vertex_count > threshold and heaviest:
+                message += " Heaviest: " + ", ".join(f"{name} ({vertices})" for name, vertices, _, _ in heaviest)
+            self.report({'INFO'}, message)
+            AW_PT_AAPanel.message_handler(message)
             return False
         
         return True
         
     
-    def async_send_model(self, api_key, model_path, model_name ,server_name,symmetry, model_type,improvements,author):
+    def export_decimated(self, context, model_path, model_name):
+        """
+        Export a decimated copy of the selection, the original objects are left untouched.
+        :param context: The context object containing information about the current Blender session.
+        :type context: bpy.types.Context
+        :param model_path: The path to the directory where the model file will be saved.
+        :type model_path: str
+        :param model_name: The name of the exported file.
+        :type model_name: str
+        """
+        report = self.preflight_report
+        roots = [bpy.data.objects[name] for name in report.roots]
+        selected = list(context.selected_objects)
+        active = context.view_layer.objects.active
+
+        decimator = MeshDecimator(report.vertex_budget, context.scene.symmetry)
+        result = decimator.create_proxies(roots)
+        bpy.ops.object.select_all(action='DESELECT')
+        for proxy in result.proxies:
+            proxy.select_set(True)
+        context.view_layer.objects.active = result.proxies[0]
+        try:
+            Exporter().export_selected_object_and_children(model_path, model_name)
+        finally:
+            decimator.remove_proxies(result)
+            for obj in selected:
+                obj.select_set(True)
+            context.view_layer.objects.active = active
+        # Keep the vertex mapping so the returned rig can be transferred to the original
+        GlobalValues.decimation = result
+
+    def async_send_model(self, api_key, model_path, model_name ,server_name,symmetry, model_type,improvements,author, workspace=None, fingerprint=None):
         """
         Asynchronously sends a model to the API.
         :param api_key: The API key for authentication.
@@ -167,9 +262,20 @@ class AAWindow(bpy.types.Operator):
         :param improvements: The improvements of the model.
         :type improvements: bool
         :param author: The author of the model.
+        :param workspace: The workspace of the upload, released once the request is done.
+        :type workspace: JobWorkspace
+        :param fingerprint: The fingerprint of the sent hierarchy, stored with the returned model ID.
+        :type fingerprint: str
         """
-        print("Sending model...")
-        response = AWAPITool.send_model_to_api(
-            AWAPITool, api_key, model_path, model_name,server_name,symmetry, model_type,improvements,author)
+        log.info("Sending model %s", model_name, extra={"fields": {"stage": "upload"}})
+        if workspace is not None:
+            Tracer.set_job(workspace.job_id)
+        try:
+            response = AWAPITool.send_model_to_api(
+                AWAPITool, api_key, model_path, model_name,server_name,symmetry, model_type,improvements,author)
+        finally:
+            if workspace is not None:
+                workspace.release()
         bpy.app.timers.register(
-            lambda: AWAPITool.handle_sended_response(AWAPITool, response))
+            lambda: AWAPITool.handle_sended_response(AWAPITool, response, fingerprint, model_name,
+                                                     workspace.job_id if workspace is not None else "", api_key))
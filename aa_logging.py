@@ -0,0 +1,139 @@
+import logging
+import os
+import sys
+import threading
+from collections import deque
+
+from .tracing import Tracer
+
+ROOT_LOGGER = "animate_anything"
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+
+class FieldFormatter(logging.Formatter):
+    """
+    Formats a record as "time LEVEL module: message key=value ...", with the structured fields
+    given in extra={"fields": {...}} and the job ID of the thread.
+    """
+
+    def format(self, record):
+        line = super().format(record)
+        fields = dict(getattr(record, "fields", None) or {})
+        if record.job_id and "job_id" not in fields:
+            fields["job_id"] = record.job_id
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JobFilter(logging.Filter):
+    """
+    Adds the job the current thread works on (see Tracer.set_job) to every record.
+    """
+
+    def filter(self, record):
+        record.job_id = Tracer.current_job()
+        return True
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the last formatted records in memory, for the log view of the panel.
+    """
+
+    def __init__(self, capacity):
+        super().__init__(logging.DEBUG)
+        self.records = deque(maxlen=capacity)
+        self.lock_records = threading.Lock()
+
+    def emit(self, record):
+        try:
+            entry = (record.levelname, self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        with self.lock_records:
+            self.records.append(entry)
+
+    def lines(self, count=None, min_level="DEBUG"):
+        """
+        :param count: The number of most recent lines, all of them if None.
+        :param min_level: The lowest level returned.
+        :return: (level, line) pairs, oldest first.
+        :rtype: list
+        """
+        threshold = logging.getLevelName(min_level)
+        with self.lock_records:
+            entries = [entry for entry in self.records if logging.getLevelName(entry[0]) >= threshold]
+        return entries[-count:] if count else entries
+
+    def clear(self):
+        with self.lock_records:
+            self.records.clear()
+
+
+class AALog:
+    """
+    Logging of the add-on, built on the standard logging module.
+
+    Every module logs through get_logger(__name__). Records go to the console at the level
+    given by $AA_LOG_LEVEL (INFO by default) or set from the panel, and at any level to an
+    in-memory ring buffer that the panel shows. Set AA_LOG_LEVEL=DEBUG to see every download,
+    scale computation and redraw without changing code.
+    """
+    BUFFER_SIZE = 1000
+    FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+    buffer = RingBufferHandler(BUFFER_SIZE)
+    console = logging.StreamHandler(sys.stdout)
+    _configured = False
+
+    @staticmethod
+    def configure():
+        """
+        Attach the handlers to the add-on logger once.
+        """
+        if AALog._configured:
+            return
+        AALog._configured = True
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.setLevel(logging.DEBUG)
+        # The console and the panel are the outputs, do not duplicate into Blender's root logger
+        logger.propagate = False
+        job_filter = JobFilter()
+        for handler in (AALog.buffer, AALog.console):
+            handler.setFormatter(FieldFormatter(AALog.FORMAT, "%H:%M:%S"))
+            handler.addFilter(job_filter)
+            logger.addHandler(handler)
+        AALog.set_level(os.environ.get("AA_LOG_LEVEL", "INFO"))
+
+    @staticmethod
+    def set_level(level):
+        """
+        Set the level of the console output, the ring buffer always keeps everything.
+        :param level: "DEBUG", "INFO", "WARNING" or "ERROR".
+        :type level: str
+        """
+        level = level.upper()
+        if level not in LEVELS:
+            level = "INFO"
+        AALog.console.setLevel(level)
+
+    @staticmethod
+    def level():
+        """
+        :return: The level of the console output.
+        :rtype: str
+        """
+        return logging.getLevelName(AALog.console.level)
+
+
+def get_logger(name):
+    """
+    Get the logger of a module of the add-on.
+    :param name: The __name__ of the module.
+    :type name: str
+    :rtype: logging.Logger
+    """
+    AALog.configure()
+    return logging.getLogger(ROOT_LOGGER + "." + name.rsplit(".", 1)[-1])
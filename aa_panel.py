@@ -6,6 +6,13 @@ from os import system
 from .addon_utils import AddonUtils
 from .open_url import OpenURL
 from .global_values import GlobalValues
+from .bounds import BoundsService
+from .rig_pruner import RigPruner
+from .clip_playback import ClipPlayback
+from .texture_loader import TextureLoader
+from .aa_logging import get_logger, AALog, LEVELS
+
+log = get_logger(__name__)
 
 
 class AW_PT_AAPanel(bpy.types.Panel):
@@ -26,6 +33,11 @@ class AW_PT_AAPanel(bpy.types.Panel):
     loading= False
     
     time_until_last_update = 0
+    # Set when running without a UI (e.g. the batch command line), nothing is redrawn
+    headless = False
+    # Log lines shown in the panel, and their width in characters
+    LOG_LINES = 12
+    LOG_LINE_WIDTH = 90
     
     @staticmethod
     def message_handler(message):
@@ -54,8 +66,7 @@ class AW_PT_AAPanel(bpy.types.Panel):
 
                 # Check and process the JSON data
                 if 'code' in data and 'message' in data:
-                    print(f"Code: {data['code']}")
-                    print(f"Message: {data['message']}")
+                    log.info("%s: %s", data['code'], data['message'])
                     AW_PT_AAPanel.code = f"{data['code']}"
                     AW_PT_AAPanel.loading_status = f"{data['message']}"
                     AW_PT_AAPanel.message_handler_popup(data['message'], data['code'],'INFO')
@@ -72,8 +83,10 @@ class AW_PT_AAPanel(bpy.types.Panel):
             AW_PT_AAPanel.message_handler_popup(message, "",'INFO')
         
         # if the time since the last update is greater than 1 second force the redraw
+        if AW_PT_AAPanel.headless:
+            return
         current_time =  abs(AW_PT_AAPanel.time_until_last_update - time.monotonic())
-        print(current_time)
+        log.debug("Seconds since the last redraw: %.2f", current_time)
         if current_time > 1:
         #redraw the window
             #bpy.ops.wm.redraw_timer(type='DRAW_WIN_SWAP', iterations=1)
@@ -90,7 +103,8 @@ class AW_PT_AAPanel(bpy.types.Panel):
         """
         AW_PT_AAPanel.code = "INFO"
         AW_PT_AAPanel.loading_status = message
-        print(message)
+        # Already shown in the panel, the log keeps it for debugging only
+        log.debug("%s", message)
         
     @staticmethod
     def message_handler_popup(message: str, title = "", icon = 'INFO', context=None):
@@ -117,6 +131,14 @@ class AW_PT_AAPanel(bpy.types.Panel):
         bpy.utils.register_class(OpenURL)
         bpy.types.Scene.temporary_api_key = bpy.props.StringProperty(name="Temporary API Key")
         bpy.types.Scene.symmetry = bpy.props.BoolProperty(name="My model is symmetric?", default=False, description="This switch grants the user the proper to use the model")
+        bpy.types.Scene.auto_decimate = bpy.props.BoolProperty(name="Reduce models over the vertex limit", default=False, description="Send a decimated copy when the model has too many vertices, the original is not modified")
+        bpy.types.Scene.reuse_uploads = bpy.props.BoolProperty(name="Reuse unchanged uploads", default=True, description="When the same model was already uploaded with the same settings, download its result instead of uploading it again")
+        bpy.types.Scene.texture_max_size = bpy.props.IntProperty(name="Max texture size", default=0, min=0, max=16384, description="Downscale downloaded textures so their longest side is at most this many pixels, 0 keeps the full size")
+        bpy.types.Scene.optimize_draw_calls = bpy.props.BoolProperty(name="Reduce draw calls", default=False, description="Join the parts of vehicle and static models that do not move on their own and merge identical materials after importing")
+        bpy.types.Scene.bake_texture_atlas = bpy.props.BoolProperty(name="Texture atlas", default=False, description="When reducing draw calls, also merge materials that only differ by their image into a texture atlas")
+        bpy.types.Scene.prune_bones = bpy.props.EnumProperty(name="Unused bones", items=RigPruner.MODES, default='OFF', description="What to do with the bones of imported rigs that have no weights, no keys and no used children")
+        bpy.types.Scene.add_to_asset_library = bpy.props.BoolProperty(name="Add to asset library", default=False, description="Save downloaded models in the Animate Anything asset library, with a thumbnail rendered in the background")
+        bpy.types.Scene.background_export = bpy.props.BoolProperty(name="Export in the background", default=False, description="Export and upload in a separate Blender process so you can keep working, the upload starts a few seconds later")
         bpy.types.Scene.author = bpy.props.BoolProperty(name="Did you create this model?", default=False, description="This switch grants the user the proper to use the model")
         bpy.types.Scene.author_name = bpy.props.StringProperty(name="", description="Enter the author of the model here", default= "")
         bpy.types.WindowManager.my_addon_typeofObject = bpy.props.StringProperty(
@@ -127,6 +149,19 @@ class AW_PT_AAPanel(bpy.types.Panel):
         name="Name",
         description="Enter the name of your object here",
         default="")
+        bpy.types.WindowManager.aa_show_log = bpy.props.BoolProperty(name="Show Log", default=False, description="Show the latest log messages of the add-on")
+        bpy.types.WindowManager.aa_log_level = bpy.props.EnumProperty(
+            name="Console Level", description="Messages below this level are kept in the log but not printed to the console",
+            items=[(level, level.title(), "") for level in LEVELS], default=AALog.level() if AALog.level() in LEVELS else "INFO",
+            update=lambda self, context: AALog.set_level(self.aa_log_level))
+        bpy.types.WindowManager.aa_playback_mode = bpy.props.BoolProperty(
+            name="Play selected clips only", default=False,
+            description="Draw the animation clips without a selected object as bounds and stop evaluating them, so scrubbing stays fast with many clips",
+            update=lambda self, context: ClipPlayback.set_enabled(self.aa_playback_mode, self.aa_share_clips))
+        bpy.types.WindowManager.aa_share_clips = bpy.props.BoolProperty(
+            name="Share identical clips", default=False,
+            description="Show clips identical to another one with its evaluated meshes instead of bounds",
+            update=lambda self, context: ClipPlayback.set_enabled(self.aa_playback_mode, self.aa_share_clips))
         bpy.types.WindowManager.my_last_model = bpy.props.StringProperty(name="Last Model",description="Enter the last model here",default="")
 
         bpy.types.Scene.inproveAI = bpy.props.BoolProperty(name="Allow us to use this model", default=False, description="This switch grants the user the proper to use the model")
@@ -139,10 +174,22 @@ class AW_PT_AAPanel(bpy.types.Panel):
         """
         bpy.utils.unregister_class(OpenURL)
         del bpy.types.Scene.author
+        del bpy.types.Scene.auto_decimate
+        del bpy.types.Scene.background_export
+        del bpy.types.Scene.add_to_asset_library
+        del bpy.types.Scene.bake_texture_atlas
+        del bpy.types.Scene.optimize_draw_calls
+        del bpy.types.Scene.prune_bones
+        del bpy.types.Scene.texture_max_size
+        del bpy.types.Scene.reuse_uploads
         del bpy.types.Scene.author_name
         del bpy.types.Scene.temporary_api_key
         del bpy.types.WindowManager.my_addon_typeofObject
         del bpy.types.WindowManager.my_last_model
+        del bpy.types.WindowManager.aa_show_log
+        del bpy.types.WindowManager.aa_log_level
+        del bpy.types.WindowManager.aa_share_clips
+        del bpy.types.WindowManager.aa_playback_mode
         
         
     def wrap_text(self,text, width):
@@ -242,6 +289,12 @@ class AW_PT_AAPanel(bpy.types.Panel):
         col1.label(text="Symmetry")
         col1.prop(context.scene, "symmetry")
 
+        # Decimation
+        col1.separator()
+        col1.label(text="Vertex Limit")
+        col1.prop(context.scene, "auto_decimate")
+        col1.operator("wm.aa_transfer_rig", text="Transfer Rig To Original", icon='MOD_ARMATURE')
+
         # Author
         col1.separator()
         col1.label(text="Model Author")
@@ -276,6 +329,8 @@ class AW_PT_AAPanel(bpy.types.Panel):
 
         # Last Model Download Section
         col2.separator()
+        col2.prop(context.scene, "background_export")
+        col2.prop(context.scene, "reuse_uploads")
         col2.operator("wm.send_model_to_api", text="Upload", icon='EXPORT')
         col2.separator()
         
@@ -299,10 +354,44 @@ class AW_PT_AAPanel(bpy.types.Panel):
             
         col2.label(text="Download Model:")
         col2.prop(wm, "my_last_model", text="Model ID")
+        col2.prop(context.scene, "add_to_asset_library")
+        col2.prop(context.scene, "texture_max_size")
+        if not TextureLoader.available():
+            # Blender does not ship Pillow, without it textures are opened on the main thread at full size
+            col2.label(text="Install Pillow to decode and downscale textures in the background", icon='INFO')
+        col2.prop(context.scene, "optimize_draw_calls")
+        if context.scene.optimize_draw_calls:
+            col2.prop(context.scene, "bake_texture_atlas")
+        col2.prop(context.scene, "prune_bones")
+        col2.prop(wm, "aa_playback_mode")
+        if wm.aa_playback_mode and ClipPlayback.can_share():
+            col2.prop(wm, "aa_share_clips")
+        row = col2.row(align=True)
+        row.operator("object.aa_bake_point_cache", icon='FILE_CACHE')
+        row.operator("object.aa_toggle_cache_proxy", icon='ARROW_LEFTRIGHT')
         if wm.my_last_model != "" and not self.loading:
             # get the scale of current selected object
             if bpy.context.active_object is not None:
-                GlobalValues.sent_model_size = bpy.context.active_object.dimensions
+                GlobalValues.sent_model_size = BoundsService.dimensions(bpy.context.active_object)
             col2.operator("wm.getlastmodel", text="Download", icon='IMPORT')
+            col2.operator("wm.getlastmodel", text="Import From Library", icon='FILE_FOLDER').offline = True
+        col2.operator("wm.aa_bulk_fetch", text="Bulk Download", icon='DOCUMENTS')
+        col2.operator("object.aa_optimize_draw_calls", icon='MOD_DECIM')
+        col2.operator("object.aa_prune_bones", icon='BONE_DATA')
+        col2.separator()
+        col2.operator("wm.aa_export_trace", text="Export Trace", icon='TIME')
+
+        # Log
+        col2.separator()
+        col2.prop(wm, "aa_show_log")
+        if wm.aa_show_log:
+            box5 = col2.box()
+            box5.scale_y = 0.7
+            box5.prop(wm, "aa_log_level")
+            icons = {"DEBUG": 'BLANK1', "INFO": 'INFO', "WARNING": 'ERROR', "ERROR": 'CANCEL'}
+            for level, line in AALog.buffer.lines(self.LOG_LINES):
+                # Wrapped, the start holds the time, level and module
+                for index, part in enumerate(self.wrap_text(line, self.LOG_LINE_WIDTH)):
+                    box5.label(text=part, icon=icons.get(level, 'BLANK1') if index == 0 else 'BLANK1')
 
     
\ No newline at end of file
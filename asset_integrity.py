@@ -0,0 +1,122 @@
+import base64
+import hashlib
+import struct
+
+
+class IntegrityError(Exception):
+    """
+    Raised when a downloaded file is truncated, does not match its hash or is not the
+    format its name says (e.g. an HTML error page saved as .glb).
+    """
+
+
+class StreamVerifier:
+    """
+    Checks a download while it is being written, without reading the file back.
+    Hashes and counts the chunks as they arrive and keeps the first bytes for the header check.
+
+    Attributes:
+        filename (str): The name of the file, its extension selects the header check.
+        expected_length (int): The Content-Length announced by the server, if any.
+        expected_md5 (bytes): The MD5 digest announced by the server, if any.
+        length (int): The number of bytes received.
+    """
+    HEADER_SIZE = 32
+    GLB_MAGIC = b'glTF'
+    PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+    JPEG_SIGNATURE = b'\xff\xd8\xff'
+    # Text formats must not start like an HTML or XML error page
+    MARKUP_PREFIXES = (b'<!doctype', b'<html', b'<?xml', b'<error')
+
+    def __init__(self, filename, expected_length=None, expected_md5=None):
+        self.filename = filename
+        self.expected_length = expected_length
+        self.expected_md5 = expected_md5
+        self.length = 0
+        self.header = b''
+        self.md5 = hashlib.md5()
+
+    @staticmethod
+    def from_response(filename, response):
+        """
+        Build a verifier from the headers of a response.
+        Uses Content-Length (unless the body is compressed), and the MD5 of Content-MD5 or
+        x-goog-hash when the storage provides one.
+        :param filename: The name of the file.
+        :param response: The streamed response.
+        :type response: requests.Response
+        :rtype: StreamVerifier
+        """
+        headers = response.headers
+        expected_length = None
+        if "Content-Length" in headers and headers.get("Content-Encoding", "identity") == "identity":
+            try:
+                expected_length = int(headers["Content-Length"])
+            except ValueError:
+                pass
+        md5 = headers.get("Content-MD5", "")
+        for part in headers.get("x-goog-hash", "").split(","):
+            if part.strip().startswith("md5="):
+                md5 = part.strip()[4:]
+        expected_md5 = None
+        if md5:
+            try:
+                expected_md5 = base64.b64decode(md5)
+            except ValueError:
+                pass
+        return StreamVerifier(filename, expected_length, expected_md5)
+
+    def update(self, chunk):
+        """
+        Feed a received chunk.
+        :type chunk: bytes
+        """
+        if len(self.header) < StreamVerifier.HEADER_SIZE:
+            self.header += chunk[:StreamVerifier.HEADER_SIZE - len(self.header)]
+            # Fail fast, before the rest of a wrong file is downloaded
+            if len(self.header) >= StreamVerifier.HEADER_SIZE:
+                self.check_header()
+        self.length += len(chunk)
+        self.md5.update(chunk)
+
+    def check_header(self):
+        """
+        Check the magic bytes of the file against its extension.
+        :raises IntegrityError: If the header does not match.
+        """
+        name = self.filename.lower()
+        header = self.header
+        if name.endswith('.glb'):
+            if len(header) < 12 or header[:4] != StreamVerifier.GLB_MAGIC:
+                raise IntegrityError(f"{self.filename} is not a GLB file (starts with {header[:16]!r})")
+            version, declared_length = struct.unpack_from('<II', header, 4)
+            if version != 2:
+                raise IntegrityError(f"{self.filename} has unsupported glTF version {version}")
+            if self.expected_length is not None and declared_length != self.expected_length:
+                raise IntegrityError(f"{self.filename} declares {declared_length} bytes but the server sends {self.expected_length}")
+        elif name.endswith('.png'):
+            if header[:8] != StreamVerifier.PNG_SIGNATURE:
+                raise IntegrityError(f"{self.filename} is not a PNG file (starts with {header[:16]!r})")
+        elif name.endswith(('.jpg', '.jpeg')):
+            if header[:3] != StreamVerifier.JPEG_SIGNATURE:
+                raise IntegrityError(f"{self.filename} is not a JPEG file (starts with {header[:16]!r})")
+        elif header.lstrip().lower().startswith(StreamVerifier.MARKUP_PREFIXES):
+            raise IntegrityError(f"{self.filename} is an HTML/XML page, not a model file")
+
+    def finish(self):
+        """
+        Check the whole file once the stream ended.
+        :raises IntegrityError: If the file is truncated, empty or does not match its hash.
+        """
+        if self.length == 0:
+            raise IntegrityError(f"{self.filename} is empty")
+        if len(self.header) < StreamVerifier.HEADER_SIZE:
+            self.check_header()
+        if self.expected_length is not None and self.length != self.expected_length:
+            raise IntegrityError(f"{self.filename} is truncated: {self.length} of {self.expected_length} bytes")
+        if self.filename.lower().endswith('.glb'):
+            declared_length = struct.unpack_from('<I', self.header, 8)[0]
+            if declared_length != self.length:
+                raise IntegrityError(f"{self.filename} is truncated: {self.length} of {declared_length} bytes")
+        if self.expected_md5 is not None and self.md5.digest() != self.expected_md5:
+            raise IntegrityError(f"{self.filename} does not match its MD5")
@@ -0,0 +1,236 @@
+import json
+import os
+import re
+import subprocess
+import threading
+import uuid
+import bpy
+
+from .aa_panel import AW_PT_AAPanel
+from .tracing import Tracer
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class AssetJob:
+    """
+    One result being added to the asset library.
+
+    Attributes:
+        name (str): The name of the asset.
+        blend_path (str): The .blend written for it in the library.
+        process (subprocess.Popen): The thumbnail process, None until it started.
+        output (str): What the process printed.
+    """
+
+    def __init__(self, name, blend_path):
+        self.name = name
+        self.blend_path = blend_path
+        self.process = None
+        self.output = ""
+        self.reader = None
+
+    def read_output(self):
+        """
+        Wait for the process and keep its output. Runs on its own thread.
+        """
+        self.output = self.process.communicate()[0] or ""
+
+    @property
+    def finished(self):
+        return self.process is not None and self.process.poll() is not None and not self.reader.is_alive()
+
+    def result(self):
+        """
+        :return: The result printed by the worker, with "error" set if it failed.
+        :rtype: dict
+        """
+        for line in reversed(self.output.splitlines()):
+            if line.startswith(AssetLibrary.RESULT_PREFIX):
+                try:
+                    return json.loads(line[len(AssetLibrary.RESULT_PREFIX):])
+                except ValueError:
+                    break
+        return {"error": f"The thumbnail process exited with code {self.process.returncode}"}
+
+
+class AssetLibrary:
+    """
+    Adds imported results to a Blender asset library, so they show up in the Asset Browser of
+    every file, sorted in one catalog per behaviour type.
+
+    On the main thread the objects of the result are gathered in a collection that is marked as
+    an asset and written alone to a .blend in the library with bpy.data.libraries.write, which is
+    fast. A "blender -b" process then opens that file, packs the images, renders the thumbnail
+    and saves it, so the session of the artist never waits for a render.
+    """
+    LIBRARY_NAME = "Animate Anything"
+    FOLDER = "animate_anything"
+    CATALOG_FILE = "blender_assets.cats.txt"
+    # Catalog UUIDs are derived from the behaviour type so every machine files assets alike
+    CATALOG_NAMESPACE = uuid.UUID("6f0e6a8e-2b1c-4f57-9d5e-9a3c1e1a7b42")
+    RESULT_PREFIX = "AA_RESULT "
+    WORKER_SCRIPT = "asset_worker.py"
+    THUMBNAIL_SIZE = 256
+    # Thumbnail processes running at once, the others wait
+    MAX_PROCESSES = 2
+    POLL_SECONDS = 1.0
+
+    pending = []
+    running = []
+
+    @staticmethod
+    def folder():
+        """
+        :return: The folder of the asset library.
+        :rtype: str
+        """
+        return bpy.utils.user_resource('DATAFILES', path=os.path.join(AssetLibrary.FOLDER, "assets"), create=True)
+
+    @staticmethod
+    def ensure_registered():
+        """
+        Add the library folder to the asset libraries of the preferences if it is missing.
+        :return: The folder of the library.
+        :rtype: str
+        """
+        folder = AssetLibrary.folder()
+        libraries = bpy.context.preferences.filepaths.asset_libraries
+        for library in libraries:
+            if os.path.normpath(bpy.path.abspath(library.path)) == os.path.normpath(folder):
+                return folder
+        bpy.ops.preferences.asset_library_add(directory=folder)
+        libraries[-1].name = AssetLibrary.LIBRARY_NAME
+        return folder
+
+    @staticmethod
+    def catalog_id(behaviour):
+        """
+        Get the catalog of a behaviour type, adding it to the catalog file of the library if needed.
+        :param behaviour: The name of the DefaultBehaviourType.
+        :type behaviour: str
+        :return: The UUID of the catalog.
+        :rtype: str
+        """
+        catalog = str(uuid.uuid5(AssetLibrary.CATALOG_NAMESPACE, behaviour))
+        path = os.path.join(AssetLibrary.folder(), AssetLibrary.CATALOG_FILE)
+        lines = []
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                lines = file.read().splitlines()
+        if any(line.startswith(catalog + ":") for line in lines):
+            return catalog
+        if not lines:
+            lines = ["# This is an Asset Catalog Definition file for Blender.", "VERSION 1", ""]
+        lines.append(f"{catalog}:{AssetLibrary.LIBRARY_NAME}/{behaviour}:{AssetLibrary.LIBRARY_NAME}-{behaviour}")
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write("\n".join(lines) + "\n")
+        return catalog
+
+    @staticmethod
+    def add(objects, name, behaviour, model_id=""):
+        """
+        Add imported objects to the library as one collection asset. Main thread only.
+        :param objects: The root objects of the result, their children are added too.
+        :type objects: list
+        :param name: The name of the asset.
+        :type name: str
+        :param behaviour: The name of the DefaultBehaviourType, used as catalog.
+        :type behaviour: str
+        :param model_id: The ID of the model, kept in the description of the asset.
+        :type model_id: str
+        :return: The .blend written for the asset, None if there was nothing to add or the model
+            is still being added.
+        :rtype: str
+        """
+        objects = [obj for obj in objects if obj is not None and obj.name in bpy.data.objects]
+        if not objects:
+            return None
+        folder = AssetLibrary.ensure_registered()
+        file_name = re.sub(r'[^\w\-. ]', '_', name).strip() or "model"
+        blend_path = os.path.join(folder, f"{file_name}_{(model_id or uuid.uuid4().hex)[:8]}.blend")
+        if any(job.blend_path == blend_path for job in AssetLibrary.pending + AssetLibrary.running):
+            # Writing the file again would overwrite it while its thumbnail process saves it
+            log.info("%s is already being added to the asset library", name)
+            return None
+        # A collection outside the scene holds the objects of this result only
+        collection = bpy.data.collections.new(name)
+        # The name gets a suffix if the session already has a collection called like this
+        asset_name = collection.name
+        try:
+            for root in objects:
+                for obj in [root] + list(root.children_recursive):
+                    if obj.name not in collection.objects:
+                        collection.objects.link(obj)
+            collection.asset_mark()
+            collection.asset_data.catalog_id = AssetLibrary.catalog_id(behaviour)
+            collection.asset_data.description = f"Animate Anything model {model_id}".strip()
+            collection.asset_data.tags.new(behaviour, skip_if_exists=True)
+            with Tracer.span("write asset", asset=name, objects=len(collection.objects)):
+                bpy.data.libraries.write(blend_path, {collection}, path_remap='ABSOLUTE', fake_user=True)
+        finally:
+            bpy.data.collections.remove(collection)
+        AssetLibrary.pending.append(AssetJob(asset_name, blend_path))
+        if not bpy.app.timers.is_registered(AssetLibrary.poll):
+            bpy.app.timers.register(AssetLibrary.poll)
+        log.info("Added %s to the asset library", name, extra={"fields": {"path": blend_path}})
+        return blend_path
+
+    @staticmethod
+    def start(job):
+        """
+        Start the process that packs the images and renders the thumbnail of an asset.
+        :type job: AssetJob
+        """
+        worker = os.path.join(os.path.dirname(os.path.abspath(__file__)), AssetLibrary.WORKER_SCRIPT)
+        command = [bpy.app.binary_path, "-b", "--factory-startup", job.blend_path, "--python", worker, "--",
+                   "--collection", job.name, "--size", str(AssetLibrary.THUMBNAIL_SIZE)]
+        job.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       stdin=subprocess.DEVNULL, text=True)
+        job.reader = threading.Thread(target=job.read_output, daemon=True)
+        job.reader.start()
+        AssetLibrary.running.append(job)
+
+    @staticmethod
+    def poll():
+        """
+        Timer starting the queued thumbnail processes and reporting the finished ones.
+        :return: Seconds until the next call, None when nothing is left.
+        """
+        for job in list(AssetLibrary.running):
+            if not job.finished:
+                continue
+            AssetLibrary.running.remove(job)
+            result = job.result()
+            if "error" in result:
+                log.warning("Thumbnail of %s failed: %s\n%s", job.name, result["error"], job.output[-2000:])
+                AW_PT_AAPanel.message_handler(f"{job.name} is in the asset library, without a thumbnail")
+            else:
+                AW_PT_AAPanel.message_handler(f"{job.name} is in the asset library")
+        while AssetLibrary.pending and len(AssetLibrary.running) < AssetLibrary.MAX_PROCESSES:
+            AssetLibrary.start(AssetLibrary.pending.pop(0))
+        if not AssetLibrary.running:
+            return None
+        return AssetLibrary.POLL_SECONDS
+
+    @staticmethod
+    def cancel_all():
+        """
+        Stop the thumbnail processes, e.g. when the add-on is disabled. The assets stay in the library.
+        """
+        for job in AssetLibrary.running:
+            if job.process.poll() is None:
+                job.process.terminate()
+        AssetLibrary.running.clear()
+        AssetLibrary.pending.clear()
+        if bpy.app.timers.is_registered(AssetLibrary.poll):
+            bpy.app.timers.unregister(AssetLibrary.poll)
+
+    @staticmethod
+    def report_result(result):
+        """
+        Print the result of the thumbnail process, called in the subprocess.
+        :type result: dict
+        """
+        print(AssetLibrary.RESULT_PREFIX + json.dumps(result), flush=True)
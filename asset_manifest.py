@@ -0,0 +1,298 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import bpy
+
+from .aa_type_handler import AATypeHanlder
+from .workspace import JobWorkspace
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class ManifestEntry:
+    """
+    One recorded download of a model.
+
+    Attributes:
+        download_id (int): The ID of the download in the manifest.
+        model_id (str): The ID of the model.
+        name (str): The name of the model, empty if the result has none.
+        behaviour (str): The name of its DefaultBehaviourType.
+        downloaded (float): When it was downloaded, as a Unix time.
+        path (str): The library folder holding its files.
+    """
+
+    def __init__(self, row):
+        self.download_id, self.model_id, self.name, self.behaviour, self.downloaded, self.path, self.data_json = row
+
+    @property
+    def data(self):
+        """
+        The processed model JSON returned by the API.
+        :rtype: list
+        """
+        return json.loads(self.data_json)
+
+
+class AssetManifest:
+    """
+    Persistent record of the downloaded results, so they can be browsed, compared and imported
+    again without calling the API.
+
+    Every download gets a row with the processed model JSON and its behaviour type, and a row per
+    file with its role (the folder of the workspace), size and MD5. The files are hard-linked, or
+    copied across file systems, into a library folder next to the database, out of reach of the
+    workspace cleanup. The last MAX_VERSIONS downloads of each model are kept.
+    The database is SQLite, indexed by model, name, behaviour and date.
+    """
+    FOLDER = "animate_anything"
+    DB_NAME = "manifest.sqlite"
+    LIBRARY_NAME = "library"
+    MAX_VERSIONS = 3
+    COLUMNS = "download_id, model_id, name, behaviour, downloaded, path, data"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS downloads (
+            download_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model_id TEXT NOT NULL,
+            name TEXT NOT NULL DEFAULT '',
+            behaviour TEXT NOT NULL,
+            downloaded REAL NOT NULL,
+            path TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS files (
+            download_id INTEGER NOT NULL REFERENCES downloads(download_id) ON DELETE CASCADE,
+            role TEXT NOT NULL,
+            name TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            md5 TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS downloads_model ON downloads(model_id, downloaded);
+        CREATE INDEX IF NOT EXISTS downloads_name ON downloads(name);
+        CREATE INDEX IF NOT EXISTS downloads_behaviour ON downloads(behaviour, downloaded);
+        CREATE INDEX IF NOT EXISTS files_download ON files(download_id, role);
+        CREATE INDEX IF NOT EXISTS files_md5 ON files(md5);
+    """
+
+    _lock = threading.Lock()
+    _initialized = False
+    _folder = None
+
+    @staticmethod
+    def folder():
+        """
+        Resolved once on the main thread by register, downloads are recorded from worker threads.
+        :return: The folder of the database and the library.
+        :rtype: str
+        """
+        if AssetManifest._folder is None:
+            AssetManifest._folder = bpy.utils.user_resource('DATAFILES', path=AssetManifest.FOLDER, create=True)
+        return AssetManifest._folder
+
+    @staticmethod
+    def register():
+        AssetManifest.folder()
+
+    @staticmethod
+    @contextmanager
+    def connect():
+        """
+        Open the database, creating it on first use. Connections are not shared between threads.
+        """
+        connection = sqlite3.connect(os.path.join(AssetManifest.folder(), AssetManifest.DB_NAME), timeout=10)
+        try:
+            connection.execute("PRAGMA foreign_keys = ON")
+            if not AssetManifest._initialized:
+                # WAL lets the panel read while a download thread records
+                connection.execute("PRAGMA journal_mode = WAL")
+                connection.executescript(AssetManifest.SCHEMA)
+                AssetManifest._initialized = True
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def store_file(source, destination):
+        """
+        Put a downloaded file in the library, linking it when both are on the same file system.
+        """
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copy2(source, destination)
+
+    @staticmethod
+    def record(model_id, downloader):
+        """
+        Record a finished download. Errors are logged, a download never fails because of the manifest.
+        :param model_id: The ID of the model.
+        :type model_id: str
+        :param downloader: The downloader, after parse_and_download succeeded.
+        :type downloader: ModelDownloader
+        :return: The new entry, None if it could not be recorded.
+        :rtype: ManifestEntry
+        """
+        data = downloader.data
+        behaviour = AATypeHanlder.parse_behaviour_type(data).name
+        name = data[0].get("name", "") if isinstance(data, list) and data and isinstance(data[0], dict) else ""
+        downloaded = time.time()
+        path = None
+        try:
+            path = os.path.join(AssetManifest.folder(), AssetManifest.LIBRARY_NAME, model_id,
+                                time.strftime('%Y%m%d_%H%M%S', time.localtime(downloaded)) + "_" + uuid.uuid4().hex[:8])
+            rows = []
+            for role, source, size, md5 in downloader.files:
+                destination = os.path.join(path, role, os.path.basename(source))
+                AssetManifest.store_file(source, destination)
+                rows.append((role, os.path.basename(source), destination, size, md5))
+            with AssetManifest._lock, AssetManifest.connect() as connection:
+                cursor = connection.execute(
+                    "INSERT INTO downloads (model_id, name, behaviour, downloaded, path, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    (model_id, name, behaviour, downloaded, path, json.dumps(data)))
+                download_id = cursor.lastrowid
+                connection.executemany("INSERT INTO files (download_id, role, name, path, size, md5) VALUES (?, ?, ?, ?, ?, ?)",
+                                       [(download_id,) + row for row in rows])
+                AssetManifest.prune(connection, model_id)
+        except (OSError, sqlite3.Error) as e:
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+            log.warning("Could not record %s in the asset manifest: %s", model_id, e)
+            return None
+        log.info("Recorded %s in the asset manifest", model_id, extra={"fields": {"files": len(rows)}})
+        return ManifestEntry((download_id, model_id, name, behaviour, downloaded, path, json.dumps(data)))
+
+    @staticmethod
+    def prune(connection, model_id):
+        """
+        Remove the downloads of a model beyond MAX_VERSIONS and their files.
+        """
+        stale = connection.execute(
+            "SELECT download_id, path FROM downloads WHERE model_id = ? ORDER BY downloaded DESC LIMIT -1 OFFSET ?",
+            (model_id, AssetManifest.MAX_VERSIONS)).fetchall()
+        for download_id, path in stale:
+            connection.execute("DELETE FROM downloads WHERE download_id = ?", (download_id,))
+            shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def latest(model_id):
+        """
+        :param model_id: The ID of the model.
+        :return: Its most recent download, None if it was never recorded.
+        :rtype: ManifestEntry
+        """
+        with AssetManifest.connect() as connection:
+            row = connection.execute(
+                f"SELECT {AssetManifest.COLUMNS} FROM downloads WHERE model_id = ? ORDER BY downloaded DESC LIMIT 1",
+                (model_id,)).fetchone()
+        return ManifestEntry(row) if row else None
+
+    @staticmethod
+    def versions(model_id):
+        """
+        :param model_id: The ID of the model.
+        :return: Its recorded downloads, newest first.
+        :rtype: list
+        """
+        with AssetManifest.connect() as connection:
+            rows = connection.execute(
+                f"SELECT {AssetManifest.COLUMNS} FROM downloads WHERE model_id = ? ORDER BY downloaded DESC",
+                (model_id,)).fetchall()
+        return [ManifestEntry(row) for row in rows]
+
+    @staticmethod
+    def search(name=None, behaviour=None, limit=100):
+        """
+        List the latest download of the recorded models.
+        :param name: Only models whose name starts with this.
+        :type name: str
+        :param behaviour: Only models of this DefaultBehaviourType name.
+        :type behaviour: str
+        :param limit: The maximum number of models returned.
+        :return: The entries, most recently downloaded first.
+        :rtype: list
+        """
+        conditions = ["downloaded = (SELECT MAX(downloaded) FROM downloads AS newer WHERE newer.model_id = downloads.model_id)"]
+        parameters = []
+        if name:
+            conditions.append("name LIKE ? ESCAPE '\\'")
+            parameters.append(name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if behaviour:
+            conditions.append("behaviour = ?")
+            parameters.append(behaviour)
+        parameters.append(limit)
+        with AssetManifest.connect() as connection:
+            rows = connection.execute(
+                f"SELECT {AssetManifest.COLUMNS} FROM downloads WHERE {' AND '.join(conditions)} ORDER BY downloaded DESC LIMIT ?",
+                parameters).fetchall()
+        return [ManifestEntry(row) for row in rows]
+
+    @staticmethod
+    def files(download_id, role=None):
+        """
+        :param download_id: The download.
+        :param role: Only the files of this folder, e.g. "animations".
+        :return: (role, name, path, size, md5) of its files.
+        :rtype: list
+        """
+        query = "SELECT role, name, path, size, md5 FROM files WHERE download_id = ?"
+        parameters = [download_id]
+        if role:
+            query += " AND role = ?"
+            parameters.append(role)
+        with AssetManifest.connect() as connection:
+            return connection.execute(query + " ORDER BY role, name", parameters).fetchall()
+
+    @staticmethod
+    def changed_files(old_id, new_id):
+        """
+        Compare two downloads of a model by file content.
+        :return: (role, name) of the files added, removed or changed between them.
+        :rtype: list
+        """
+        old = {(role, name): md5 for role, name, _, _, md5 in AssetManifest.files(old_id)}
+        new = {(role, name): md5 for role, name, _, _, md5 in AssetManifest.files(new_id)}
+        return sorted(key for key in old.keys() | new.keys() if old.get(key) != new.get(key))
+
+    @staticmethod
+    def is_complete(entry):
+        """
+        Check that the library still has every file of a download, with its recorded size.
+        :type entry: ManifestEntry
+        :rtype: bool
+        """
+        for _, _, path, size, _ in AssetManifest.files(entry.download_id):
+            try:
+                if os.path.getsize(path) != size:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    @staticmethod
+    def workspace(entry):
+        """
+        Get a workspace over the library folder of a download, to import it again.
+        :type entry: ManifestEntry
+        :rtype: JobWorkspace
+        """
+        return JobWorkspace(f"library_{entry.download_id}", entry.path + os.sep)
+
+    @staticmethod
+    def forget(model_id):
+        """
+        Remove every download of a model and its files.
+        """
+        with AssetManifest._lock, AssetManifest.connect() as connection:
+            paths = [row[0] for row in connection.execute("SELECT path FROM downloads WHERE model_id = ?", (model_id,))]
+            connection.execute("DELETE FROM downloads WHERE model_id = ?", (model_id,))
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,155 @@
+"""
+Thumbnail worker, run by AssetLibrary in a headless Blender on an asset .blend of the library:
+    blender -b --factory-startup <asset.blend> --python asset_worker.py -- --collection <name> --size 256
+
+Packs the images the asset uses, renders its thumbnail with Workbench and saves the file.
+The result is printed on stdout.
+"""
+import argparse
+import math
+import os
+import shutil
+import sys
+import tempfile
+import bpy
+import numpy as np
+from mathutils import Vector
+
+if __package__:
+    from .asset_library import AssetLibrary
+    from .bounds import BoundsService
+
+
+def parse_args(argv):
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    parser = argparse.ArgumentParser(prog="asset_worker.py")
+    parser.add_argument("--collection", required=True, help="Name of the collection asset")
+    parser.add_argument("--size", type=int, default=256, help="Size of the thumbnail in pixels")
+    return parser.parse_args(argv)
+
+
+def frame_camera(scene, roots):
+    """
+    Add a camera and a light looking at the objects from the front right, above.
+    :return: The added objects, removed again before saving.
+    :rtype: list
+    """
+    low, high = BoundsService.world_bounds(roots)
+    if low is None:
+        low, high = np.zeros(3), np.ones(3)
+    center = Vector(((low + high) / 2).tolist())
+    radius = max(float(np.linalg.norm(high - low)) / 2, 0.01)
+
+    camera_data = bpy.data.cameras.new("AA_Thumbnail")
+    camera_data.lens = 50
+    camera = bpy.data.objects.new("AA_Thumbnail", camera_data)
+    scene.collection.objects.link(camera)
+    # Distance at which the bounding sphere fills the narrowest field of view
+    distance = radius / math.sin(camera_data.angle / 2) * 1.1
+    direction = Vector((1.0, -1.0, 0.7)).normalized()
+    camera.location = center + direction * distance
+    camera.rotation_euler = (-direction).to_track_quat('-Z', 'Y').to_euler()
+    camera_data.clip_end = distance + radius * 4
+    scene.camera = camera
+
+    light_data = bpy.data.lights.new("AA_Thumbnail", 'SUN')
+    light = bpy.data.objects.new("AA_Thumbnail", light_data)
+    light.rotation_euler = camera.rotation_euler
+    scene.collection.objects.link(light)
+    return [camera, light]
+
+
+def render_thumbnail(scene, folder, size):
+    """
+    Render the scene to a PNG.
+    :param folder: The folder of the image.
+    :return: The path of the image.
+    :rtype: str
+    """
+    scene.render.engine = 'BLENDER_WORKBENCH'
+    scene.display.shading.light = 'STUDIO'
+    scene.display.shading.color_type = 'TEXTURE'
+    scene.render.resolution_x = size
+    scene.render.resolution_y = size
+    scene.render.resolution_percentage = 100
+    scene.render.film_transparent = True
+    scene.render.image_settings.file_format = 'PNG'
+    scene.render.image_settings.color_mode = 'RGBA'
+    scene.render.filepath = os.path.join(folder, "thumbnail.png")
+    bpy.ops.render.render(write_still=True)
+    return scene.render.filepath
+
+
+def set_preview(collection, path):
+    """
+    Use an image as the preview of an ID.
+    """
+    image = bpy.data.images.load(path)
+    try:
+        width, height = image.size
+        pixels = np.empty(width * height * 4, dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+        preview = collection.preview_ensure()
+        preview.image_size = (width, height)
+        preview.image_pixels_float.foreach_set(pixels)
+    finally:
+        bpy.data.images.remove(image)
+
+
+def main(argv):
+    """
+    Pack, render the thumbnail and save the opened asset file.
+    :return: The process exit code.
+    :rtype: int
+    """
+    args = parse_args(argv)
+    try:
+        collection = bpy.data.collections.get(args.collection)
+        if collection is None:
+            AssetLibrary.report_result({"error": f"No collection {args.collection} in the file"})
+            return 1
+        # The downloaded textures live in temporary folders, keep them in the asset
+        bpy.ops.file.pack_all()
+
+        scene = bpy.context.scene
+        scene.collection.children.link(collection)
+        bpy.context.view_layer.update()
+        roots = [obj for obj in collection.objects if obj.parent is None]
+        helpers = frame_camera(scene, roots)
+        thumbnail_dir = tempfile.mkdtemp(prefix="aa_thumbnail_")
+        thumbnail_error = ""
+        try:
+            thumbnail = render_thumbnail(scene, thumbnail_dir, args.size)
+            set_preview(collection, thumbnail)
+        except Exception as e:
+            # Still save the packed asset, it is usable without a thumbnail
+            thumbnail_error = f"{type(e).__name__}: {e}"
+        finally:
+            for obj in helpers:
+                data = obj.data
+                bpy.data.objects.remove(obj)
+                if isinstance(data, bpy.types.Camera):
+                    bpy.data.cameras.remove(data)
+                else:
+                    bpy.data.lights.remove(data)
+            scene.collection.children.unlink(collection)
+            shutil.rmtree(thumbnail_dir, ignore_errors=True)
+
+        bpy.ops.wm.save_as_mainfile(filepath=bpy.data.filepath, compress=True)
+        if thumbnail_error:
+            AssetLibrary.report_result({"error": thumbnail_error})
+            return 1
+        AssetLibrary.report_result({"path": bpy.data.filepath})
+        return 0
+    except Exception as e:
+        AssetLibrary.report_result({"error": f"{type(e).__name__}: {e}"})
+        return 1
+
+
+if __name__ == "__main__":
+    # Run by Blender as a script: load the add-on as a package so its relative imports work
+    import importlib
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(addon_dir))
+    worker = importlib.import_module(os.path.basename(addon_dir) + ".asset_worker")
+    sys.exit(worker.main(sys.argv))
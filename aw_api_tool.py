@@ -1,3 +1,4 @@
+import functools
 import json
 import os
 import threading
@@ -12,6 +13,17 @@ from .aa_panel import AW_PT_AAPanel
 from .api_key_manager import APIKeyManager
 from .aa_type_handler import AATypeHanlder
 from .aa_type_handler import DefaultBehaviourType
+from .workspace import WorkspaceManager
+from .tracing import Tracer
+from .transfer_policy import TransferPolicy, RetryBudget
+from .asset_integrity import IntegrityError
+from .fingerprint import UploadCache
+from .asset_manifest import AssetManifest
+from .asset_library import AssetLibrary
+from .import_job import ImportJob
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
 
 class AWAPITool:
     """
@@ -19,6 +31,7 @@ class AWAPITool:
     It is used by the main thread and by the timer thread.
     """
     RECEIVE_URL = "https://api.anything.world/user-processed-model"
+    ALL_FOLDERS = ("preprocessed_model", "parts", "animations", "shader", "rig")
     SEND_URL = "https://api.anything.world/animate"
   
 
@@ -133,17 +146,19 @@ class AWAPITool:
         return body, content_type
 
 
-    def send_model_to_api(self, api_key, model_path, model_name,server_name,symmetry, model_type,improvements,author, url = SEND_URL):
+    def send_model_to_api(self, api_key, model_path, model_name,server_name,symmetry, model_type,improvements,author, url = None, budget = None):
         """
         Send a model to the API.
         :param api_key: str, API key
         :param model_path: str, path to the model file
         :param model_name: str, name of the model
         :param model_type: str, type of the model
-        :param url: str, API URL
+        :param url: str, API URL, defaults to SEND_URL
+        :param budget: RetryBudget, retry budget of the job
         :return: Response from the API
         """
-        print("Sending name..."+ model_name)
+        url = url or AWAPITool.SEND_URL
+        log.debug("Sending %s", model_name)
 
         # Ensure the file exists
         if not os.path.isfile(model_path+model_name+".glb"):
@@ -162,33 +177,44 @@ class AWAPITool:
         # Read the files from the directory
         files = AWAPITool().read_files(model_path+model_name+".glb")
 
-        form_data, content_type = AWAPITool().create_form_data(files, data)
+        with Tracer.span("encode upload", model=model_name):
+            form_data, content_type = AWAPITool().create_form_data(files, data)
         try:
-            
-            response = requests.post(url, data=form_data, headers={'Content-Type': content_type}, timeout=10)
+            with Tracer.span("upload", "transfer", model=model_name, bytes=len(form_data)) as span:
+                response = TransferPolicy.request("POST", url, budget=budget, idempotent=False, data=form_data,
+                                                  headers={'Content-Type': content_type}, timeout=10)
+                span.set(status=response.status_code)
         except requests.RequestException as e:
             return f"Request failed: {e}"
         return response
 
-    def getModelProcessed(self, api_key, model_id, url = RECEIVE_URL):
+    def getModelProcessed(self, api_key, model_id, url = None, budget = None):
         """
         Get a processed model from the API.
         :param api_key: str, API key
         :param model_id: str, ID of the model
-        :param url: str, API URL
+        :param url: str, API URL, defaults to RECEIVE_URL
+        :param budget: RetryBudget, retry budget of the job
         :return: Response from the API
         """
+        url = url or AWAPITool.RECEIVE_URL
         data = {
             'key': api_key,
             'id': model_id,
         }
-        response = requests.get(url, params=data, timeout=20)
+        with Tracer.span("get processed model", "transfer", model_id=model_id) as span:
+            response = TransferPolicy.request("GET", url, budget=budget, params=data, timeout=20)
+            span.set(status=response.status_code, bytes=len(response.content))
         return response
 
-    def handle_sended_response(self, response):
+    def handle_sended_response(self, response, fingerprint = None, model_name = "", job_id = "", api_key = ""):
         """
         Handle the response after sending a model to the API.
         :param response: Response from the API
+        :param fingerprint: str, fingerprint of the sent hierarchy, stored with the returned model ID
+        :param model_name: str, name of the sent model
+        :param job_id: str, job of the upload, the rest of the model's stages are traced under it
+        :param api_key: str, API key the model was sent with, the cached upload is only reused for it
         """
         # if response is a string, it means there was an error
         if isinstance(response, str):
@@ -204,6 +230,9 @@ class AWAPITool:
             response_data = json.loads(response.text)
             model_id = response_data.get("model_id", None)
             GlobalValues.sendedModel_id = model_id
+            GlobalValues.sent_job_id = job_id
+            if fingerprint and model_id and api_key:
+                UploadCache.store(api_key, fingerprint, model_id, model_name)
             wm = bpy.context.window_manager
             wm.my_last_model= model_id
             
@@ -246,35 +275,41 @@ class AWAPITool:
         """
 
         api_key = APIKeyManager.get_api_key(bpy.types.RenderEngine)
-        print("Checking if model was processed")
+        log.debug("Checking if model was processed")
         if api_key and GlobalValues.sendedModel_id != "":
-            AWAPITool.start_check_model_processed(self, api_key, GlobalValues.sendedModel_id)
+            AWAPITool.start_check_model_processed(self, api_key, GlobalValues.sendedModel_id, GlobalValues.sent_job_id)
         return None
     
-    def start_check_model_processed(self, api_key, model_id):
+    def start_check_model_processed(self, api_key, model_id, job_id = ""):
         """
         Start a separate thread to check if the model has been processed.
+        :param job_id: str, job the polling, download and import are traced under, defaults to the model ID
         """
-        threading.Thread(target=self.loop_check_model_was_processed, args=(self, api_key, model_id)).start()
+        threading.Thread(target=self.loop_check_model_was_processed, args=(self, api_key, model_id, job_id)).start()
 
     
-    def loop_check_model_was_processed(self, api_key, model_id):
+    def loop_check_model_was_processed(self, api_key, model_id, job_id = ""):
         """
         Check if the model was processed by the API, with retries and exponential backoff.
         """
         url = self.RECEIVE_URL
         max_retries = 100  # Maximum number of retries
         retry_delay = 5  # Delay between retries in seconds
+        budget = RetryBudget()
+        job_id = job_id or model_id
+        Tracer.set_job(job_id)
         AW_PT_AAPanel.message_handler("Checking if model was processed.")
         AW_PT_AAPanel.loading = True
         for attempt in range(max_retries):
             try:
-                response = requests.get(url, params={'key': api_key, 'id': model_id}, timeout=10)
+                with Tracer.span("poll", "transfer", attempt=attempt) as span:
+                    response = TransferPolicy.request("GET", url, budget=budget, params={'key': api_key, 'id': model_id}, timeout=10)
+                    span.set(status=response.status_code)
                 if response.status_code == 200:
                     AW_PT_AAPanel.loading = False
                     AW_PT_AAPanel.message_handler("Great news! Your model is ready and has been processed successfully. 🎉")
                     threading.Thread(target=self.async_get_model, args=(
-                        self,APIKeyManager.api_key, GlobalValues.sendedModel_id)).start()
+                        self,APIKeyManager.api_key, model_id, job_id)).start()
                     break
                 elif response.status_code == 403 and "ongoing" in response.text:
                     AW_PT_AAPanel.message_handler(f"Your model is still cooking! 🕒 Attempt {attempt + 1} of {max_retries}. We'll keep trying!")
@@ -285,6 +320,7 @@ class AWAPITool:
                     break  # Stop retrying on incorrect format
                 elif response.status_code == 404:
                     AW_PT_AAPanel.loading = False
+                    UploadCache.forget_model(model_id)
                     AW_PT_AAPanel.message_handler("Hmm, we couldn't find your model. Could it be a mix-up in the ID? 🧐")
 
                     break  # Stop retrying on model not found
@@ -305,10 +341,13 @@ class AWAPITool:
 
                     AW_PT_AAPanel.message_handler("We ran into an unexpected issue. Please Contact out Team. Your patience is much appreciated! 🙏")
                     break  # Stop retrying on unexpected response
-                print(response.text)
-            except requests.RequestException:
+                log.debug("Poll response %s: %s", response.status_code, response.text, extra={"fields": {"attempt": attempt}})
+            except requests.RequestException as e:
+                # Transient errors were already retried by the transfer policy
                 AW_PT_AAPanel.loading = False
-                AW_PT_AAPanel.message_handler("We ran into an unexpected issue. Please Contact out Team. Your patience is much appreciated! 🙏")
+                AW_PT_AAPanel.message_handler("We couldn't reach the server, please check your connection and click download to try again. 🙏")
+                log.warning("Polling failed: %s", e)
+                break
                 
             # if the attempt is not the last one, wait before trying again   
             time.sleep(retry_delay)
@@ -321,22 +360,30 @@ class AWAPITool:
         return None  # Unregister the timer
 
 
-    def async_get_model(self, api_key, model_id):
+    def async_get_model(self, api_key, model_id, job_id = ""):
         """
         Asynchronously gets the model using the provided API key and model ID.
         :param api_key: The API key used to authenticate the request.
         :param model_id: The ID of the model to retrieve.
+        :param job_id: The job the download and import are traced under, a new one when empty.
         """
         AW_PT_AAPanel.message_handler("Getting model...")
-        response = AWAPITool.getModelProcessed(AWAPITool, api_key, model_id)
+        if job_id:
+            Tracer.set_job(job_id)
+        try:
+            response = AWAPITool.getModelProcessed(AWAPITool, api_key, model_id)
+        except requests.RequestException as e:
+            response = f"Request failed: {e}"
         bpy.app.timers.register(
-            lambda: AWAPITool.handle_received_response(AWAPITool, response))     
+            lambda: AWAPITool.handle_received_response(AWAPITool, response, model_id, job_id))     
         
 
-    def handle_received_response(self, response):
+    def handle_received_response(self, response, model_id = "", job_id = ""):
         """
         Handle the response after receiving a model from the API.
         :param response: Response from the API
+        :param model_id: str, ID of the model, the download is recorded in the asset manifest under it
+        :param job_id: str, job the download and import are traced under, defaults to the download workspace's
         """
         # if response is a string, it means there was an error
         if isinstance(response, str):
@@ -349,44 +396,27 @@ class AWAPITool:
             
             typeofthis = AATypeHanlder.parse_behaviour_type(response.json())
             
-            print("Type of this model: " + str(typeofthis))
+            log.info("Behaviour type: %s", typeofthis)
             
-            downloader = ModelDownloader(response.json())
-            importer = BlenderModelImporter()
+            # Every download gets its own directory, other jobs may still be importing from theirs
+            workspace = WorkspaceManager.create("download")
+            job_id = job_id or workspace.job_id
+            downloader = ModelDownloader(response.json(), workspace.path, job_id)
+            importer = BlenderModelImporter(workspace, job=ImportJob(job_id, model_id=model_id,
+                                                                     name=AWAPITool.model_name(response.json(), model_id)))
             
             if typeofthis == DefaultBehaviourType.WalkingAnimal or typeofthis == DefaultBehaviourType.FlyingAnimal or typeofthis == DefaultBehaviourType.SwimmingAnimal:
                 # Create an instance of the ModelDownloader and use it
                 #in animated models we need to download in thread due to quantity of files
-                threading.Thread(target=self.animated_routine, args=(self,importer,downloader,typeofthis)).start()
-            
-            elif typeofthis == DefaultBehaviourType.Static:
-                # Create an instance of the ModelDownloader and use it
-                AW_PT_AAPanel.message_handler("Downloading Static model...")
-                downloader.parse_and_download()
-                AW_PT_AAPanel.message_handler("Importing Static model...")
-                importer = BlenderModelImporter()
-                importer.import_models("preprocessed_model",typeofthis)
-                AW_PT_AAPanel.message_handler("Static model imported successfully")
-                
-            elif typeofthis == DefaultBehaviourType.WheeledVehicle:
-                # Create an instance of the ModelDownloader and use it
-                AW_PT_AAPanel.message_handler("Downloading WheeledVehicle...")
-                downloader.parse_and_download()
-                AW_PT_AAPanel.message_handler("Importing WheeledVehicle...")
-                importer.import_models("parts",typeofthis)
-                AW_PT_AAPanel.message_handler("WheeledVehicle imported successfully")
+                # Each clip is imported on the main thread as soon as it is downloaded
+                importer.start_pipeline("animations", functools.partial(AWAPITool.report_animated_import, typeofthis=typeofthis))
+                threading.Thread(target=self.animated_routine, args=(self,importer,downloader,typeofthis,model_id)).start()
             
             else:
-                #dont know what to, better download all
-                AW_PT_AAPanel.message_handler("Downloading model...")
-                downloader.parse_and_download()
-                AW_PT_AAPanel.message_handler("Importing model...")
-                importer.import_models("preprocessed_model",typeofthis)
-                importer.import_models("parts",typeofthis)
-                importer.import_models("animations",typeofthis)
-                importer.import_models("shader",typeofthis)
-                importer.import_models("rig",typeofthis)
-                AW_PT_AAPanel.message_handler("Model imported successfully")
+                # Download in a thread as well, only the import runs on the main thread
+                folders, label = AWAPITool.import_folders(typeofthis)
+                threading.Thread(target=self.download_routine, args=(self,importer,downloader,typeofthis,
+                                 folders, label, model_id)).start()
             
 
         else:
@@ -394,15 +424,153 @@ class AWAPITool:
             
         return None  # Unregister the timer
     
-    def animated_routine(self,importer,downloader,typeofthis):
+    @staticmethod
+    def download_all(downloader, callback=None, model_id=""):
+        """
+        Download every file of a processed model, transient errors are retried by the transfer policy.
+        The workspace is not released on failure, queued clips may still be importing from it.
+        :param downloader: The downloader of the model.
+        :param callback: Called with (folder, path) after each file, see ModelDownloader.parse_and_download.
+        :param model_id: The ID of the model, the files are recorded in the asset manifest under it.
+        :return: True if all the files were downloaded.
+        :rtype: bool
+        """
+        try:
+            downloader.parse_and_download(callback)
+        except (requests.RequestException, IntegrityError) as e:
+            log.error("Download failed: %s", e)
+            AW_PT_AAPanel.message_handler("Download failed, please check your connection and click download to try again. 🙏")
+            return False
+        if model_id:
+            AssetManifest.record(model_id, downloader)
+        return True
+
+    def animated_routine(self,importer,downloader,typeofthis,model_id=""):
         """
-        Routine to animate the model.
-        :param context: The context in which the operator is executed.
+        Routine to animate the model. Runs on a download thread, handing every clip to the
+        import pipeline of the importer as soon as it is verified (see start_pipeline).
         :return: A dictionary indicating the status of the execution.
         """
         AW_PT_AAPanel.message_handler("Downloading Animal...")
-        downloader.parse_and_download()
-        AW_PT_AAPanel.message_handler("Importing Animal...")
-        importer.import_models("animations",typeofthis)
-        AW_PT_AAPanel.message_handler("Animation imported successfully")
-        return {'FINISHED'}
\ No newline at end of file
+        ok = False
+        try:
+            ok = AWAPITool.download_all(downloader, importer.queue_file, model_id)
+        finally:
+            # The end of the queue releases the workspace, once the queued clips are imported
+            importer.finish_pipeline(ok)
+        return {'FINISHED'} if ok else {'CANCELLED'}
+
+    def download_routine(self, importer, downloader, typeofthis, folders, label, model_id=""):
+        """
+        Download a model on this worker thread, then import it with a timer on the main thread.
+        :param folders: The folders of the workspace to import, in order.
+        :type folders: tuple
+        :param label: The kind of model shown in the messages, e.g. "Static model".
+        :type label: str
+        :param model_id: The ID of the model, recorded in the asset manifest.
+        :return: A dictionary indicating the status of the execution.
+        """
+        AW_PT_AAPanel.message_handler(f"Downloading {label}...")
+        if not AWAPITool.download_all(downloader, model_id=model_id):
+            importer.release_workspace()
+            return {'CANCELLED'}
+        bpy.app.timers.register(functools.partial(AWAPITool.import_downloaded, importer, typeofthis, folders, label))
+        return {'FINISHED'}
+
+    @staticmethod
+    def import_downloaded(importer, typeofthis, folders, label):
+        """
+        Timer importing a downloaded model. Main thread only.
+        :return: None to run once.
+        """
+        AW_PT_AAPanel.message_handler(f"Importing {label}...")
+        try:
+            for folder in folders:
+                # The fallback imports every folder, most results only have some of them
+                if os.path.isdir(os.path.join(importer.base_dir, folder)):
+                    importer.import_models(folder, typeofthis)
+        except Exception as e:
+            # An exception would leave the panel on "Importing" without telling the user
+            log.exception("Import of the %s failed", label)
+            AW_PT_AAPanel.message_handler(f"Import failed: {e}")
+            return None
+        finally:
+            importer.release_workspace()
+        AW_PT_AAPanel.message_handler(f"{label[:1].upper()}{label[1:]} imported successfully")
+        AWAPITool.add_to_library(importer, typeofthis)
+        return None
+
+    @staticmethod
+    def import_folders(typeofthis):
+        """
+        Get what to import for a model that is not animated.
+        :param typeofthis: The behaviour type of the model.
+        :type typeofthis: DefaultBehaviourType
+        :return: The folders of the workspace to import and the kind of model shown in the messages.
+        :rtype: tuple
+        """
+        if typeofthis == DefaultBehaviourType.Static:
+            return ("preprocessed_model",), "Static model"
+        if typeofthis == DefaultBehaviourType.WheeledVehicle:
+            return ("parts",), "WheeledVehicle"
+        #dont know what to, better import all
+        return AWAPITool.ALL_FOLDERS, "model"
+
+    @staticmethod
+    def import_local(entry):
+        """
+        Import a download recorded in the asset manifest again, without calling the API. Main thread only.
+        :param entry: The download.
+        :type entry: ManifestEntry
+        """
+        typeofthis = AATypeHanlder.parse_behaviour_type(entry.data)
+        importer = BlenderModelImporter(AssetManifest.workspace(entry))
+        if typeofthis in (DefaultBehaviourType.WalkingAnimal, DefaultBehaviourType.FlyingAnimal, DefaultBehaviourType.SwimmingAnimal):
+            AW_PT_AAPanel.message_handler("Importing Animal...")
+            importer.import_models("animations", typeofthis)
+        else:
+            folders, label = AWAPITool.import_folders(typeofthis)
+            AWAPITool.import_downloaded(importer, typeofthis, folders, label)
+
+    @staticmethod
+    def model_name(data, model_id=""):
+        """
+        :param data: The processed model JSON.
+        :param model_id: Returned when the result has no name.
+        :return: The name of the model.
+        :rtype: str
+        """
+        if isinstance(data, list) and data and isinstance(data[0], dict) and data[0].get("name"):
+            return str(data[0]["name"])
+        return model_id
+
+    @staticmethod
+    def add_to_library(importer, typeofthis):
+        """
+        Add an imported result to the asset library if the scene asks for it. Main thread only.
+        :param importer: The importer of the result.
+        :param typeofthis: The behaviour type of the model.
+        """
+        if not getattr(bpy.context.scene, "add_to_asset_library", False):
+            return
+        try:
+            AssetLibrary.add(importer.imported_objects, importer.job.name or importer.job.job_id,
+                             typeofthis.name, importer.job.model_id)
+        except (OSError, RuntimeError) as e:
+            log.warning("Could not add the model to the asset library: %s", e)
+            AW_PT_AAPanel.message_handler("Could not add the model to the asset library: " + str(e))
+
+    @staticmethod
+    def report_animated_import(importer, imported, ok, typeofthis=DefaultBehaviourType.WalkingAnimal):
+        """
+        Report the end of a pipelined animated import. Main thread only.
+        :param importer: The importer of the model.
+        :param imported: The number of clips imported.
+        :param ok: False if some files could not be downloaded.
+        :param typeofthis: The behaviour type of the model.
+        """
+        if ok:
+            AW_PT_AAPanel.message_handler("Animation imported successfully")
+            AWAPITool.add_to_library(importer, typeofthis)
+        else:
+            AW_PT_AAPanel.message_handler(f"Download failed after importing {imported} animations, please check your connection and click download to try again. 🙏")
\ No newline at end of file
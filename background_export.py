@@ -0,0 +1,219 @@
+import json
+import os
+import subprocess
+import threading
+import time
+import bpy
+
+from .aa_panel import AW_PT_AAPanel
+from .aw_api_tool import AWAPITool
+from .tracing import Tracer
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class SubprocessResponse:
+    """
+    The upload response reported by the export subprocess, with the parts of
+    requests.Response that AWAPITool.handle_sended_response uses.
+    """
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class BackgroundExport:
+    """
+    Exports and uploads the selection in a headless Blender so the UI stays responsive.
+
+    The selected objects and everything they use are written to a .blend in the job workspace
+    with bpy.data.libraries.write, which is fast as it does not evaluate modifiers. A
+    "blender -b" subprocess opens it, exports the GLB and uploads it, reporting its progress
+    on stdout. A timer on the main thread shows the progress in the panel and hands the
+    upload response to AWAPITool once the subprocess ends.
+
+    Attributes:
+        workspace (JobWorkspace): The workspace of the upload.
+        model_name (str): The name of the exported file.
+        fingerprint (str): The fingerprint of the selection, stored with the returned model ID.
+        stage (str): The current stage reported by the subprocess.
+        progress (float): Progress between 0 and 1.
+        response (SubprocessResponse): The upload response, None until the upload finished.
+        error (str): Why the export failed, empty if it did not.
+    """
+    PROGRESS_PREFIX = "AA_PROGRESS "
+    RESULT_PREFIX = "AA_RESULT "
+    WORKER_SCRIPT = "export_worker.py"
+    POLL_SECONDS = 0.5
+    # Lines of the subprocess output kept to report failures
+    LOG_LINES = 40
+
+    jobs = []
+
+    def __init__(self, workspace, model_name, fingerprint=None):
+        self.workspace = workspace
+        self.fingerprint = fingerprint
+        self.api_key = ""
+        self.model_name = model_name
+        self.blend_path = workspace.join(model_name + "_export.blend")
+        self.process = None
+        self.stage = "queued"
+        self.progress = 0.0
+        self.response = None
+        self.error = ""
+        self.log = []
+        self.started = time.perf_counter_ns()
+        self.reader = None
+
+    @staticmethod
+    def collect_objects(roots):
+        """
+        Get the objects to export, the roots and all their children.
+        :type roots: list
+        :rtype: set
+        """
+        objects = set()
+        stack = list(roots)
+        while stack:
+            obj = stack.pop()
+            if obj not in objects:
+                objects.add(obj)
+                stack.extend(obj.children)
+        return objects
+
+    def write_blend(self, roots):
+        """
+        Write the objects to export to the workspace. Main thread only.
+        :param roots: The selected objects.
+        :type roots: list
+        """
+        objects = BackgroundExport.collect_objects(roots)
+        with Tracer.span("write blend", job_id=self.workspace.job_id, objects=len(objects)):
+            # Absolute paths so the subprocess finds the textures of the original file
+            bpy.data.libraries.write(self.blend_path, objects, path_remap='ABSOLUTE', fake_user=True)
+
+    def start(self, roots, api_key, upload_args):
+        """
+        Write the selection and start the subprocess. Main thread only.
+        :param roots: The selected objects.
+        :type roots: list
+        :param api_key: The API key, passed in the environment so it does not show in the process list.
+        :type api_key: str
+        :param upload_args: The fields of the upload (server_name, symmetry, model_type, improvements, author).
+        :type upload_args: dict
+        """
+        self.write_blend(roots)
+        self.api_key = api_key
+        self.root_names = [root.name for root in roots]
+        worker = os.path.join(os.path.dirname(os.path.abspath(__file__)), BackgroundExport.WORKER_SCRIPT)
+        command = [bpy.app.binary_path, "-b", "--factory-startup", self.blend_path, "--python", worker, "--",
+                   "--workspace", self.workspace.path, "--name", self.model_name,
+                   "--roots", json.dumps(self.root_names), "--upload", json.dumps(upload_args)]
+        if getattr(bpy.app, "online_access", True):
+            command.insert(2, "--online-mode")
+        environment = dict(os.environ, AA_API_KEY=api_key)
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        stdin=subprocess.DEVNULL, env=environment, text=True, bufsize=1)
+        self.stage = "starting"
+        self.reader = threading.Thread(target=self.read_output, daemon=True)
+        self.reader.start()
+        BackgroundExport.jobs.append(self)
+        if not bpy.app.timers.is_registered(BackgroundExport.poll):
+            bpy.app.timers.register(BackgroundExport.poll, first_interval=BackgroundExport.POLL_SECONDS)
+
+    def read_output(self):
+        """
+        Parse the progress and the result printed by the subprocess. Runs on its own thread.
+        """
+        for line in self.process.stdout:
+            line = line.rstrip()
+            if line.startswith(BackgroundExport.PROGRESS_PREFIX):
+                try:
+                    update = json.loads(line[len(BackgroundExport.PROGRESS_PREFIX):])
+                except ValueError:
+                    continue
+                self.stage = update.get("stage", self.stage)
+                self.progress = float(update.get("progress", self.progress))
+            elif line.startswith(BackgroundExport.RESULT_PREFIX):
+                try:
+                    result = json.loads(line[len(BackgroundExport.RESULT_PREFIX):])
+                except ValueError:
+                    continue
+                if "error" in result:
+                    self.error = result["error"]
+                else:
+                    self.response = SubprocessResponse(result.get("status_code", 0), result.get("text", ""))
+            else:
+                self.log = (self.log + [line])[-BackgroundExport.LOG_LINES:]
+        self.process.wait()
+
+    @property
+    def finished(self):
+        return self.process is not None and self.process.poll() is not None and not self.reader.is_alive()
+
+    def finish(self):
+        """
+        Report the outcome of a finished subprocess. Main thread only.
+        """
+        Tracer.record("background export", "stage", self.started, time.perf_counter_ns() - self.started,
+                      self.workspace.job_id, {"model": self.model_name, "exit_code": self.process.returncode})
+        self.workspace.release()
+        if self.response is not None:
+            AWAPITool.handle_sended_response(AWAPITool, self.response, self.fingerprint, self.model_name,
+                                             self.workspace.job_id, self.api_key)
+            return
+        if not self.error:
+            self.error = f"The export process exited with code {self.process.returncode}"
+        log.error("Background export failed: %s\n%s", self.error, "\n".join(self.log))
+        AW_PT_AAPanel.message_handler("Background export failed: " + self.error)
+
+    @staticmethod
+    def poll():
+        """
+        Timer following the running subprocesses.
+        :return: Seconds until the next call, None when nothing is running.
+        """
+        for job in list(BackgroundExport.jobs):
+            if job.finished:
+                BackgroundExport.jobs.remove(job)
+                job.finish()
+        if not BackgroundExport.jobs:
+            return None
+        job = BackgroundExport.jobs[0]
+        status = f"Exporting {job.model_name} in the background: {job.stage} ({job.progress * 100:.0f}%)"
+        if AW_PT_AAPanel.loading_status != status:
+            AW_PT_AAPanel.message_handler(status)
+        return BackgroundExport.POLL_SECONDS
+
+    @staticmethod
+    def cancel_all():
+        """
+        Stop the running subprocesses, e.g. when the add-on is disabled.
+        """
+        for job in BackgroundExport.jobs:
+            if job.process is not None and job.process.poll() is None:
+                job.process.terminate()
+            job.workspace.release()
+        BackgroundExport.jobs.clear()
+        if bpy.app.timers.is_registered(BackgroundExport.poll):
+            bpy.app.timers.unregister(BackgroundExport.poll)
+
+    @staticmethod
+    def report(stage, progress):
+        """
+        Print a progress update, called in the subprocess.
+        """
+        print(BackgroundExport.PROGRESS_PREFIX + json.dumps({"stage": stage, "progress": progress}), flush=True)
+
+    @staticmethod
+    def report_result(result):
+        """
+        Print the result of the upload, called in the subprocess.
+        :type result: dict
+        """
+        print(BackgroundExport.RESULT_PREFIX + json.dumps(result), flush=True)
@@ -0,0 +1,392 @@
+"""
+Headless batch processing of a whole model library, for render-farm nodes.
+
+Usage:
+    blender -b --online-mode --python batch_cli.py -- --input <folder or manifest.json> --output <folder>
+
+Each source model is exported on the main thread, then uploaded, polled and downloaded on
+worker threads while the next model is being exported. Finished results are imported on
+the main thread and saved as one .blend per model, with a summary.json holding the status
+and the per-stage timings of every job.
+
+A manifest is a JSON list (or {"models": [...]}) of entries such as:
+    {"path": "dog.fbx", "name": "dog", "type": "dog", "author": "Studio", "symmetry": true}
+Relative paths are resolved against the manifest folder.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import bpy
+
+if __package__:
+    from .aa_panel import AW_PT_AAPanel
+    from .aa_type_handler import AATypeHanlder, DefaultBehaviourType
+    from .api_key_manager import APIKeyManager
+    from .asset_manifest import AssetManifest
+    from .aw_api_tool import AWAPITool
+    from .blender_model_importer import BlenderModelImporter
+    from .bounds import BoundsService
+    from .exporter import Exporter
+    from .global_values import GlobalValues
+    from .import_job import ImportJob
+    from .model_downloader import ModelDownloader
+    from .preflight import Preflight
+    from .tracing import Tracer
+    from .transfer_policy import RetryBudget
+    from .aa_logging import get_logger
+
+    log = get_logger(__name__)
+    from .workspace import WorkspaceManager
+
+
+SOURCE_EXTENSIONS = ('.glb', '.gltf', '.fbx', '.obj', '.blend')
+
+
+class BatchJob:
+    """
+    One source model going through the batch pipeline.
+
+    Attributes:
+        source (str): Path of the source model.
+        name (str): Name used for the upload and the output file.
+        model_type (str): The type of the model sent to the service (e.g. dog).
+        author (str): The author of the model.
+        symmetry (bool): True if the model is symmetric.
+        status (str): "pending", "done" or "failed".
+        error (str): The reason the job failed.
+        model_id (str): The ID returned by the service.
+        timings (dict): Stage name -> seconds.
+        retry_budget (RetryBudget): Retries the job may spend on its requests.
+    """
+
+    def __init__(self, source, name, model_type, author, symmetry):
+        self.source = source
+        self.name = name
+        self.model_type = model_type
+        self.author = author
+        self.symmetry = symmetry
+        self.status = "pending"
+        self.error = ""
+        self.model_id = ""
+        self.timings = {}
+        self.size = None
+        self.data = None
+        self.workspace = None
+        self.output = ""
+        self.retry_budget = RetryBudget()
+
+    def fail(self, error):
+        """
+        Mark the job as failed.
+        :param error: The reason.
+        :type error: str
+        """
+        self.status = "failed"
+        self.error = error
+        if self.workspace is not None:
+            self.workspace.release()
+        log.error("[%s] failed: %s", self.name, error)
+
+    def to_dict(self):
+        """
+        Build the summary entry of the job.
+        :rtype: dict
+        """
+        return {
+            "name": self.name,
+            "source": self.source,
+            "status": self.status,
+            "error": self.error,
+            "model_id": self.model_id,
+            "output": self.output,
+            "timings": {stage: round(seconds, 4) for stage, seconds in self.timings.items()},
+        }
+
+
+class Stage:
+    """
+    Context manager recording the duration of a pipeline stage on a job, also as a trace span.
+    """
+
+    def __init__(self, job, name):
+        self.job = job
+        self.name = name
+        self.start = 0.0
+        self.span = Tracer.span(name, job_id=job.name)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.span.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.span.__exit__(exc_type, exc_value, traceback)
+        self.job.timings[self.name] = time.perf_counter() - self.start
+        return False
+
+
+def parse_args(argv):
+    """
+    Parse the arguments given after "--" on the Blender command line.
+    :param argv: The full sys.argv.
+    :type argv: list
+    :rtype: argparse.Namespace
+    """
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    parser = argparse.ArgumentParser(prog="blender -b --python batch_cli.py --", description="Animate Anything batch processing")
+    parser.add_argument("--input", required=True, help="Folder of source models or a JSON manifest")
+    parser.add_argument("--output", required=True, help="Folder for the .blend results and summary.json")
+    parser.add_argument("--api-key", default=os.environ.get("AA_API_KEY", ""), help="API key, defaults to $AA_API_KEY or the saved key")
+    parser.add_argument("--type", default="", help="Model type for sources without one, defaults to the file name")
+    parser.add_argument("--author", default=os.environ.get("USER", "batch"), help="Author for sources without one")
+    parser.add_argument("--workers", type=int, default=4, help="Number of jobs uploading/downloading at once")
+    parser.add_argument("--vertex-budget", type=int, default=100000, help="Maximum number of vertices per model")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds between processing checks")
+    parser.add_argument("--poll-timeout", type=float, default=3600.0, help="Seconds to wait for a model to be processed")
+    parser.add_argument("--trace", default="", help="Write a Chrome trace JSON of every stage and transfer to this file")
+    return parser.parse_args(argv)
+
+
+def collect_jobs(args):
+    """
+    Build the jobs from a folder of models or a manifest.
+    :rtype: list
+    """
+    jobs = []
+    if os.path.isdir(args.input):
+        for filename in sorted(os.listdir(args.input)):
+            if filename.lower().endswith(SOURCE_EXTENSIONS):
+                name = os.path.splitext(filename)[0]
+                jobs.append(BatchJob(os.path.join(args.input, filename), name, args.type or name, args.author, False))
+        return jobs
+
+    with open(args.input, 'r', encoding='utf-8') as file:
+        manifest = json.load(file)
+    if isinstance(manifest, dict):
+        manifest = manifest.get("models", [])
+    base = os.path.dirname(os.path.abspath(args.input))
+    for entry in manifest:
+        source = os.path.join(base, entry["path"])
+        name = entry.get("name") or os.path.splitext(os.path.basename(source))[0]
+        jobs.append(BatchJob(source, name, entry.get("type") or args.type or name,
+                             entry.get("author") or args.author, bool(entry.get("symmetry", False))))
+    return jobs
+
+
+def reset_scene():
+    """
+    Remove every object and the data they used, so the next job starts from an empty scene.
+    """
+    scene = bpy.context.scene
+    for collection in list(scene.collection.children):
+        scene.collection.children.unlink(collection)
+    bpy.data.batch_remove(list(bpy.data.objects))
+    for datablocks in (bpy.data.collections, bpy.data.meshes, bpy.data.armatures, bpy.data.materials,
+                       bpy.data.images, bpy.data.actions, bpy.data.textures, bpy.data.curves):
+        bpy.data.batch_remove([datablock for datablock in datablocks if datablock.users == 0])
+    # Object names are reused by the next job
+    BoundsService.clear()
+
+
+def import_source(path):
+    """
+    Import a source model into the current scene.
+    :param path: The source file.
+    :type path: str
+    :return: The root objects of the imported model.
+    :rtype: list
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.glb', '.gltf'):
+        bpy.ops.import_scene.gltf(filepath=path)
+    elif extension == '.fbx':
+        bpy.ops.import_scene.fbx(filepath=path)
+    elif extension == '.obj':
+        bpy.ops.wm.obj_import(filepath=path)
+    elif extension == '.blend':
+        with bpy.data.libraries.load(path) as (data_from, data_to):
+            data_to.objects = data_from.objects
+        for obj in data_to.objects:
+            if obj is not None:
+                bpy.context.scene.collection.objects.link(obj)
+    else:
+        raise ValueError("Unsupported model format: {}".format(path))
+    return [obj for obj in bpy.context.scene.objects if obj.parent is None]
+
+
+def export_job(job, args):
+    """
+    Import the source of a job and export it for upload. Main thread only.
+    :return: True if the job can be uploaded.
+    :rtype: bool
+    """
+    try:
+        with Stage(job, "load"):
+            reset_scene()
+            roots = import_source(job.source)
+        with Stage(job, "preflight"):
+            report = Preflight().analyse(roots, vertex_budget=args.vertex_budget)
+        if not report.passed:
+            job.fail(" ".join(report.errors))
+            return False
+        with Stage(job, "export"):
+            bpy.ops.object.select_all(action='DESELECT')
+            for root in roots:
+                root.select_set(True)
+            bpy.context.view_layer.objects.active = roots[0]
+            job.workspace = WorkspaceManager.create("batch")
+            if not Exporter().export_selected_object_and_children(job.workspace.path, job.name):
+                job.fail("Export failed")
+                return False
+            job.size = GlobalValues.sent_model_size.copy()
+    except Exception as e:
+        job.fail(f"Could not prepare {job.source}: {e}")
+        return False
+    return True
+
+
+def process_remote(job, api_key, args):
+    """
+    Upload a job, wait until it is processed and download the result. Runs on a worker thread.
+    :return: The job.
+    :rtype: BatchJob
+    """
+    Tracer.set_job(job.name)
+    try:
+        with Stage(job, "upload"):
+            response = AWAPITool.send_model_to_api(AWAPITool, api_key, job.workspace.path, job.name, job.name,
+                                                   job.symmetry, job.model_type, False, job.author,
+                                                   budget=job.retry_budget)
+        if isinstance(response, str):
+            job.fail(response)
+            return job
+        if response.status_code != 200:
+            job.fail(f"Upload failed ({response.status_code}): {response.text}")
+            return job
+        job.model_id = response.json().get("model_id", "")
+        log.info("[%s] uploaded as %s", job.name, job.model_id)
+
+        with Stage(job, "poll"):
+            deadline = time.monotonic() + args.poll_timeout
+            while True:
+                response = AWAPITool.getModelProcessed(AWAPITool, api_key, job.model_id, budget=job.retry_budget)
+                if response.status_code == 200:
+                    job.data = response.json()
+                    break
+                if response.status_code != 403 or "ongoing" not in response.text:
+                    job.fail(f"Processing failed ({response.status_code}): {response.text}")
+                    return job
+                if time.monotonic() > deadline:
+                    job.fail("Timed out waiting for the model to be processed")
+                    return job
+                time.sleep(args.poll_interval)
+
+        with Stage(job, "download"):
+            downloader = ModelDownloader(job.data, job.workspace.path, job.name, job.retry_budget)
+            downloader.parse_and_download()
+            AssetManifest.record(job.model_id, downloader)
+    except Exception as e:
+        job.fail(f"Transfer failed: {e}")
+    return job
+
+
+def import_result(job):
+    """
+    Import the downloaded result of a job into an empty scene. Main thread only.
+    """
+    reset_scene()
+    behaviour = AATypeHanlder.parse_behaviour_type(job.data)
+    importer = BlenderModelImporter(job.workspace, blocking=True, job=ImportJob(job.name, job.size))
+    if behaviour in (DefaultBehaviourType.WalkingAnimal, DefaultBehaviourType.FlyingAnimal, DefaultBehaviourType.SwimmingAnimal):
+        importer.import_models("animations", behaviour)
+    elif behaviour == DefaultBehaviourType.WheeledVehicle:
+        importer.import_models("parts", behaviour)
+    else:
+        importer.import_models("preprocessed_model", behaviour)
+
+
+def import_job(job, args):
+    """
+    Import the downloaded result of a job and save it as a .blend file. Main thread only.
+    """
+    if job.status == "failed":
+        return
+    try:
+        with Stage(job, "import"):
+            import_result(job)
+        with Stage(job, "save"):
+            job.output = os.path.join(os.path.abspath(args.output), job.name + ".blend")
+            bpy.ops.wm.save_as_mainfile(filepath=job.output, copy=True)
+        job.status = "done"
+        log.info("[%s] saved %s", job.name, job.output)
+    except Exception as e:
+        job.fail(f"Import failed: {e}")
+    finally:
+        job.workspace.release()
+
+
+def main(argv):
+    """
+    Run the batch pipeline.
+    :param argv: The full sys.argv.
+    :type argv: list
+    :return: The process exit code, 0 if every job succeeded.
+    :rtype: int
+    """
+    args = parse_args(argv)
+    # Respect Blender's "Allow Online Access", pass --online-mode to Blender
+    if not getattr(bpy.app, "online_access", True):
+        log.error("Online access is disabled, run Blender with --online-mode")
+        return 2
+
+    api_key = args.api_key or APIKeyManager.read_key_from_file(APIKeyManager)
+    if api_key == "":
+        log.error("Missing API Key, use --api-key or $AA_API_KEY")
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+    AW_PT_AAPanel.headless = True
+    # The downloads are recorded on the pool threads, resolve the manifest folder here
+    AssetManifest.register()
+
+    jobs = collect_jobs(args)
+    log.info("Processing %d models with %d workers", len(jobs), args.workers)
+    start = time.perf_counter()
+    pending = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for job in jobs:
+            if export_job(job, args):
+                pending.append(pool.submit(process_remote, job, api_key, args))
+            # Import what finished while this model was exported
+            for future in [future for future in pending if future.done()]:
+                pending.remove(future)
+                import_job(future.result(), args)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                import_job(future.result(), args)
+
+    summary = {
+        "total_seconds": round(time.perf_counter() - start, 3),
+        "succeeded": sum(1 for job in jobs if job.status == "done"),
+        "failed": sum(1 for job in jobs if job.status != "done"),
+        "jobs": [job.to_dict() for job in jobs],
+    }
+    with open(os.path.join(args.output, "summary.json"), 'w', encoding='utf-8') as file:
+        json.dump(summary, file, indent=2)
+    if args.trace:
+        log.info("Wrote %d spans to %s", Tracer.export_chrome_trace(args.trace), args.trace)
+    log.info("Done: %d succeeded, %d failed in %s s", summary['succeeded'], summary['failed'], summary['total_seconds'])
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    # Run by Blender as a script: load the add-on as a package so its relative imports work
+    import importlib
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(addon_dir))
+    batch = importlib.import_module(os.path.basename(addon_dir) + ".batch_cli")
+    sys.exit(batch.main(sys.argv))
@@ -0,0 +1,144 @@
+"""
+Micro-benchmarks of the pure-Python hot paths, runnable in plain CPython (no Blender needed).
+
+Covers form encoding of the upload, the processed-model JSON walk, URL filtering and cleaning,
+behaviour type parsing and panel text wrapping, on large realistic fixtures.
+
+Usage:
+    python benchmarks/bench_hot_paths.py
+    python benchmarks/bench_hot_paths.py --save baseline.json
+    python benchmarks/bench_hot_paths.py --compare baseline.json --tolerance 1.25
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bpy_stubs
+import fixtures
+
+bpy_stubs.install()
+AWAPITool = bpy_stubs.load_module("aw_api_tool").AWAPITool
+ModelDownloader = bpy_stubs.load_module("model_downloader").ModelDownloader
+AATypeHanlder = bpy_stubs.load_module("aa_type_handler").AATypeHanlder
+AW_PT_AAPanel = bpy_stubs.load_module("aa_panel").AW_PT_AAPanel
+
+EXTENSIONS = ('.glb', '.obj', '.mtl', '.png', '.jpg', '.jpeg')
+
+
+def measure(function, repeat, min_time):
+    """
+    Time a function, calibrating the number of calls per round to run for at least min_time.
+    :return: (best, median) seconds per call.
+    :rtype: tuple
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    rounds = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        rounds.append((time.perf_counter() - start) / number)
+    return min(rounds), statistics.median(rounds)
+
+
+def build_cases(workdir, scale):
+    """
+    Build the fixtures and the benchmark cases.
+    :param workdir: Directory for fixture files.
+    :type workdir: str
+    :param scale: Multiplier of the fixture sizes.
+    :type scale: float
+    :return: A list of (name, function) pairs.
+    :rtype: list
+    """
+    base_url = "https://cdn.anything.world/files"
+    data = fixtures.large_processed_model_json(base_url, "0123456789abcdef",
+                                               clips=int(400 * scale), parts=int(60 * scale), textures=int(80 * scale))
+    text = json.dumps(data)
+    batch = data * 50
+    downloader = ModelDownloader(data, workdir)
+    files = [url for extension in EXTENSIONS for url in downloader.find_generic_files(data, extension)]
+
+    glb_path = os.path.join(workdir, "upload.glb")
+    with open(glb_path, 'wb') as file:
+        file.write(fixtures.build_glb("upload", grid=int(512 * scale ** 0.5), animated=False))
+    upload_files = AWAPITool().read_files(glb_path)
+    form = {'key': 'x' * 32, 'model_name': 'dog', 'model_type': 'dog', 'symmetry': False,
+            'can_use_for_internal_improvements': False, 'author': 'benchmark', 'platform': 'blender'}
+
+    message = ("Your model is still cooking! Attempt 12 of 100. We'll keep trying! " * 20).strip()
+
+    def walk_all_extensions():
+        for extension in EXTENSIONS:
+            downloader.find_generic_urls(downloader.find_generic_files(data, extension), extension)
+
+    return [
+        ("json.loads processed model", lambda: json.loads(text)),
+        ("find_generic_files .glb", lambda: downloader.find_generic_files(data, '.glb')),
+        ("find_generic_files+urls all extensions", walk_all_extensions),
+        ("find_generic_urls", lambda: downloader.find_generic_urls(files, '.glb')),
+        ("get_clean_filename_from_url", lambda: [downloader.get_clean_filename_from_url(url) for url in files]),
+        ("parse_behaviour_type x50 items", lambda: AATypeHanlder.parse_behaviour_type(batch)),
+        ("create_form_data upload GLB", lambda: AWAPITool().create_form_data(upload_files, form)),
+        ("wrap_text long status", lambda: AW_PT_AAPanel.wrap_text(None, message, 50)),
+    ]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Animate Anything pure-Python micro-benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="Rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per round")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier of the fixture sizes")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--save", default="", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", default="", help="Compare the medians with a saved JSON file")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="Allowed slowdown ratio when comparing")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)["results"]
+
+    results = {}
+    regressions = []
+    with tempfile.TemporaryDirectory(prefix="aa_bench_") as workdir:
+        for name, function in build_cases(workdir, args.scale):
+            if args.filter and args.filter not in name:
+                continue
+            best, median = measure(function, args.repeat, args.min_time)
+            results[name] = {"best": best, "median": median}
+            line = f"{name:<42} best {best * 1e3:10.3f} ms   median {median * 1e3:10.3f} ms"
+            if name in baseline:
+                ratio = median / baseline[name]["median"]
+                line += f"   x{ratio:.2f}"
+                if ratio > args.tolerance:
+                    regressions.append(name)
+                    line += "  REGRESSION"
+            print(line)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump({"python": sys.version.split()[0], "scale": args.scale, "results": results}, file, indent=2)
+    if regressions:
+        print(f"{len(regressions)} benchmarks slower than x{args.tolerance}: " + ", ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
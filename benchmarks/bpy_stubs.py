@@ -0,0 +1,205 @@
+"""
+Minimal stand-ins for the bpy and mathutils modules, so the pure-Python parts of the add-on
+(JSON parsing, URL handling, form encoding, text wrapping) can be imported, profiled and
+regression-tested in plain CPython.
+
+Only what the add-on touches at import time is provided. Anything else in bpy.types, bpy.ops
+or bpy.data resolves to an inert placeholder; calling Blender functionality through the stubs
+is not supported.
+"""
+import importlib
+import math
+import os
+import sys
+import tempfile
+import types
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "animate_anything"
+
+
+class Placeholder:
+    """
+    Inert object accepting any attribute access, call or iteration.
+    """
+
+    def __init__(self, name="placeholder"):
+        self._name = name
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return Placeholder(f"{self._name}.{name}")
+
+    def __call__(self, *args, **kwargs):
+        return Placeholder(f"{self._name}()")
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return f"<stub {self._name}>"
+
+
+class StubType:
+    """
+    Base class for every bpy.types class (Operator, Panel, AddonPreferences...).
+    """
+    bl_rna = Placeholder("bl_rna")
+
+    def report(self, level, message):
+        print(f"{next(iter(level), 'INFO')}: {message}")
+
+
+class Vector:
+    """
+    Small subset of mathutils.Vector.
+    """
+
+    def __init__(self, values=(0.0, 0.0, 0.0)):
+        self._values = [float(value) for value in values]
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def __setitem__(self, index, value):
+        self._values[index] = float(value)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return "Vector(({}))".format(", ".join(f"{value:.4f}" for value in self._values))
+
+    def __add__(self, other):
+        return Vector(a + b for a, b in zip(self, other))
+
+    def __sub__(self, other):
+        return Vector(a - b for a, b in zip(self, other))
+
+    def __mul__(self, scalar):
+        return Vector(value * scalar for value in self)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, scalar):
+        return Vector(value / scalar for value in self)
+
+    @property
+    def length(self):
+        return math.sqrt(sum(value * value for value in self._values))
+
+    def copy(self):
+        return Vector(self._values)
+
+    def _axis(index):
+        return property(lambda self: self._values[index], lambda self, value: self.__setitem__(index, value))
+
+    x = _axis(0)
+    y = _axis(1)
+    z = _axis(2)
+    del _axis
+
+
+class KDTree:
+    """
+    Brute force stand-in for mathutils.kdtree.KDTree.
+    """
+
+    def __init__(self, size):
+        self._points = []
+
+    def insert(self, co, index):
+        self._points.append((tuple(co), index))
+
+    def balance(self):
+        pass
+
+    def find(self, co):
+        best = min(self._points, key=lambda point: sum((a - b) ** 2 for a, b in zip(point[0], co)))
+        return Vector(best[0]), best[1], math.sqrt(sum((a - b) ** 2 for a, b in zip(best[0], co)))
+
+
+def property_stub(**kwargs):
+    """
+    Stand-in for bpy.props.*Property, returns the default value.
+    """
+    return kwargs.get("default")
+
+
+def module(name, **attributes):
+    """
+    Create a module, register it in sys.modules and fill it.
+    """
+    new_module = types.ModuleType(name)
+    new_module.__dict__.update(attributes)
+    sys.modules[name] = new_module
+    return new_module
+
+
+def install(tempdir=None):
+    """
+    Register the bpy and mathutils stubs in sys.modules. Does nothing inside Blender.
+    :param tempdir: The directory reported as bpy.app.tempdir, defaults to a new temporary directory.
+    :type tempdir: str
+    :return: True if the stubs were installed.
+    :rtype: bool
+    """
+    if "bpy" in sys.modules and not getattr(sys.modules["bpy"], "__stub__", False):
+        return False
+    tempdir = tempdir or tempfile.mkdtemp(prefix="aa_bench_") + os.sep
+
+    def persistent(function):
+        return function
+
+    handlers = module("bpy.app.handlers", persistent=persistent, depsgraph_update_post=[],
+                      frame_change_post=[], load_post=[], save_pre=[], save_post=[])
+    app = module("bpy.app", tempdir=tempdir, handlers=handlers, version=(4, 2, 0), online_access=True,
+                 binary_path="blender", background=True, timers=Placeholder("bpy.app.timers"))
+
+    bpy_types = module("bpy.types", Operator=StubType, Panel=StubType, AddonPreferences=StubType,
+                       PropertyGroup=StubType, UIList=StubType, Menu=StubType, RenderEngine=StubType)
+    bpy_types.__getattr__ = lambda name: type(name, (StubType,), {})
+
+    props = module("bpy.props")
+    props.__getattr__ = lambda name: property_stub
+
+    previews = module("bpy.utils.previews", new=lambda: {}, remove=lambda collection: None)
+    utils = module("bpy.utils", previews=previews, register_class=lambda cls: None,
+                   unregister_class=lambda cls: None)
+
+    bpy = module("bpy", app=app, types=bpy_types, props=props, utils=utils,
+                 ops=Placeholder("bpy.ops"), data=Placeholder("bpy.data"),
+                 context=Placeholder("bpy.context"), __stub__=True)
+    bpy.path = Placeholder("bpy.path")
+
+    kdtree = module("mathutils.kdtree", KDTree=KDTree)
+    module("mathutils", Vector=Vector, kdtree=kdtree, Matrix=Placeholder("Matrix"))
+    return True
+
+
+def load_module(name):
+    """
+    Import one module of the add-on without running the add-on's __init__ (which registers with Blender).
+    :param name: The module name, e.g. "model_downloader".
+    :type name: str
+    :return: The module.
+    """
+    install()
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [ADDON_DIR]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(f"{PACKAGE}.{name}")
@@ -0,0 +1,177 @@
+"""
+Fixture payloads shaped like the Anything World service output: GLB files and processed-model JSON.
+Pure Python, usable inside and outside Blender.
+"""
+import json
+import struct
+import zlib
+from array import array
+
+GLB_MAGIC = b'glTF'
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+DEFAULT_CLIPS = ("idle", "walk", "run", "jump", "eat", "sleep", "attack", "die")
+
+
+def pad4(data, filler):
+    """
+    Pad bytes to a multiple of 4, as required by GLB chunks.
+    """
+    return data + filler * ((4 - len(data) % 4) % 4)
+
+
+def build_glb(name="model", grid=2, animated=True, frames=24):
+    """
+    Build a valid GLB holding a grid mesh and, optionally, a translation animation.
+    :param name: The name of the node and mesh.
+    :type name: str
+    :param grid: Number of vertices per side, the mesh has grid * grid vertices.
+    :type grid: int
+    :param animated: Add an animation to the node.
+    :type animated: bool
+    :param frames: Number of keyframes of the animation.
+    :type frames: int
+    :return: The GLB file content.
+    :rtype: bytes
+    """
+    grid = max(grid, 2)
+    positions = array('f')
+    for y in range(grid):
+        for x in range(grid):
+            positions.extend((x / (grid - 1) - 0.5, y / (grid - 1) - 0.5, 0.0))
+    indices = array('I')
+    for y in range(grid - 1):
+        for x in range(grid - 1):
+            a = y * grid + x
+            indices.extend((a, a + 1, a + grid, a + 1, a + grid + 1, a + grid))
+
+    views = [positions.tobytes(), indices.tobytes()]
+    accessors = [
+        {"bufferView": 0, "componentType": 5126, "count": grid * grid, "type": "VEC3",
+         "min": [-0.5, -0.5, 0.0], "max": [0.5, 0.5, 0.0]},
+        {"bufferView": 1, "componentType": 5125, "count": len(indices), "type": "SCALAR"},
+    ]
+    document = {
+        "asset": {"version": "2.0", "generator": "animate-anything fixtures"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"name": name, "mesh": 0}],
+        "meshes": [{"name": name, "primitives": [{"attributes": {"POSITION": 0}, "indices": 1}]}],
+    }
+
+    if animated:
+        times = array('f', (frame / 24.0 for frame in range(frames)))
+        translations = array('f')
+        for frame in range(frames):
+            translations.extend((0.0, frame * 0.05, 0.0))
+        views += [times.tobytes(), translations.tobytes()]
+        accessors += [
+            {"bufferView": 2, "componentType": 5126, "count": frames, "type": "SCALAR",
+             "min": [times[0]], "max": [times[-1]]},
+            {"bufferView": 3, "componentType": 5126, "count": frames, "type": "VEC3"},
+        ]
+        document["animations"] = [{
+            "name": name,
+            "samplers": [{"input": 2, "output": 3, "interpolation": "LINEAR"}],
+            "channels": [{"sampler": 0, "target": {"node": 0, "path": "translation"}}],
+        }]
+
+    binary = b''
+    buffer_views = []
+    for view in views:
+        buffer_views.append({"buffer": 0, "byteOffset": len(binary), "byteLength": len(view)})
+        binary += pad4(view, b'\x00')
+    document["bufferViews"] = buffer_views
+    document["accessors"] = accessors
+    document["buffers"] = [{"byteLength": len(binary)}]
+
+    json_chunk = pad4(json.dumps(document, separators=(',', ':')).encode('utf-8'), b' ')
+    length = 12 + 8 + len(json_chunk) + 8 + len(binary)
+    return (struct.pack('<4sII', GLB_MAGIC, 2, length)
+            + struct.pack('<II', len(json_chunk), CHUNK_JSON) + json_chunk
+            + struct.pack('<II', len(binary), CHUNK_BIN) + binary)
+
+
+def build_png(width=64, height=64):
+    """
+    Build a valid 8-bit RGBA PNG with a gradient.
+    :return: The PNG file content.
+    :rtype: bytes
+    """
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    rows = bytearray()
+    for y in range(height):
+        rows.append(0)
+        for x in range(width):
+            rows.extend((x * 255 // max(width - 1, 1), y * 255 // max(height - 1, 1), 128, 255))
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(bytes(rows))) + chunk(b'IEND', b''))
+
+
+def processed_model_json(base_url, model_id, model_type="dog", behaviour="walk", clips=DEFAULT_CLIPS, parts=0, textures=0):
+    """
+    Build a processed-model response pointing every file at base_url.
+    The file names follow the service: animation clips are named <type>_<clip>.glb.
+    :param base_url: The URL the files are served from, e.g. http://127.0.0.1:8765/files.
+    :type base_url: str
+    :param model_id: The ID of the model.
+    :type model_id: str
+    :param model_type: The type of the model.
+    :type model_type: str
+    :param behaviour: "walk", "fly", "swim", "drive" or "static".
+    :type behaviour: str
+    :param clips: Names of the animation clips, only used by animated behaviours.
+    :type clips: tuple
+    :param parts: Number of vehicle parts.
+    :type parts: int
+    :param textures: Number of textures.
+    :type textures: int
+    :return: The response body, a list with one item.
+    :rtype: list
+    """
+    def url(name):
+        return f"{base_url}/{model_id}/{name}?X-Amz-Expires=3600&X-Amz-Signature={model_id}"
+
+    animated = behaviour in ("walk", "fly", "swim")
+    item = {
+        "_id": model_id,
+        "name": model_type,
+        "type": model_type,
+        "behaviour": behaviour,
+        "original_model": {"files": {"model": url(f"{model_type}.glb")}},
+        "preprocessed_model": {"files": {"model": url(f"{model_type}.glb")}, "material": {}},
+        "textures": {f"texture_{index}": url(f"{model_type}_texture_{index}.png") for index in range(textures)},
+        "model": {
+            "parts": {f"part_{index}": url(f"{'body' if index == 0 else f'wheel_{index}'}.glb") for index in range(parts)},
+            "rig": {
+                "GLB": url(f"{model_type}_rigged.glb") if animated else "",
+                "animations": {clip: {"GLB": url(f"{model_type}_{clip}.glb")} for clip in clips} if animated else {},
+            },
+        },
+        "stage": "done",
+    }
+    return [item]
+
+
+def large_processed_model_json(base_url, model_id, clips=400, parts=60, textures=80):
+    """
+    Build a processed-model response at the upper end of what the service returns: hundreds of
+    clips, each with GLB, FBX and thumbnail variants, plus vehicle parts and textures.
+    :return: The response body, a list with one item.
+    :rtype: list
+    """
+    clip_names = tuple(f"clip{index:03d}" for index in range(clips))
+    body = processed_model_json(base_url, model_id, clips=clip_names, parts=parts, textures=textures)
+    animations = body[0]["model"]["rig"]["animations"]
+    for clip, entry in animations.items():
+        glb = entry["GLB"]
+        entry["FBX"] = glb.replace(".glb", ".fbx")
+        entry["thumbnail"] = glb.replace(".glb", "_thumb.jpg")
+        entry["metadata"] = {"frames": 48, "fps": 24, "loop": True, "tags": ["generated", clip]}
+    body[0]["history"] = [{"stage": stage, "status": "done", "duration": index * 1.5}
+                          for index, stage in enumerate(("upload", "preprocess", "classify", "rig", "animate", "export"))]
+    return body
@@ -0,0 +1,279 @@
+"""
+Local stand-in for the Anything World API, to load-test the client without spending credits.
+
+Serves /animate, /user-processed-model, /has-valid-key and the fixture files they point to,
+with configurable latency, processing delay, error rates and 429 responses.
+
+Standalone:
+    python benchmarks/mock_api_server.py --port 8765 --latency 0.05 --processing-delay 10
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import fixtures
+
+
+class MockConfig:
+    """
+    Behaviour of the mock server.
+
+    Attributes:
+        latency (float): Seconds added to every API response.
+        file_latency (float): Seconds added to every file download.
+        processing_delay (float): Seconds between an upload and the model being ready.
+        error_rate (float): Probability of answering an API call with a 500.
+        rate_limit_rate (float): Probability of answering an API call with a 429.
+        corrupt_rate (float): Probability of answering a file download with an HTML error page.
+        behaviour (str): Behaviour of the processed models ("walk", "drive", "static"...).
+        clips (int): Number of animation clips per model.
+        parts (int): Number of vehicle parts per model.
+        textures (int): Number of textures per model.
+        grid (int): Vertices per side of the fixture meshes.
+        valid_key (str): The only accepted API key, any key is accepted if empty.
+        seed (int): Seed of the random error generator.
+    """
+
+    def __init__(self, latency=0.0, file_latency=0.0, processing_delay=2.0, error_rate=0.0, rate_limit_rate=0.0, corrupt_rate=0.0,
+                 behaviour="walk", clips=8, parts=0, textures=0, grid=16, valid_key="", seed=0):
+        self.latency = latency
+        self.file_latency = file_latency
+        self.processing_delay = processing_delay
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.corrupt_rate = corrupt_rate
+        self.behaviour = behaviour
+        self.clips = clips
+        self.parts = parts
+        self.textures = textures
+        self.grid = grid
+        self.valid_key = valid_key
+        self.seed = seed
+
+
+class MockAPIServer:
+    """
+    A threaded HTTP server imitating the Anything World API.
+
+    Attributes:
+        config (MockConfig): The behaviour of the server.
+        url (str): The base URL, e.g. http://127.0.0.1:8765.
+        uploads (dict): model_id -> upload time.
+        stats (dict): Request counters per endpoint and status.
+    """
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockConfig()
+        self.uploads = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.random = random.Random(self.config.seed)
+        self.glb_cache = {}
+        self.png = fixtures.build_png()
+        self.httpd = ThreadingHTTPServer((host, port), self.make_handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.thread = None
+
+    def start(self):
+        """
+        Serve on a background thread.
+        :return: The server.
+        :rtype: MockAPIServer
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, endpoint, status):
+        """
+        Count a response.
+        """
+        key = f"{endpoint} {status}"
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def injected_failure(self):
+        """
+        Pick a random failure status for an API call.
+        :return: 429, 500 or None.
+        """
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.config.rate_limit_rate:
+            return 429
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            return 500
+        return None
+
+    def glb(self, animated):
+        """
+        Get the fixture GLB, built once.
+        """
+        if animated not in self.glb_cache:
+            self.glb_cache[animated] = fixtures.build_glb(grid=self.config.grid, animated=animated)
+        return self.glb_cache[animated]
+
+    def make_handler(self):
+        """
+        Build the request handler class bound to this server.
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, endpoint, status, body, content_type="application/json"):
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body)
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                server.count(endpoint, status)
+
+            def api_delay_or_failure(self, endpoint):
+                time.sleep(server.config.latency)
+                status = server.injected_failure()
+                if status == 429:
+                    self.reply(endpoint, 429, {"code": 429, "message": "Too many requests"})
+                    return True
+                if status == 500:
+                    self.reply(endpoint, 500, {"code": 500, "message": "Injected server error"})
+                    return True
+                return False
+
+            def key_is_valid(self, key):
+                return key != "" and (server.config.valid_key == "" or key == server.config.valid_key)
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if path != "/animate":
+                    self.reply(path, 404, {"code": 404, "message": "Not found"})
+                    return
+                if self.api_delay_or_failure(path):
+                    return
+                if b'name="key"' not in body:
+                    self.reply(path, 400, {"code": 400, "message": "Missing key"})
+                    return
+                model_id = uuid.uuid4().hex
+                with server.lock:
+                    server.uploads[model_id] = time.monotonic()
+                self.reply(path, 200, {"model_id": model_id})
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                path = parsed.path
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+                if path.startswith("/files/"):
+                    time.sleep(server.config.file_latency)
+                    name = path.rsplit("/", 1)[-1]
+                    with server.lock:
+                        corrupt = server.random.random() < server.config.corrupt_rate
+                    if corrupt:
+                        # What an expired signed URL looks like
+                        self.reply("/files corrupt", 200, "<!DOCTYPE html><html><body>Request has expired</body></html>", "text/html")
+                        return
+                    if name.endswith(".png"):
+                        self.reply("/files", 200, server.png, "image/png")
+                    elif name.endswith(".glb"):
+                        animated = "_" in name and not name.endswith("_rigged.glb")
+                        self.reply("/files", 200, server.glb(animated), "model/gltf-binary")
+                    else:
+                        self.reply("/files", 404, "Not found", "text/plain")
+                    return
+
+                if path == "/has-valid-key":
+                    time.sleep(server.config.latency)
+                    status = 200 if self.key_is_valid(query.get("key", "")) else 403
+                    self.reply(path, status, {"valid": status == 200})
+                    return
+
+                if path == "/user-processed-model":
+                    if self.api_delay_or_failure(path):
+                        return
+                    if not self.key_is_valid(query.get("key", "")):
+                        self.reply(path, 403, {"code": 403, "message": "Invalid or missing API key"})
+                        return
+                    with server.lock:
+                        uploaded = server.uploads.get(query.get("id", ""))
+                    if uploaded is None:
+                        self.reply(path, 404, {"code": 404, "message": "Model not found"})
+                    elif time.monotonic() - uploaded < server.config.processing_delay:
+                        self.reply(path, 403, {"code": 403, "message": "Model processing is ongoing"})
+                    else:
+                        body = fixtures.processed_model_json(
+                            server.url + "/files", query["id"], behaviour=server.config.behaviour,
+                            clips=fixtures.DEFAULT_CLIPS[:server.config.clips] if server.config.clips <= len(fixtures.DEFAULT_CLIPS)
+                            else tuple(f"clip{index}" for index in range(server.config.clips)),
+                            parts=server.config.parts, textures=server.config.textures)
+                        self.reply(path, 200, body)
+                    return
+
+                self.reply(path, 404, {"code": 404, "message": "Not found"})
+
+        return Handler
+
+
+def add_arguments(parser):
+    """
+    Add the mock server options to an argument parser.
+    :param parser: The parser.
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API response")
+    parser.add_argument("--file-latency", type=float, default=0.0, help="Seconds added to every file download")
+    parser.add_argument("--processing-delay", type=float, default=2.0, help="Seconds until an uploaded model is ready")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 500 on API calls")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of a 429 on API calls")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="Probability of an HTML page instead of a file")
+    parser.add_argument("--behaviour", default="walk", help="walk, fly, swim, drive or static")
+    parser.add_argument("--clips", type=int, default=8, help="Animation clips per model")
+    parser.add_argument("--parts", type=int, default=0, help="Vehicle parts per model")
+    parser.add_argument("--textures", type=int, default=0, help="Textures per model")
+    parser.add_argument("--grid", type=int, default=16, help="Vertices per side of the fixture meshes")
+
+
+def config_from_args(args):
+    """
+    Build a MockConfig from parsed command line arguments.
+    """
+    return MockConfig(latency=args.latency, file_latency=args.file_latency, processing_delay=args.processing_delay,
+                      error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                      corrupt_rate=args.corrupt_rate, behaviour=args.behaviour,
+                      clips=args.clips, parts=args.parts, textures=args.textures, grid=args.grid)
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Local stand-in for the Anything World API")
+    add_arguments(argument_parser)
+    arguments = argument_parser.parse_args()
+    mock = MockAPIServer(config_from_args(arguments), arguments.host, arguments.port)
+    print(f"Mock Anything World API on {mock.url}")
+    try:
+        mock.httpd.serve_forever()
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,179 @@
+"""
+End-to-end throughput benchmark of the client against the local mock API.
+
+Drives AWAPITool (upload and poll), ModelDownloader and BlenderModelImporter for a number of
+jobs and reports jobs per minute, p50/p95 latency per stage and peak RSS.
+
+Usage:
+    blender -b --python benchmarks/throughput.py -- --jobs 20 --workers 4 --latency 0.05 --processing-delay 2
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+import fixtures
+import mock_api_server
+
+STAGES = ("upload", "poll", "download", "import", "total")
+
+
+def load_addon():
+    """
+    Import the add-on as a package so its relative imports work.
+    :return: A function returning a submodule of the add-on by name.
+    """
+    sys.path.insert(0, os.path.dirname(ADDON_DIR))
+    package = os.path.basename(ADDON_DIR)
+    importlib.import_module(package)
+    return lambda name: importlib.import_module(package + "." + name)
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile.
+    :param values: The samples.
+    :type values: list
+    :param fraction: The percentile between 0 and 1.
+    :type fraction: float
+    :return: The percentile, or None without samples.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Rounded first so float noise such as 0.07 * 100 = 7.000000000000001 does not skip a rank
+    index = min(len(ordered) - 1, max(0, math.ceil(round(fraction * len(ordered), 9)) - 1))
+    return ordered[index]
+
+
+def peak_rss_bytes():
+    """
+    Get the peak resident set size of this process.
+    :return: The size in bytes, or None if the platform does not report it.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def parse_args(argv):
+    argv = argv[argv.index("--") + 1:] if "--" in argv else argv[1:]
+    parser = argparse.ArgumentParser(prog="throughput.py", description="Animate Anything end-to-end throughput benchmark")
+    mock_api_server.add_arguments(parser)
+    parser.add_argument("--jobs", type=int, default=10, help="Number of models to process")
+    parser.add_argument("--workers", type=int, default=4, help="Jobs uploading/downloading at once")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--poll-timeout", type=float, default=600.0)
+    parser.add_argument("--upload-grid", type=int, default=64, help="Vertices per side of the uploaded fixture")
+    parser.add_argument("--report", default="", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+    # Let the OS pick a free port unless one was given explicitly
+    if "--port" not in argv:
+        args.port = 0
+    return args
+
+
+def run(argv):
+    """
+    Run the benchmark.
+    :return: The report.
+    :rtype: dict
+    """
+    args = parse_args(argv)
+    addon = load_addon()
+    batch = addon("batch_cli")
+    AWAPITool = addon("aw_api_tool").AWAPITool
+    APIKeyManager = addon("api_key_manager").APIKeyManager
+    WorkspaceManager = addon("workspace").WorkspaceManager
+    addon("aa_panel").AW_PT_AAPanel.headless = True
+    from mathutils import Vector
+
+    server = mock_api_server.MockAPIServer(mock_api_server.config_from_args(args), args.host, args.port).start()
+    AWAPITool.SEND_URL = server.url + "/animate"
+    AWAPITool.RECEIVE_URL = server.url + "/user-processed-model"
+    APIKeyManager.VALIDATION_URL = server.url
+
+    upload = fixtures.build_glb("bench", grid=args.upload_grid, animated=False)
+    jobs = []
+    for index in range(args.jobs):
+        job = batch.BatchJob("", f"bench_{index:04d}", "dog", "benchmark", False)
+        job.workspace = WorkspaceManager.create("bench")
+        with open(job.workspace.join(job.name + ".glb"), 'wb') as file:
+            file.write(upload)
+        # Size of the sent model, used to scale the imported clips
+        job.size = Vector((1, 1, 1))
+        jobs.append(job)
+
+    print(f"Benchmarking {args.jobs} jobs with {args.workers} workers against {server.url}")
+    start = time.perf_counter()
+    started = {}
+    pending = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for job in jobs:
+            started[job.name] = time.perf_counter()
+            pending.append(pool.submit(batch.process_remote, job, "benchmark-key", args))
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                job = future.result()
+                if job.status != "failed":
+                    try:
+                        with batch.Stage(job, "import"):
+                            batch.import_result(job)
+                        job.status = "done"
+                    except Exception as e:
+                        job.fail(f"Import failed: {e}")
+                job.timings["total"] = time.perf_counter() - started[job.name]
+                job.workspace.release()
+    elapsed = time.perf_counter() - start
+    server.stop()
+
+    done = [job for job in jobs if job.status == "done"]
+    report = {
+        "jobs": args.jobs,
+        "workers": args.workers,
+        "succeeded": len(done),
+        "failed": args.jobs - len(done),
+        "elapsed_seconds": round(elapsed, 3),
+        "jobs_per_minute": round(len(done) / elapsed * 60.0, 2) if elapsed else 0.0,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "stages": {},
+        "server": server.stats,
+        "errors": sorted({job.error for job in jobs if job.error}),
+    }
+    for stage in STAGES:
+        samples = [job.timings[stage] for job in done if stage in job.timings]
+        report["stages"][stage] = {
+            "p50": percentile(samples, 0.50),
+            "p95": percentile(samples, 0.95),
+            "samples": len(samples),
+        }
+
+    print(f"{report['succeeded']}/{args.jobs} jobs in {report['elapsed_seconds']} s, {report['jobs_per_minute']} jobs/min")
+    for stage, values in report["stages"].items():
+        if values["samples"]:
+            print(f"  {stage:<9} p50 {values['p50'] * 1000.0:9.1f} ms   p95 {values['p95'] * 1000.0:9.1f} ms")
+    if report["peak_rss_bytes"] is not None:
+        print(f"  peak RSS {report['peak_rss_bytes'] / (1024 * 1024):.1f} MiB")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    result = run(sys.argv)
+    sys.exit(0 if result["failed"] == 0 else 1)
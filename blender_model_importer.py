@@ -1,10 +1,23 @@
 import os
+import queue
 import bpy
 import functools
 from .aa_type_handler import DefaultBehaviourType
 from .aa_panel import AW_PT_AAPanel
-from .global_values import GlobalValues
+from .import_job import ImportJob
 from mathutils import Vector
+from .bounds import BoundsService
+from .tracing import Tracer
+from .glb_scanner import GLBScanner
+from .texture_loader import TextureLoader
+from .draw_call_optimizer import DrawCallOptimizer
+from .rig_pruner import RigPruner
+from .clip_playback import ClipPlayback
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
 class BlenderModelImporter:
     """
     A class for importing 3D models into Blender and applying textures.
@@ -12,15 +25,38 @@ class BlenderModelImporter:
     model_imported = False
     first_rig = None
     offset_increment = 5
-    offset_x = 0.0
-    offset_y = 0.0
-    current_index = 0 
-    first_scale = -1
-    def __init__(self):
+    PIPELINE_SECONDS = 0.1
+    def __init__(self, workspace=None, blocking=False, collection_name=None, job=None):
+        """
+        :param workspace: The workspace the files were downloaded to, defaults to the Blender temp directory.
+        :type workspace: JobWorkspace
+        :param blocking: Import animations in a loop instead of a timer, timers do not run in background mode.
+        :type blocking: bool
+        :param collection_name: Import into this collection instead of the shared one of the model kind.
+        :type collection_name: str
+        :param job: The layout and scale state of this import, a new one sized like the sent model by default.
+        :type job: ImportJob
+        """
         self.model_imported = False
-        self.offset_x = 0.0
-        self.offset_y = 0.0
-        pass
+        self.workspace = workspace
+        self.blocking = blocking
+        self.collection_name = collection_name
+        self.base_dir = workspace.path if workspace is not None else bpy.app.tempdir
+        self.job = job if job is not None else ImportJob(workspace.job_id if workspace is not None else "")
+        # Longest side of the loaded textures, 0 keeps the full size
+        self.texture_max_size = getattr(bpy.context.scene, "texture_max_size", 0)
+        # Join the static parts and merge the materials of vehicle and static imports, see DrawCallOptimizer
+        self.optimize_draw_calls = getattr(bpy.context.scene, "optimize_draw_calls", False)
+        self.bake_texture_atlas = getattr(bpy.context.scene, "bake_texture_atlas", False)
+        # What to do with the unused bones of imported rigs, see RigPruner
+        self.prune_bones = getattr(bpy.context.scene, "prune_bones", 'OFF')
+        # The root objects of this import, see AssetLibrary.add
+        self.imported_objects = []
+        self.pipeline = None
+        self.pipeline_folder = None
+        self.pipeline_imported = 0
+        self.pipeline_ok = True
+        self.pipeline_done = None
         
     def get_or_create_collection(self, collection_name):
         """
@@ -38,13 +74,13 @@ class BlenderModelImporter:
         Import all 3D models in the specified folder and apply textures.
         """
         collection = self.get_or_create_collection("Collection")
-        folder = os.path.join(bpy.app.tempdir, folder)
+        folder = os.path.join(self.base_dir, folder)
         #import all the textures in the folder
         texture_files = [f for f in os.listdir(
             folder) if f.endswith('.png') or f.endswith('.jpg')or f.endswith('.jpeg')]
-        for texture_file in texture_files:
-            texture_filepath = os.path.join(folder, texture_file)
-            bpy.ops.image.open(filepath=texture_filepath)
+        with Tracer.span("import textures", job_id=self.job_id(), count=len(texture_files)):
+            TextureLoader.load_all([os.path.join(folder, texture_file) for texture_file in texture_files],
+                                   self.texture_max_size)
             
         # Get all model files in the folder
         model_files = [f for f in os.listdir(
@@ -54,7 +90,7 @@ class BlenderModelImporter:
             
         elif def_type == DefaultBehaviourType.WheeledVehicle or def_type == DefaultBehaviourType.FlyingVehicle:
             #create a colelction for the models
-            models_collection = self.get_or_create_collection("Vehicle")
+            models_collection = self.get_or_create_collection(self.collection_name or "Vehicle")
             # Import each model
             body = None
             for model_file in model_files:
@@ -91,23 +127,28 @@ class BlenderModelImporter:
                         bpy.context.view_layer.objects.active = body    # the active object will be the parent of all selected object
                         bpy.ops.object.parent_set()
             #reselect the body
+            self.imported_objects.append(body)
             body.select_set(True)
             bpy.context.view_layer.objects.active = body
             #scale the model to ajust to the blender metric scale
             scale_factor = self.calculate_dimension_difference(body)*3.5
             body.scale *= scale_factor
+            self.optimize([body])
             
             
                         
                         
         elif def_type == DefaultBehaviourType.Static:
             #create a colelction for the models
-            models_collection = self.get_or_create_collection("Imported Models")
+            models_collection = self.get_or_create_collection(self.collection_name or "Imported Models")
+            imported = []
             for model_file in model_files:
                 model_filepath = os.path.join(folder, model_file)
                 model = self.import_model(model_filepath)
                 # Move the imported model to the models collection
                 if model is not None:
+                    imported.append(model)
+                    self.imported_objects.append(model)
                     models_collection.objects.link(model)
                     bpy.context.active_object.select_set(False)
                     try :
@@ -115,11 +156,23 @@ class BlenderModelImporter:
                     except:
                         pass
                     
-            #scale the model to ajust to the blender metric scale
-            for model in models_collection.objects:
-                scale_factor = self.calculate_dimension_difference(body)
+            #scale the model to ajust to the blender metric scale, models of other imports sharing the collection keep theirs
+            for model in imported:
+                scale_factor = self.calculate_dimension_difference(model)
                 model.scale *= scale_factor
+            self.optimize(imported)
                 
+    def optimize(self, roots):
+        """
+        Reduce the draw calls of imported models if the scene asks for it.
+        :param roots: The root objects of the imported models.
+        :type roots: list
+        """
+        if not self.optimize_draw_calls:
+            return
+        with Tracer.span("reduce draw calls", job_id=self.job_id(), models=len(roots)):
+            DrawCallOptimizer(atlas=self.bake_texture_atlas).optimize(roots)
+
     def import_model(self, model_filepath, max_dimension=10):
         """
         Import a 3D model into Blender, and check model size and name.
@@ -130,14 +183,15 @@ class BlenderModelImporter:
         old_objs = set(bpy.data.objects)
         AW_PT_AAPanel.message_handler("Importing model " + os.path.splitext(os.path.basename(model_filepath))[0])
         # Import the model based on its file extension
-        if model_filepath.endswith('.glb'):
-            bpy.ops.import_scene.gltf(filepath=model_filepath,bone_heuristic='TEMPERANCE')
-        elif model_filepath.endswith('.obj'):
-            bpy.ops.wm.obj_import(filepath=model_filepath)
-        elif model_filepath.endswith('.fbx'):
-            bpy.ops.import_scene.fbx(filepath=model_filepath)
-        else:
-            raise ValueError("Unsupported model format: {}".format(model_filepath))
+        with Tracer.span("import model", job_id=self.job_id(), file=os.path.basename(model_filepath)):
+            if model_filepath.endswith('.glb'):
+                bpy.ops.import_scene.gltf(filepath=model_filepath,bone_heuristic='TEMPERANCE')
+            elif model_filepath.endswith('.obj'):
+                bpy.ops.wm.obj_import(filepath=model_filepath)
+            elif model_filepath.endswith('.fbx'):
+                bpy.ops.import_scene.fbx(filepath=model_filepath)
+            else:
+                raise ValueError("Unsupported model format: {}".format(model_filepath))
         # Get the base name of the file without the extension
         base_name = os.path.splitext(os.path.basename(model_filepath))[0]
         imported_object = (set(bpy.data.objects) - old_objs).pop()
@@ -149,7 +203,7 @@ class BlenderModelImporter:
         # Check the dimensions of the imported object
         dimensions = imported_object.dimensions
         if any(dim > max_dimension for dim in dimensions):
-            print(f"Warning: The imported model is too big. Dimensions: {dimensions}, Max allowed: {max_dimension}")
+            log.warning("The imported model is too big. Dimensions: %s, max allowed: %s", tuple(dimensions), max_dimension)
         
         return imported_object
     # Function to move an object and its children to a specified collection
@@ -174,114 +228,243 @@ class BlenderModelImporter:
         :param model_filepath: File path to the 3D model.
         """
         #create a colelction for the models
-        models_collection = self.get_or_create_collection("Animated Models")
-            
+        models_collection = self.get_or_create_collection(self.collection_name or "Animated Models")
+        model_files = self.plan_animated_import(folder, model_files)
+
         # Import each model              
+        if self.blocking:
+            while self.import_next_model(model_files, folder, models_collection) is not None:
+                pass
+            return
         bpy.app.timers.register(functools.partial(self.import_next_model, model_files, folder, models_collection))
                  
+    def plan_animated_import(self, folder, model_files):
+        """
+        Drop the clips that have nothing to contribute before importing anything, using the
+        GLB contents read on the download thread, and report the size of the planned import.
+        :param folder: The folder of the clips.
+        :param model_files: The file names.
+        :type model_files: list
+        :return: The file names to import.
+        :rtype: list
+        """
+        planned = []
+        planned_bytes = 0
+        for model_file in model_files:
+            if "_" not in model_file or not model_file.endswith('.glb'):
+                planned.append(model_file)
+                continue
+            info = GLBScanner.scan(os.path.join(folder, model_file))
+            if info.error:
+                # Let the importer report unreadable files
+                planned.append(model_file)
+            elif not info.has_animation:
+                log.info("Skipping %s, it has no animation", model_file)
+            else:
+                planned.append(model_file)
+                planned_bytes += info.data_bytes
+        skipped = len(model_files) - len(planned)
+        AW_PT_AAPanel.message_handler(f"Importing {len(planned)} files (~{planned_bytes / (1024 * 1024):.1f} MB)"
+                                      + (f", skipped {skipped} without animation" if skipped else ""))
+        return planned
+
     def import_next_model(self,model_files,folder,models_collection):
-        if self.current_index >= len(model_files):
+        if self.job.current_index >= len(model_files):
+            self.release_workspace()
             return None  # Stop the timer when all models are processed
-        model_file = model_files[self.current_index]
+        model_file = model_files[self.job.current_index]
         if "_" in model_file:  # Process only if the model file is designated as an animation
-            model_filepath = os.path.join(folder, model_file)
-            self.import_model(model_filepath)
-            model = bpy.context.active_object
-            #check if model has an animation
-            if model.animation_data is None:
-                #delete the model if it does not have an animation
-                bpy.ops.object.delete()
-                self.current_index += 1  # Prepare for the next model
+            if not self.import_clip(model_file, folder, models_collection):
+                self.job.current_index += 1  # Prepare for the next model
                 return 1  # Call this function again after 1 seconds
-                
-            bpy.ops.object.empty_add(type='PLAIN_AXES', location=(0, 0, 0))
-            empty = bpy.context.active_object
-            empty.name = os.path.splitext(model_file)[0]
-            model.select_set(True)
-            bpy.context.view_layer.objects.active = empty
-            bpy.ops.object.parent_set(type='OBJECT', keep_transform=True)
-            self.move_to_collection(empty, models_collection)
-            empty.location.x = self.offset_x
-            empty.location.y = self.offset_y
-            # Move the empty to the right of the model by half of the model's x dimension         
-            self.offset_x += (model.dimensions.x * 0.5)
-            print("stored dimensions: " + str(GlobalValues.sent_model_size))
+        self.job.current_index += 1  # Prepare for the next model
+        return 0.2  # Call this function again after 0.2 seconds
+
+    def start_pipeline(self, folder, on_finished=None):
+        """
+        Import the clips of an animated model while they are still downloading. Main thread only.
+        The download thread hands every verified file to queue_file and calls finish_pipeline
+        at the end, a timer imports the queued clips in the order they arrive.
+        :param folder: The folder of the clips in the workspace, e.g. "animations".
+        :type folder: str
+        :param on_finished: Called on the main thread with the importer, the number of imported clips
+            and whether the download succeeded, once the queue is drained.
+        :type on_finished: callable
+        """
+        self.pipeline = queue.Queue()
+        self.pipeline_folder = folder
+        self.pipeline_imported = 0
+        self.pipeline_done = on_finished
+        models_collection = self.get_or_create_collection(self.collection_name or "Animated Models")
+        bpy.app.timers.register(functools.partial(self.import_queued_file, os.path.join(self.base_dir, folder), models_collection),
+                                first_interval=BlenderModelImporter.PIPELINE_SECONDS)
+
+    def queue_file(self, folder, path):
+        """
+        Queue a downloaded file for import, called on the download thread. Files of other
+        folders, e.g. the original model, are ignored.
+        :param folder: The folder the file was downloaded to.
+        :param path: The absolute path of the file.
+        """
+        if folder != self.pipeline_folder:
+            return
+        texture = None
+        if path.endswith(TextureLoader.EXTENSIONS):
+            # Decode on the pool, the download goes on and the timer only copies the pixels
+            texture = TextureLoader.decode_async(path, self.texture_max_size)
+        self.pipeline.put((path, texture))
+
+    def finish_pipeline(self, ok=True):
+        """
+        Tell the import timer that no more files will be queued, called on the download thread.
+        :param ok: False if some files could not be downloaded.
+        :type ok: bool
+        """
+        self.pipeline_ok = ok
+        self.pipeline.put((None, None))
+
+    def import_queued_file(self, folder, models_collection):
+        """
+        Timer importing the queued files one per call.
+        :return: Seconds until the next call, None once the download finished and the queue is empty.
+        """
+        try:
+            path, texture = self.pipeline.get_nowait()
+        except queue.Empty:
+            return BlenderModelImporter.PIPELINE_SECONDS
+        if path is None:
+            self.release_workspace()
+            if self.pipeline_done is not None:
+                self.pipeline_done(self, self.pipeline_imported, self.pipeline_ok)
+            return None
+        model_file = os.path.basename(path)
+        try:
+            if model_file.endswith(TextureLoader.EXTENSIONS):
+                TextureLoader.open(path, texture.result() if texture is not None else None)
+                return 0
+            if "_" not in model_file or not model_file.endswith('.glb'):
+                return 0
+            info = GLBScanner.scan(path)
+            if not info.error and not info.has_animation:
+                log.info("Skipping %s, it has no animation", model_file)
+                return 0
+            with Tracer.span("import clip", job_id=self.job_id(), file=model_file):
+                if self.import_clip(model_file, folder, models_collection):
+                    self.pipeline_imported += 1
+                    AW_PT_AAPanel.message_handler(f"Imported {self.pipeline_imported} animations, downloading the rest...")
+        except Exception:
+            # An exception would unregister the timer and leave the rest of the queue and the workspace behind
+            log.exception("Import of %s failed", model_file)
+        return 0
+
+    def import_clip(self, model_file, folder, models_collection):
+        """
+        Import an animation clip under an empty, laid out on the grid and scaled like the first clip.
+        :param model_file: The file name of the clip.
+        :param folder: The folder of the clip.
+        :param models_collection: The collection of the animated model.
+        :return: False if the file had no animation and was removed.
+        :rtype: bool
+        """
+        job = self.job
+        model_filepath = os.path.join(folder, model_file)
+        self.import_model(model_filepath)
+        model = bpy.context.active_object
+        #check if model has an animation
+        if model.animation_data is None:
+            #delete the model if it does not have an animation
+            BoundsService.forget(bpy.context.selected_objects)
+            bpy.ops.object.delete()
+            return False
+        if self.prune_bones != 'OFF':
+            # Timing the deformation is for the operator, it would double the cost of every clip
+            RigPruner(self.prune_bones, measure=False).prune_all([model])
             
-            if self.first_scale < 0:
-                print("in a first model calculate the scale factor")
-                # If have no scale stored use the default cube size
-                if(GlobalValues.sent_model_size.length < 0.1):
-                    print("No stored dimensions")
-                    GlobalValues.sent_model_size = Vector((2, 2, 2))
-                target_dim=GlobalValues.sent_model_size
-                current_dim = model.dimensions
-                
-                #keep the dimension aways positive and in the outside a vector to avoid inverted dimensions
-                current_dim_x = abs(current_dim.x)
-                current_dim_y = abs(current_dim.y)
-                current_dim_z = abs(current_dim.z)
-                print("Target dimensions: " + str(target_dim))
-                print("Current dimensions: " + str(current_dim))
-                print("Current dimensionsnorm: " + str(current_dim_x) + " " + str(current_dim_y) + " " + str(current_dim_z))
-                
-                #get the largest dimension of target
-                if target_dim.z > target_dim.x and target_dim.z > target_dim.y:
-                    target_dim_out = target_dim.z
-                elif target_dim.x > target_dim.y:
-                    target_dim_out = target_dim.x
-                else:
-                    target_dim_out = target_dim.y
-                #get the largest dimension of the model
-                if current_dim_z > current_dim_x and current_dim_z > current_dim_y:
-                    current_dim_out = current_dim_z
-                elif current_dim_x > current_dim_y:
-                    current_dim_out = current_dim_x
-                else:
-                    current_dim_out = current_dim_y
-                    
-                # Dynamically calculate scale factors with an adjustable scaling multiplier.
-                scale_factors = target_dim_out / current_dim_out
-                print("Scale factor: " + str(scale_factors))
-                # Apply these scale factors to the object's scale
-                empty.scale.x *= scale_factors
-                empty.scale.y *= scale_factors
-                empty.scale.z *= scale_factors
-                
-                self.first_scale = scale_factors
-            else:
-                print("using stored scale factor"+str(self.first_scale))
-                # Apply the first scale to the object's scale
-                empty.scale.x *= self.first_scale
-                empty.scale.y *= self.first_scale
-                empty.scale.z *= self.first_scale
+        bpy.ops.object.empty_add(type='PLAIN_AXES', location=(0, 0, 0))
+        empty = bpy.context.active_object
+        empty.name = os.path.splitext(model_file)[0]
+        ClipPlayback.tag(empty)
+        model.select_set(True)
+        bpy.context.view_layer.objects.active = empty
+        bpy.ops.object.parent_set(type='OBJECT', keep_transform=True)
+        self.move_to_collection(empty, models_collection)
+        self.imported_objects.append(empty)
+        empty.location.x = job.offset_x
+        empty.location.y = job.offset_y
+        # World-space size of the whole imported hierarchy (the root is usually an armature without geometry)
+        model_size = BoundsService.dimensions(model)
+        # Move the empty to the right of the model by half of the model's x dimension         
+        job.offset_x += (model_size.x * 0.5)
+        log.debug("Stored dimensions: %s", job.target_size)
+        
+        if job.clip_scale < 0:
+            log.debug("First model, calculating the scale factor")
+            # If have no scale stored use the default cube size
+            if(job.target_size.length < 0.1):
+                log.debug("No stored dimensions")
+                job.target_size = Vector((2, 2, 2))
+            target_dim=job.target_size
+            log.debug("Target dimensions: %s, current dimensions: %s", target_dim, model_size)
+            
+            #compare the largest dimension of the target and of the model
+            target_dim_out = max(target_dim)
+            current_dim_out = max(model_size) or 1.0
                 
-            #if location y is bigger than 200 move to the next row
-            if self.offset_x > 100:
-                self.offset_x = 0
-                self.offset_y += model.dimensions.y + self.offset_increment
-                empty.location.y = self.offset_y
-        self.current_index += 1  # Prepare for the next model
-        return 0.2  # Call this function again after 0.2 seconds
+            # Dynamically calculate scale factors with an adjustable scaling multiplier.
+            scale_factors = target_dim_out / current_dim_out
+            log.debug("Scale factor: %s", scale_factors)
+            # Apply these scale factors to the object's scale
+            empty.scale.x *= scale_factors
+            empty.scale.y *= scale_factors
+            empty.scale.z *= scale_factors
+            
+            job.clip_scale = scale_factors
+        else:
+            log.debug("Using stored scale factor %s", job.clip_scale)
+            # Apply the first scale to the object's scale
+            empty.scale.x *= job.clip_scale
+            empty.scale.y *= job.clip_scale
+            empty.scale.z *= job.clip_scale
+            
+        #if location y is bigger than 200 move to the next row
+        if job.offset_x > 100:
+            job.offset_x = 0
+            job.offset_y += model_size.y + self.offset_increment
+            empty.location.y = job.offset_y
+        return True
     
+    def job_id(self):
+        """
+        :return: The ID of the job being imported, the one of the upload when the model was sent in this session.
+        :rtype: str
+        """
+        return self.job.job_id
+
+    def release_workspace(self):
+        """
+        Mark the download job as finished so its files can be cleaned up later.
+        """
+        if self.workspace is not None:
+            self.workspace.release()
+
     def calculate_dimension_difference(self,model):
         """Calculate the scale factor needed to adjust the model to the blender metric scale
             :param model: The model to scale.
             :type model: bpy.types.Object
             :return: The scale factor needed to adjust the model to the blender metric scale.
         """
-        if GlobalValues.firstScale < 0:
+        if self.job.model_scale < 0:
+            model_size = BoundsService.dimensions(model)
             # If have no scale stored, use the model dimensions
-            if(GlobalValues.sent_model_size.length < 0.1):
-                GlobalValues.sent_model_size = model.dimensions * 0.1
-            target_dim=GlobalValues.sent_model_size
-            current_dim = model.dimensions
-            print("Target dimensions: " + str(target_dim))
-            print("Current dimensions: " + str(current_dim))
-            # Calculate scale factors needed for each dimension
-            scale_factors = [target_dim / current_dim if current_dim != 0 else 0
-                                for target_dim, current_dim in zip(target_dim, current_dim)]
-            GlobalValues.firstScale = scale_factors[2]
-            print("Scale factor: " + str(scale_factors[2]))
-            return scale_factors[2]
+            if(self.job.target_size.length < 0.1):
+                self.job.target_size = model_size * 0.1
+            target_dim=self.job.target_size
+            log.debug("Target dimensions: %s, current dimensions: %s", target_dim, model_size)
+            # Compare the largest axis so rotated models scale the same way
+            current_dim = max(model_size)
+            scale_factor = max(target_dim) / current_dim if current_dim != 0 else 1.0
+            self.job.model_scale = scale_factor
+            log.debug("Scale factor: %s", scale_factor)
+            return scale_factor
         else:
-            return GlobalValues.firstScale
+            return self.job.model_scale
@@ -0,0 +1,194 @@
+import bpy
+import numpy as np
+from bpy.app.handlers import persistent
+from mathutils import Vector
+
+
+class BoundsService:
+    """
+    Computes evaluated world-space bounding boxes over object hierarchies.
+    Results are cached per object and only recomputed after a depsgraph update
+    touched that object, so repeated calls (panel redraws, every imported clip) are free.
+    """
+    # Object types whose evaluated geometry can be read as a mesh
+    GEOMETRY_TYPES = {'MESH', 'CURVE', 'SURFACE', 'FONT', 'META'}
+
+    # key -> generation, bumped every time the depsgraph updates the object
+    _generations = {}
+    # key -> (generation, min corner, max corner), corners are None for objects without geometry
+    _cache = {}
+
+    @staticmethod
+    def key(obj):
+        """
+        :return: The cache key of an object. The name alone is not enough: an object created right
+            after another was deleted can get its name before the depsgraph updated.
+        :rtype: tuple
+        """
+        return obj.as_pointer(), obj.name_full
+
+    @staticmethod
+    @persistent
+    def on_depsgraph_update(scene, depsgraph):
+        """
+        Invalidate the cached bounds of every object updated by the depsgraph.
+        """
+        for update in depsgraph.updates:
+            if isinstance(update.id, bpy.types.Object) and (update.is_updated_geometry or update.is_updated_transform):
+                key = BoundsService.key(update.id.original)
+                BoundsService._generations[key] = BoundsService._generations.get(key, 0) + 1
+
+    @staticmethod
+    @persistent
+    def on_frame_change(scene, depsgraph=None):
+        """
+        Animation moves the evaluated geometry without a depsgraph update, so drop everything.
+        """
+        BoundsService.clear()
+
+    @staticmethod
+    def register():
+        """
+        Start tracking depsgraph updates.
+        """
+        bpy.app.handlers.depsgraph_update_post.append(BoundsService.on_depsgraph_update)
+        bpy.app.handlers.frame_change_post.append(BoundsService.on_frame_change)
+        bpy.app.handlers.load_post.append(BoundsService.on_frame_change)
+
+    @staticmethod
+    def unregister():
+        """
+        Stop tracking depsgraph updates and free the cache.
+        """
+        for handlers, handler in ((bpy.app.handlers.depsgraph_update_post, BoundsService.on_depsgraph_update),
+                                  (bpy.app.handlers.frame_change_post, BoundsService.on_frame_change),
+                                  (bpy.app.handlers.load_post, BoundsService.on_frame_change)):
+            if handler in handlers:
+                handlers.remove(handler)
+        BoundsService.clear()
+
+    @staticmethod
+    def clear():
+        """
+        Drop all cached bounds.
+        """
+        BoundsService._cache.clear()
+        BoundsService._generations.clear()
+
+    @staticmethod
+    def forget(objects):
+        """
+        Drop the cached bounds of objects about to be deleted, so an object reusing their memory
+        and name is not given their bounds.
+        :type objects: list
+        """
+        for obj in objects:
+            key = BoundsService.key(obj)
+            BoundsService._cache.pop(key, None)
+            BoundsService._generations.pop(key, None)
+
+    @staticmethod
+    def store(obj, world_coords):
+        """
+        Cache the bounds of an object from world-space positions that were already read elsewhere.
+        :param obj: The object the positions belong to.
+        :type obj: bpy.types.Object
+        :param world_coords: An (n, 3) array of evaluated world-space positions.
+        :type world_coords: numpy.ndarray
+        """
+        key = BoundsService.key(obj)
+        generation = BoundsService._generations.get(key, 0)
+        if len(world_coords):
+            BoundsService._cache[key] = (generation, world_coords.min(axis=0), world_coords.max(axis=0))
+        else:
+            BoundsService._cache[key] = (generation, None, None)
+
+    @staticmethod
+    def object_bounds(obj, depsgraph):
+        """
+        Get the evaluated world-space bounds of a single object.
+        :param obj: The object.
+        :type obj: bpy.types.Object
+        :param depsgraph: The evaluated depsgraph.
+        :type depsgraph: bpy.types.Depsgraph
+        :return: The min and max corners as numpy arrays, or (None, None) if the object has no geometry.
+        :rtype: tuple
+        """
+        key = BoundsService.key(obj)
+        generation = BoundsService._generations.get(key, 0)
+        cached = BoundsService._cache.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1], cached[2]
+
+        if obj.type not in BoundsService.GEOMETRY_TYPES:
+            BoundsService._cache[key] = (generation, None, None)
+            return None, None
+
+        eval_obj = obj.evaluated_get(depsgraph)
+        mesh = eval_obj.to_mesh()
+        try:
+            count = len(mesh.vertices) if mesh is not None else 0
+            coords = np.empty(count * 3, dtype=np.float32)
+            if count:
+                mesh.vertices.foreach_get("co", coords)
+        finally:
+            eval_obj.to_mesh_clear()
+        matrix = np.array(eval_obj.matrix_world, dtype=np.float64)
+        world = coords.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+        BoundsService.store(obj, world)
+        return BoundsService._cache[key][1], BoundsService._cache[key][2]
+
+    @staticmethod
+    def world_bounds(roots, depsgraph=None):
+        """
+        Get the evaluated world-space bounds of objects and all their children.
+        :param roots: The root objects, a single object is accepted too.
+        :type roots: list
+        :param depsgraph: The evaluated depsgraph, defaults to the current one.
+        :type depsgraph: bpy.types.Depsgraph
+        :return: The min and max corners as numpy arrays, or (None, None) if there is no geometry.
+        :rtype: tuple
+        """
+        if isinstance(roots, bpy.types.Object):
+            roots = [roots]
+        if depsgraph is None:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+        low = None
+        high = None
+        seen = set()
+        for root in roots:
+            for obj in [root] + list(root.children_recursive):
+                if obj.name_full in seen:
+                    continue
+                seen.add(obj.name_full)
+                obj_low, obj_high = BoundsService.object_bounds(obj, depsgraph)
+                if obj_low is None:
+                    continue
+                low = obj_low if low is None else np.minimum(low, obj_low)
+                high = obj_high if high is None else np.maximum(high, obj_high)
+        return low, high
+
+    @staticmethod
+    def dimensions(roots, depsgraph=None):
+        """
+        Get the world-space size of objects and all their children.
+        :param roots: The root objects, a single object is accepted too.
+        :type roots: list
+        :return: The size, zero if there is no geometry.
+        :rtype: mathutils.Vector
+        """
+        low, high = BoundsService.world_bounds(roots, depsgraph)
+        if low is None:
+            return Vector((0, 0, 0))
+        return Vector((high - low).tolist())
+
+    @staticmethod
+    def max_dimension(roots, depsgraph=None):
+        """
+        Get the largest world-space axis of objects and all their children.
+        :param roots: The root objects, a single object is accepted too.
+        :type roots: list
+        :return: The largest axis, 0 if there is no geometry.
+        :rtype: float
+        """
+        return max(BoundsService.dimensions(roots, depsgraph))
@@ -0,0 +1,226 @@
+import json
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
+import bpy
+import requests
+from mathutils import Vector
+
+# Local application imports
+from .aa_panel import AW_PT_AAPanel
+from .aa_type_handler import AATypeHanlder, DefaultBehaviourType
+from .api_key_manager import APIKeyManager
+from .asset_manifest import AssetManifest
+from .asset_integrity import IntegrityError
+from .aw_api_tool import AWAPITool
+from .blender_model_importer import BlenderModelImporter
+from .import_job import ImportJob
+from .model_downloader import ModelDownloader
+from .tracing import Tracer
+from .transfer_policy import RetryBudget, TransferPolicy
+from .workspace import WorkspaceManager
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class BulkResult:
+    """
+    The outcome of fetching one model ID.
+
+    Attributes:
+        model_id (str): The ID of the model.
+        data (list): The processed model JSON, None if the fetch failed.
+        workspace (JobWorkspace): The workspace the files were downloaded to.
+        error (str): Why the fetch failed, empty if it did not.
+    """
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+        self.data = None
+        self.workspace = None
+        self.error = ""
+
+
+class BulkFetch(bpy.types.Operator):
+    """
+    Operator to download and import many processed models at once, e.g. the results of a
+    night of batch uploads.
+
+    The model IDs are pasted or read from a file. Worker threads fetch the processed model
+    JSON and the files of several models at a time, all requests sharing the global connection
+    limit of TransferPolicy. A timer on the main thread imports each downloaded model into its
+    own collection, one model per tick so the UI stays responsive.
+    """
+    bl_idname = "wm.aa_bulk_fetch"
+    bl_label = "Bulk Download"
+    bl_description = "Download and import many processed models, from a list of model IDs or a file"
+
+    # Models fetched at the same time, their requests still share TransferPolicy.MAX_CONNECTIONS
+    PARALLEL_MODELS = 4
+    IMPORT_SECONDS = 0.2
+    ID_SEPARATORS = re.compile(r"[\s,;]+")
+
+    model_ids: bpy.props.StringProperty(name="Model IDs", description="Model IDs separated by commas or spaces", default="")
+    filepath: bpy.props.StringProperty(name="File", description="Text file with one model ID per line, a JSON list or a batch summary.json", subtype='FILE_PATH', default="")
+
+    _results = queue.Queue()
+    _pending = 0
+    _imported = 0
+    _failed = 0
+
+    @staticmethod
+    def parse_ids(text):
+        """
+        Split pasted text into model IDs, keeping the first occurrence of each.
+        :type text: str
+        :rtype: list
+        """
+        ids = [item.strip().strip('"\'') for item in BulkFetch.ID_SEPARATORS.split(text)]
+        return list(dict.fromkeys(item for item in ids if item))
+
+    @staticmethod
+    def read_ids(path):
+        """
+        Read model IDs from a file: a JSON list of IDs, the summary.json written by batch_cli,
+        or plain text.
+        :type path: str
+        :rtype: list
+        """
+        with open(path, 'r', encoding='utf-8') as file:
+            text = file.read()
+        try:
+            document = json.loads(text)
+        except ValueError:
+            return BulkFetch.parse_ids(text)
+        if isinstance(document, dict):
+            document = [job.get("model_id", "") for job in document.get("jobs", [])]
+        return BulkFetch.parse_ids(" ".join(str(item) for item in document))
+
+    @staticmethod
+    def fetch(api_key, model_id):
+        """
+        Get the processed model JSON and download its files. Runs on a worker thread.
+        :return: The result, queued for the import timer.
+        :rtype: BulkResult
+        """
+        result = BulkResult(model_id)
+        Tracer.set_job(model_id)
+        budget = RetryBudget(TransferPolicy.JOB_RETRY_BUDGET)
+        try:
+            response = AWAPITool.getModelProcessed(AWAPITool, api_key, model_id, budget=budget)
+            if response.status_code != 200:
+                result.error = f"not available ({response.status_code}): {response.text[:200]}"
+                return result
+            result.data = response.json()
+            result.workspace = WorkspaceManager.create("bulk")
+            downloader = ModelDownloader(result.data, result.workspace.path, model_id, budget)
+            downloader.parse_and_download()
+            AssetManifest.record(model_id, downloader)
+        except (requests.RequestException, IntegrityError, ValueError) as e:
+            result.error = str(e)
+        except Exception as e:
+            # Anything else would leave the timer waiting for this model forever
+            log.exception("Bulk download of %s failed", model_id)
+            result.error = f"{type(e).__name__}: {e}"
+        finally:
+            if result.error and result.workspace is not None:
+                result.workspace.release()
+            Tracer.set_job("")
+            BulkFetch._results.put(result)
+        return result
+
+    @staticmethod
+    def import_result(result):
+        """
+        Import a downloaded model into a collection of its own. Main thread only.
+        :type result: BulkResult
+        """
+        behaviour = AATypeHanlder.parse_behaviour_type(result.data)
+        name = result.data[0].get("name", "") if isinstance(result.data, list) and result.data else ""
+        collection_name = f"{name or 'Model'} ({result.model_id[:8]})"
+        # Every model is scaled on its own, to the default size since there is no source object
+        job = ImportJob(result.model_id, Vector((2, 2, 2)))
+        importer = BlenderModelImporter(result.workspace, blocking=True, collection_name=collection_name, job=job)
+        try:
+            if behaviour in (DefaultBehaviourType.WalkingAnimal, DefaultBehaviourType.FlyingAnimal, DefaultBehaviourType.SwimmingAnimal):
+                importer.import_models("animations", behaviour)
+            elif behaviour == DefaultBehaviourType.WheeledVehicle:
+                importer.import_models("parts", behaviour)
+            else:
+                importer.import_models("preprocessed_model", behaviour)
+        finally:
+            importer.release_workspace()
+
+    @staticmethod
+    def import_next():
+        """
+        Timer importing the downloaded models one per call.
+        :return: Seconds until the next call, None when every model was handled.
+        """
+        try:
+            result = BulkFetch._results.get_nowait()
+        except queue.Empty:
+            return BulkFetch.IMPORT_SECONDS
+        if result.error or result.workspace is None:
+            log.error("Bulk download of %s failed: %s", result.model_id, result.error or "nothing was downloaded")
+            BulkFetch._failed += 1
+        else:
+            try:
+                BulkFetch.import_result(result)
+                BulkFetch._imported += 1
+            except Exception:
+                log.exception("Import of %s failed", result.model_id)
+                BulkFetch._failed += 1
+        BulkFetch._pending -= 1
+        done = BulkFetch._imported + BulkFetch._failed
+        if BulkFetch._pending > 0:
+            AW_PT_AAPanel.message_handler(f"Bulk download: {done} of {done + BulkFetch._pending} models handled")
+            return BulkFetch.IMPORT_SECONDS
+        AW_PT_AAPanel.message_handler(f"Bulk download finished: {BulkFetch._imported} imported, {BulkFetch._failed} failed"
+                                      + (", see the log for details" if BulkFetch._failed else ""))
+        return None
+
+    def invoke(self, context, event):
+        """
+        Opens a dialog to paste the model IDs or pick a file.
+        """
+        return context.window_manager.invoke_props_dialog(self, width=400)
+
+    def execute(self, context):
+        """
+        Executes the operator to start the downloads.
+        :param context: The context in which the operator is executed.
+        :return: A dictionary indicating the status of the execution.
+        """
+        api_key = APIKeyManager.get_api_key(bpy.types.RenderEngine)
+        if APIKeyManager.api_key == "":
+            self.report({'ERROR'}, "Missing API Key")
+            return {'CANCELLED'}
+        model_ids = BulkFetch.parse_ids(self.model_ids)
+        if self.filepath:
+            try:
+                model_ids += BulkFetch.read_ids(bpy.path.abspath(self.filepath))
+            except (OSError, UnicodeDecodeError) as e:
+                self.report({'ERROR'}, "Could not read the model IDs: " + str(e))
+                return {'CANCELLED'}
+        model_ids = list(dict.fromkeys(model_ids))
+        if not model_ids:
+            self.report({'ERROR'}, "Missing Model IDs")
+            return {'CANCELLED'}
+        if bpy.app.timers.is_registered(BulkFetch.import_next):
+            self.report({'ERROR'}, "A bulk download is already running")
+            return {'CANCELLED'}
+
+        log.info("Bulk downloading %d models", len(model_ids))
+        BulkFetch._pending = len(model_ids)
+        BulkFetch._imported = 0
+        BulkFetch._failed = 0
+        executor = ThreadPoolExecutor(max_workers=BulkFetch.PARALLEL_MODELS, thread_name_prefix="aa_bulk")
+        for model_id in model_ids:
+            executor.submit(BulkFetch.fetch, api_key, model_id)
+        # Let the workers finish on their own, the timer collects the results
+        executor.shutdown(wait=False)
+        AW_PT_AAPanel.message_handler(f"Bulk download of {len(model_ids)} models started")
+        bpy.app.timers.register(BulkFetch.import_next, first_interval=BulkFetch.IMPORT_SECONDS)
+        return {'FINISHED'}
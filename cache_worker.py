@@ -0,0 +1,106 @@
+"""
+Point cache worker, run by PointCacheBake in a headless Blender on a clip written by the add-on:
+    blender -b --factory-startup <clip.blend> --python cache_worker.py -- --output <cache.abc> --meshes <json> --start 1 --end 250
+
+Exports the deformation of the meshes to Alembic. The Alembic path of every mesh is printed on stdout.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import bpy
+
+if __package__:
+    from .export_worker import link_objects
+    from .point_cache import PointCacheBake
+
+
+def parse_args(argv):
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    parser = argparse.ArgumentParser(prog="cache_worker.py")
+    parser.add_argument("--output", required=True, help="The Alembic file to write")
+    parser.add_argument("--meshes", required=True, help="JSON list of the names of the meshes to bake")
+    parser.add_argument("--start", type=int, required=True, help="First frame")
+    parser.add_argument("--end", type=int, required=True, help="Last frame")
+    parser.add_argument("--fps", type=int, default=24, help="Frame rate of the scene the cache is played in")
+    parser.add_argument("--fps-base", type=float, default=1.0, help="Frame rate base of that scene")
+    return parser.parse_args(argv)
+
+
+def object_paths(meshes, paths):
+    """
+    Find the shape written for each mesh. With a flattened hierarchy shapes are at /<object>/<mesh>,
+    with the characters Alembic does not allow in names replaced by underscores.
+    :param meshes: The baked objects.
+    :param paths: The object paths of the Alembic file.
+    :return: Object name -> path of its shape.
+    :rtype: dict
+    """
+    found = {}
+    for obj in meshes:
+        name = re.sub(r"[ .:]", "_", obj.name)
+        for path in paths:
+            parts = path.strip("/").split("/")
+            if len(parts) == 2 and parts[0] == name:
+                found[obj.name] = path
+                break
+    return found
+
+
+def main(argv):
+    """
+    Bake the meshes of the opened clip.
+    :return: The process exit code.
+    :rtype: int
+    """
+    args = parse_args(argv)
+    try:
+        PointCacheBake.report("loading", 0.1)
+        link_objects()
+        scene = bpy.context.scene
+        for obj in scene.objects:
+            # The meshes of a previous bake may have been hidden for the cache
+            obj.hide_viewport = False
+        meshes = [bpy.data.objects[name] for name in json.loads(args.meshes) if name in bpy.data.objects]
+        if not meshes:
+            PointCacheBake.report_result({"error": "The clip has no mesh to bake"})
+            return 1
+        for obj in bpy.context.view_layer.objects:
+            obj.select_set(obj in meshes)
+        bpy.context.view_layer.objects.active = meshes[0]
+        scene.frame_start = args.start
+        scene.frame_end = args.end
+        scene.render.fps = args.fps
+        scene.render.fps_base = args.fps_base
+
+        PointCacheBake.report("baking", 0.2)
+        # Only the deformed vertices are read back, the proxies keep the mesh, UVs and materials
+        bpy.ops.wm.alembic_export(filepath=args.output, start=args.start, end=args.end, selected=True,
+                                  flatten=True, uvs=False, normals=False, face_sets=False, export_hair=False,
+                                  export_particles=False, evaluation_mode='VIEWPORT')
+        if not os.path.exists(args.output):
+            PointCacheBake.report_result({"error": "The Alembic export failed"})
+            return 1
+
+        PointCacheBake.report("reading", 0.9)
+        cache = bpy.data.cache_files.load(args.output)
+        paths = object_paths(meshes, [item.path for item in cache.object_paths])
+        if not paths:
+            PointCacheBake.report_result({"error": "No baked mesh was found in the Alembic file"})
+            return 1
+        PointCacheBake.report("done", 1.0)
+        PointCacheBake.report_result({"path": args.output, "object_paths": paths})
+        return 0
+    except Exception as e:
+        PointCacheBake.report_result({"error": f"{type(e).__name__}: {e}"})
+        return 1
+
+
+if __name__ == "__main__":
+    # Run by Blender as a script: load the add-on as a package so its relative imports work
+    import importlib
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(addon_dir))
+    worker = importlib.import_module(os.path.basename(addon_dir) + ".cache_worker")
+    sys.exit(worker.main(sys.argv))
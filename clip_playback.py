@@ -0,0 +1,315 @@
+import hashlib
+import json
+import re
+import bpy
+import numpy as np
+from bpy.app.handlers import persistent
+
+from .rig_pruner import RigPruner
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class ClipPlayback:
+    """
+    Viewport performance mode for the grid of imported animation clips.
+
+    Only the clips with a selected object play. The others are drawn as bounds, their action
+    F-curves and NLA tracks are muted and their armature modifiers are turned off, so scrubbing
+    the timeline only evaluates the clips being reviewed. With sharing on, a clip identical to
+    another one (same meshes and same keys) is not hidden: its meshes show the evaluated
+    geometry of the first such clip through a geometry nodes instance, so the deformation is
+    computed once per group.
+
+    What was changed is kept in a custom property of each object, so the clips can be restored
+    after the file was saved and opened again.
+    """
+    STATE_KEY = "aa_playback"
+    CLIP_KEY = "aa_playback_clip"
+    # Set by the importer on the empty of every clip it lays out on the grid
+    TAG_KEY = "aa_clip"
+    # The node group interface API used for sharing
+    SHARE_MIN_VERSION = (4, 0, 0)
+    NODE_GROUP = "AA Shared Clip"
+    MODIFIER = "AA Shared Clip"
+    SLEEP = 'BOUNDS'
+    SHARED = 'SHARED'
+
+    enabled = False
+    share = False
+    # Names of the clips playing after the last update, None to apply again
+    _playing = None
+    # Clip name -> clip_key, computed once per activation
+    _keys = {}
+
+    @staticmethod
+    def can_share():
+        """
+        :return: True if this Blender can build the node group showing another clip.
+        :rtype: bool
+        """
+        return bpy.app.version >= ClipPlayback.SHARE_MIN_VERSION
+
+    @staticmethod
+    def armatures(clip):
+        return [obj for obj in [clip] + list(clip.children_recursive) if obj.type == 'ARMATURE']
+
+    @staticmethod
+    def tag(clip):
+        """
+        Mark the root object of an imported clip, the mode only changes tagged clips.
+        """
+        clip[ClipPlayback.TAG_KEY] = True
+
+    @staticmethod
+    def clips(scene):
+        """
+        :return: The clips imported into the scene, the tagged root objects holding an animated armature.
+        :rtype: list
+        """
+        return [obj for obj in scene.objects if obj.parent is None and obj.get(ClipPlayback.TAG_KEY) and any(
+            armature.animation_data is not None for armature in ClipPlayback.armatures(obj))]
+
+    @staticmethod
+    def clip_of(obj):
+        """
+        :return: The root object above an object.
+        """
+        while obj.parent is not None:
+            obj = obj.parent
+        return obj
+
+    @staticmethod
+    def meshes(clip):
+        """
+        :return: The deformed meshes of a clip, in an order that matches between identical clips.
+        :rtype: list
+        """
+        meshes = [obj for obj in clip.children_recursive if obj.type == 'MESH' and any(
+            modifier.type == 'ARMATURE' for modifier in obj.modifiers)]
+        return sorted(meshes, key=lambda obj: (len(obj.data.vertices), len(obj.data.polygons),
+                                                re.sub(r"\.\d+$", "", obj.name)))
+
+    @staticmethod
+    def clip_key(clip):
+        """
+        :return: A key equal for clips that deform the same meshes with the same keys.
+        :rtype: str
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for obj in ClipPlayback.meshes(clip):
+            digest.update(f"{len(obj.data.vertices)}/{len(obj.data.polygons)};".encode('utf-8'))
+        for armature in ClipPlayback.armatures(clip):
+            digest.update(f"{len(armature.data.bones)};".encode('utf-8'))
+            for action in RigPruner.actions(armature):
+                for fcurve in RigPruner.action_fcurves(action):
+                    keys = np.empty(len(fcurve.keyframe_points) * 2, dtype=np.float32)
+                    fcurve.keyframe_points.foreach_get("co", keys)
+                    digest.update(f"{fcurve.data_path}[{fcurve.array_index}]".encode('utf-8'))
+                    digest.update(keys.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def node_group():
+        """
+        :return: The geometry nodes group showing the evaluated geometry of another object.
+        :rtype: bpy.types.GeometryNodeTree
+        """
+        group = bpy.data.node_groups.get(ClipPlayback.NODE_GROUP)
+        if group is not None:
+            return group
+        group = bpy.data.node_groups.new(ClipPlayback.NODE_GROUP, 'GeometryNodeTree')
+        group.interface.new_socket("Geometry", in_out='INPUT', socket_type='NodeSocketGeometry')
+        group.interface.new_socket("Source", in_out='INPUT', socket_type='NodeSocketObject')
+        group.interface.new_socket("Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+        group_input = group.nodes.new('NodeGroupInput')
+        group_output = group.nodes.new('NodeGroupOutput')
+        info = group.nodes.new('GeometryNodeObjectInfo')
+        # The geometry of the source in its own space, placed by the transform of this object
+        info.transform_space = 'ORIGINAL'
+        info.inputs["As Instance"].default_value = True
+        group.links.new(group_input.outputs["Source"], info.inputs["Object"])
+        group.links.new(info.outputs["Geometry"], group_output.inputs["Geometry"])
+        return group
+
+    @staticmethod
+    def mode(clip):
+        return clip.get(ClipPlayback.CLIP_KEY)
+
+    @staticmethod
+    def sleep(clip, source=None):
+        """
+        Stop a clip from being evaluated on frame changes.
+        :param clip: The root object of the clip.
+        :param source: An identical playing clip to show instead of bounds, None to draw bounds.
+        """
+        source_meshes = ClipPlayback.meshes(source) if source is not None else []
+        for armature in ClipPlayback.armatures(clip):
+            fcurves = [fcurve for action in RigPruner.actions(armature) for fcurve in RigPruner.action_fcurves(action)]
+            tracks = armature.animation_data.nla_tracks if armature.animation_data is not None else []
+            state = {"display_type": armature.display_type,
+                     "fcurves": [index for index, fcurve in enumerate(fcurves) if not fcurve.mute],
+                     "tracks": [track.name for track in tracks if not track.mute]}
+            for index in state["fcurves"]:
+                fcurves[index].mute = True
+            for track in tracks:
+                track.mute = True
+            armature.display_type = 'BOUNDS'
+            armature[ClipPlayback.STATE_KEY] = json.dumps(state)
+        for index, obj in enumerate(ClipPlayback.meshes(clip)):
+            modifiers = [modifier for modifier in obj.modifiers if modifier.type == 'ARMATURE' and modifier.show_viewport]
+            state = {"display_type": obj.display_type, "modifiers": [modifier.name for modifier in modifiers]}
+            for modifier in modifiers:
+                modifier.show_viewport = False
+            if index < len(source_meshes):
+                group = ClipPlayback.node_group()
+                modifier = obj.modifiers.new(ClipPlayback.MODIFIER, 'NODES')
+                modifier.node_group = group
+                modifier[group.interface.items_tree["Source"].identifier] = source_meshes[index]
+                state["shared"] = modifier.name
+            else:
+                obj.display_type = 'BOUNDS'
+            obj[ClipPlayback.STATE_KEY] = json.dumps(state)
+        clip[ClipPlayback.CLIP_KEY] = ClipPlayback.SHARED if source_meshes else ClipPlayback.SLEEP
+
+    @staticmethod
+    def wake(obj):
+        """
+        Undo what sleep changed on an object.
+        """
+        if ClipPlayback.CLIP_KEY in obj:
+            del obj[ClipPlayback.CLIP_KEY]
+        state = obj.get(ClipPlayback.STATE_KEY)
+        if state is None:
+            return
+        del obj[ClipPlayback.STATE_KEY]
+        state = json.loads(state)
+        obj.display_type = state["display_type"]
+        if obj.type == 'ARMATURE':
+            fcurves = [fcurve for action in RigPruner.actions(obj) for fcurve in RigPruner.action_fcurves(action)]
+            for index in state["fcurves"]:
+                if index < len(fcurves):
+                    fcurves[index].mute = False
+            if obj.animation_data is not None:
+                for name in state["tracks"]:
+                    track = obj.animation_data.nla_tracks.get(name)
+                    if track is not None:
+                        track.mute = False
+            return
+        for name in state["modifiers"]:
+            modifier = obj.modifiers.get(name)
+            if modifier is not None:
+                modifier.show_viewport = True
+        shared = obj.modifiers.get(state.get("shared", ""))
+        if shared is not None:
+            obj.modifiers.remove(shared)
+
+    @staticmethod
+    def wake_clip(clip):
+        for obj in [clip] + list(clip.children_recursive):
+            ClipPlayback.wake(obj)
+
+    @staticmethod
+    def apply(scene, playing):
+        """
+        Put every clip of the scene in the state it should have.
+        :param playing: Names of the clips that play normally.
+        :type playing: set
+        """
+        clips = ClipPlayback.clips(scene)
+        sources = {}
+        if ClipPlayback.share:
+            # The first clip of every group of identical clips keeps playing for the others
+            for clip in clips:
+                if clip.name not in ClipPlayback._keys:
+                    ClipPlayback._keys[clip.name] = ClipPlayback.clip_key(clip)
+                sources.setdefault(ClipPlayback._keys[clip.name], clip)
+        for clip in clips:
+            source = sources.get(ClipPlayback._keys.get(clip.name)) if ClipPlayback.share else None
+            if clip.name in playing or source is clip:
+                ClipPlayback.wake_clip(clip)
+                continue
+            wanted = ClipPlayback.SHARED if source is not None else ClipPlayback.SLEEP
+            if ClipPlayback.mode(clip) != wanted:
+                ClipPlayback.wake_clip(clip)
+                ClipPlayback.sleep(clip, source)
+        log.debug("Playback mode: %d of %d clips playing", sum(1 for clip in clips if ClipPlayback.mode(clip) is None), len(clips))
+
+    @staticmethod
+    def playing_clips(context):
+        return {ClipPlayback.clip_of(obj).name for obj in context.selected_objects}
+
+    @staticmethod
+    def set_enabled(enabled, share=None):
+        """
+        Turn the mode on or off for the current scene.
+        :param share: Share the evaluated meshes of identical clips, unchanged when None.
+        :type share: bool
+        """
+        if share is not None:
+            if share and not ClipPlayback.can_share():
+                log.warning("Sharing identical clips needs Blender %s or newer", ".".join(map(str, ClipPlayback.SHARE_MIN_VERSION)))
+                share = False
+            ClipPlayback.share = share
+        ClipPlayback.enabled = enabled
+        ClipPlayback._playing = None
+        ClipPlayback._keys.clear()
+        if enabled:
+            # Sharing may have changed, start from the original state
+            ClipPlayback.restore_all()
+            ClipPlayback.update(bpy.context)
+        else:
+            ClipPlayback.restore_all()
+
+    @staticmethod
+    def update(context):
+        """
+        Apply the mode if the selected clips changed.
+        """
+        playing = ClipPlayback.playing_clips(context)
+        if playing == ClipPlayback._playing:
+            return
+        ClipPlayback._playing = playing
+        ClipPlayback.apply(context.scene, playing)
+
+    @staticmethod
+    def restore_all():
+        """
+        Restore every object changed by the mode, in all scenes.
+        """
+        for obj in bpy.data.objects:
+            ClipPlayback.wake(obj)
+
+    @staticmethod
+    @persistent
+    def on_depsgraph_update(scene, depsgraph):
+        """
+        Selection changes update the depsgraph, play the newly selected clips.
+        """
+        if ClipPlayback.enabled and bpy.context.view_layer is not None:
+            ClipPlayback.update(bpy.context)
+
+    @staticmethod
+    @persistent
+    def on_load(*args):
+        """
+        The mode is off in a newly opened file, restore clips saved while it was on.
+        """
+        ClipPlayback.enabled = False
+        ClipPlayback._playing = None
+        ClipPlayback.restore_all()
+
+    @staticmethod
+    def register():
+        bpy.app.handlers.depsgraph_update_post.append(ClipPlayback.on_depsgraph_update)
+        bpy.app.handlers.load_post.append(ClipPlayback.on_load)
+
+    @staticmethod
+    def unregister():
+        for handlers, handler in ((bpy.app.handlers.depsgraph_update_post, ClipPlayback.on_depsgraph_update),
+                                  (bpy.app.handlers.load_post, ClipPlayback.on_load)):
+            if handler in handlers:
+                handlers.remove(handler)
+        if ClipPlayback.enabled:
+            ClipPlayback.set_enabled(False)
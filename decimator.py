@@ -0,0 +1,295 @@
+import bpy
+import numpy as np
+from mathutils.kdtree import KDTree
+
+from .preflight import Preflight
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class DecimationResult:
+    """
+    The proxies created for an over-budget hierarchy and the data needed to map them back.
+
+    Attributes:
+        collection (bpy.types.Collection): Temporary collection holding the proxies.
+        proxies (list): The proxy objects, in hierarchy order.
+        vertex_map (dict): Original object name -> (proxy name, numpy array with the nearest
+            proxy vertex for every vertex of the original mesh).
+        proxy_coords (dict): Proxy name -> numpy array of the proxy vertex positions (world space).
+        vertex_count (int): Total vertex count of the proxies.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.proxies = []
+        self.vertex_map = {}
+        self.proxy_coords = {}
+        self.vertex_count = 0
+
+
+class MeshDecimator:
+    """
+    Builds reduced proxies of an export hierarchy so over-budget models can still be rigged.
+    The proxies are made from evaluated copies, so the original objects and meshes are never modified.
+    """
+    PROXY_COLLECTION = "AA Decimation Proxies"
+    PRESERVE_GROUP = "aa_preserve"
+    # Aim a little below the budget, the collapse does not hit the ratio exactly
+    BUDGET_MARGIN = 0.95
+    MAX_PASSES = 4
+
+    def __init__(self, vertex_budget=100000, symmetry=False):
+        self.vertex_budget = vertex_budget
+        self.symmetry = symmetry
+
+    def create_proxies(self, roots, depsgraph=None):
+        """
+        Create decimated proxies for every mesh in the export hierarchy.
+        :param roots: The objects selected for export.
+        :type roots: list
+        :param depsgraph: The depsgraph used to evaluate modifiers, defaults to the current one.
+        :type depsgraph: bpy.types.Depsgraph
+        :return: The proxies and their vertex mapping.
+        :rtype: DecimationResult
+        """
+        if depsgraph is None:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+
+        collection = bpy.data.collections.new(self.PROXY_COLLECTION)
+        bpy.context.scene.collection.children.link(collection)
+        result = DecimationResult(collection)
+
+        originals = {}
+        for obj in Preflight().collect_hierarchy(roots):
+            if obj.type != 'MESH':
+                continue
+            eval_obj = obj.evaluated_get(depsgraph)
+            mesh = bpy.data.meshes.new_from_object(eval_obj, preserve_all_data_layers=True, depsgraph=depsgraph)
+            mesh.transform(eval_obj.matrix_world)
+            # The mapping is kept against the original (unevaluated) vertices, those are the ones that get weights
+            matrix = np.array(obj.matrix_world, dtype=np.float64)
+            original_coords = self.get_coords(obj.data) @ matrix[:3, :3].T + matrix[:3, 3]
+            proxy = bpy.data.objects.new(obj.name + "_proxy", mesh)
+            for slot_index, slot in enumerate(obj.material_slots):
+                if slot_index < len(proxy.material_slots):
+                    proxy.material_slots[slot_index].material = slot.material
+            collection.objects.link(proxy)
+            originals[proxy.name] = (obj.name, original_coords)
+            self.add_preserve_group(proxy)
+            result.proxies.append(proxy)
+
+        total = sum(len(proxy.data.vertices) for proxy in result.proxies)
+        ratio = min(1.0, self.vertex_budget * self.BUDGET_MARGIN / max(total, 1))
+        for _ in range(self.MAX_PASSES):
+            for proxy in result.proxies:
+                self.decimate(proxy, ratio)
+            total = sum(len(proxy.data.vertices) for proxy in result.proxies)
+            if total <= self.vertex_budget:
+                break
+            ratio = self.vertex_budget * self.BUDGET_MARGIN / total
+
+        for proxy in result.proxies:
+            original_name, original_coords = originals[proxy.name]
+            proxy_coords = self.get_coords(proxy.data)
+            result.vertex_map[original_name] = (proxy.name, self.nearest_indices(proxy_coords, original_coords))
+            result.proxy_coords[proxy.name] = proxy_coords
+        result.vertex_count = total
+        log.info("Decimated %d meshes to %d vertices (budget %d)", len(result.proxies), total, self.vertex_budget)
+        return result
+
+    def remove_proxies(self, result):
+        """
+        Delete the proxy objects, their meshes and the temporary collection.
+        :param result: The result returned by create_proxies.
+        :type result: DecimationResult
+        """
+        for proxy in result.proxies:
+            mesh = proxy.data
+            bpy.data.objects.remove(proxy, do_unlink=True)
+            if mesh.users == 0:
+                bpy.data.meshes.remove(mesh)
+        result.proxies = []
+        bpy.data.collections.remove(result.collection)
+
+    def add_preserve_group(self, proxy):
+        """
+        Flag the silhouette (open borders) and the UV seams of a proxy so the collapse keeps them.
+        :param proxy: The proxy object.
+        :type proxy: bpy.types.Object
+        """
+        mesh = proxy.data
+        edge_count = len(mesh.edges)
+        if edge_count == 0:
+            return
+        edge_vertices = np.empty(edge_count * 2, dtype=np.int32)
+        mesh.edges.foreach_get("vertices", edge_vertices)
+        seams = np.empty(edge_count, dtype=bool)
+        mesh.edges.foreach_get("use_seam", seams)
+
+        loop_edges = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("edge_index", loop_edges)
+        faces_per_edge = np.bincount(loop_edges, minlength=edge_count)
+
+        keep = seams | (faces_per_edge == 1)
+        indices = np.unique(edge_vertices.reshape(-1, 2)[keep])
+        group = proxy.vertex_groups.new(name=self.PRESERVE_GROUP)
+        if len(indices):
+            group.add(indices.tolist(), 1.0, 'REPLACE')
+
+    def decimate(self, proxy, ratio):
+        """
+        Collapse a proxy mesh in place.
+        :param proxy: The proxy object.
+        :type proxy: bpy.types.Object
+        :param ratio: The fraction of faces to keep.
+        :type ratio: float
+        """
+        modifier = proxy.modifiers.new(name="AA Decimate", type='DECIMATE')
+        modifier.decimate_type = 'COLLAPSE'
+        modifier.ratio = ratio
+        modifier.use_collapse_triangulate = False
+        # The collapse removes weighted vertices first, invert so the flagged vertices survive
+        modifier.vertex_group = self.PRESERVE_GROUP
+        modifier.invert_vertex_group = True
+        modifier.vertex_group_factor = 10.0
+        if self.symmetry:
+            modifier.use_symmetry = True
+            modifier.symmetry_axis = 'X'
+
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        depsgraph.update()
+        old_mesh = proxy.data
+        new_mesh = bpy.data.meshes.new_from_object(proxy.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph)
+        proxy.modifiers.remove(modifier)
+        proxy.data = new_mesh
+        bpy.data.meshes.remove(old_mesh)
+
+    def get_coords(self, mesh):
+        """
+        Read the vertex positions of a mesh into a numpy array.
+        :param mesh: The mesh.
+        :type mesh: bpy.types.Mesh
+        :return: An (n, 3) array.
+        :rtype: numpy.ndarray
+        """
+        coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", coords)
+        return coords.reshape(-1, 3)
+
+    def nearest_indices(self, target_coords, query_coords):
+        """
+        Find, for every query position, the index of the nearest target position.
+        :param target_coords: An (n, 3) array of positions to search in.
+        :type target_coords: numpy.ndarray
+        :param query_coords: An (m, 3) array of positions to look up.
+        :type query_coords: numpy.ndarray
+        :return: An array of m indices into target_coords.
+        :rtype: numpy.ndarray
+        """
+        tree = KDTree(len(target_coords))
+        for index, co in enumerate(target_coords.tolist()):
+            tree.insert(co, index)
+        tree.balance()
+        return np.fromiter((tree.find(co)[1] for co in query_coords.tolist()), dtype=np.int32, count=len(query_coords))
+
+    def transfer_rig(self, result, original, rigged):
+        """
+        Copy the vertex groups of a returned rigged proxy to the full-resolution original
+        and deform it with the same armature.
+        The returned mesh may be scaled and re-indexed by the service, so both sides are
+        matched through their normalised bounds before the stored vertex map is applied.
+        :param result: The result returned by create_proxies when the model was sent.
+        :type result: DecimationResult
+        :param original: The full-resolution mesh object.
+        :type original: bpy.types.Object
+        :param rigged: The rigged mesh object returned by the service.
+        :type rigged: bpy.types.Object
+        :return: True if the rig was transferred.
+        :rtype: bool
+        """
+        if original.name not in result.vertex_map:
+            log.warning("No decimation mapping stored for '%s'", original.name)
+            return False
+        proxy_name, original_to_proxy = result.vertex_map[original.name]
+        if len(original_to_proxy) != len(original.data.vertices):
+            log.warning("'%s' changed since it was decimated", original.name)
+            return False
+
+        # Both sides are normalised with the bounds of their whole hierarchy, a single mesh of a
+        # multi-mesh model does not fill the same box as the model
+        rigged_coords = self.world_coords(rigged)
+        rigged_root = rigged
+        while rigged_root.parent is not None:
+            rigged_root = rigged_root.parent
+        rigged_bounds = self.bounds([self.world_coords(obj) for obj in [rigged_root] + list(rigged_root.children_recursive)
+                                     if obj.type == 'MESH' and len(obj.data.vertices)])
+        proxy_bounds = self.bounds(list(result.proxy_coords.values()))
+        proxy_to_rigged = self.nearest_indices(self.normalise(rigged_coords, *rigged_bounds),
+                                               self.normalise(result.proxy_coords[proxy_name], *proxy_bounds))
+        original_to_rigged = proxy_to_rigged[original_to_proxy]
+
+        # The rigged proxy is within the vertex budget, reading its weights vertex by vertex is cheap
+        weights = np.zeros((len(rigged.vertex_groups), len(rigged.data.vertices)), dtype=np.float32)
+        for vertex in rigged.data.vertices:
+            for element in vertex.groups:
+                weights[element.group, vertex.index] = element.weight
+
+        for group in rigged.vertex_groups:
+            column = weights[group.index][original_to_rigged]
+            indices = np.flatnonzero(column)
+            if len(indices) == 0:
+                continue
+            target = original.vertex_groups.get(group.name) or original.vertex_groups.new(name=group.name)
+            # One add call per distinct weight, the indices grouped in a single sort
+            values, inverse = np.unique(column[indices], return_inverse=True)
+            order = np.argsort(inverse, kind='stable')
+            for weight, group_indices in zip(values, np.split(indices[order], np.cumsum(np.bincount(inverse))[:-1])):
+                target.add(group_indices.tolist(), float(weight), 'REPLACE')
+
+        for modifier in rigged.modifiers:
+            if modifier.type == 'ARMATURE' and modifier.object is not None:
+                armature = next((existing for existing in original.modifiers if existing.type == 'ARMATURE'), None)
+                if armature is None:
+                    armature = original.modifiers.new(name="Armature", type='ARMATURE')
+                armature.object = modifier.object
+                break
+        return True
+
+    def world_coords(self, obj):
+        """
+        :return: The world-space vertex positions of a mesh object, an (n, 3) array.
+        :rtype: numpy.ndarray
+        """
+        matrix = np.array(obj.matrix_world, dtype=np.float64)
+        return self.get_coords(obj.data) @ matrix[:3, :3].T + matrix[:3, 3]
+
+    def bounds(self, coords_list):
+        """
+        Get the combined bounding box of several position arrays.
+        :param coords_list: (n, 3) arrays of positions.
+        :type coords_list: list
+        :return: The low corner and the size of the largest side.
+        :rtype: tuple
+        """
+        coords_list = [coords for coords in coords_list if len(coords)]
+        if not coords_list:
+            return np.zeros(3), 1.0
+        low = np.min([coords.min(axis=0) for coords in coords_list], axis=0)
+        high = np.max([coords.max(axis=0) for coords in coords_list], axis=0)
+        return low, float((high - low).max()) or 1.0
+
+    def normalise(self, coords, low=None, size=None):
+        """
+        Move positions into a unit bounding box so differently scaled copies can be matched.
+        :param coords: An (n, 3) array of positions.
+        :type coords: numpy.ndarray
+        :param low: The low corner of the box, defaults to the bounds of the positions.
+        :param size: The largest side of the box, defaults to the bounds of the positions.
+        :return: The normalised positions.
+        :rtype: numpy.ndarray
+        """
+        if low is None:
+            low, size = self.bounds([coords])
+        return (coords - low) / size
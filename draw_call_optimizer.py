@@ -0,0 +1,434 @@
+import hashlib
+import os
+import re
+import bpy
+import numpy as np
+
+from .aa_panel import AW_PT_AAPanel
+from .tracing import Tracer
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class OptimizationStats:
+    """
+    What a draw-call reduction pass changed.
+
+    Attributes:
+        objects_before (int): Mesh objects before the pass.
+        objects_after (int): Mesh objects after the pass.
+        draw_calls_before (int): Material slots over all mesh objects before the pass.
+        draw_calls_after (int): Material slots over all mesh objects after the pass.
+        merged_materials (int): Duplicate materials replaced by an identical one.
+        atlases (int): Texture atlases created.
+    """
+
+    def __init__(self):
+        self.objects_before = 0
+        self.objects_after = 0
+        self.draw_calls_before = 0
+        self.draw_calls_after = 0
+        self.merged_materials = 0
+        self.atlases = 0
+
+    def summary(self):
+        return (f"{self.objects_before} -> {self.objects_after} objects, {self.draw_calls_before} -> "
+                f"{self.draw_calls_after} draw calls, {self.merged_materials} materials merged, {self.atlases} atlases")
+
+
+class DrawCallOptimizer:
+    """
+    Reduces the objects and materials of an imported multi-part model, so the viewport draws it
+    with fewer calls.
+
+    - Identical materials (same nodes, values and image contents) are replaced by one of them.
+    - Mesh parts that do not move on their own are joined into one object per root. Parts with
+      animation, constraints, drivers, shape keys or an armature, parts named like pivoting
+      parts (wheels, doors, rotors...) and everything below them stay separate objects.
+    - Optionally, materials that only differ by their base color image are merged into one
+      material using a texture atlas, with the UVs moved into the atlas.
+    """
+    # Parts that usually rotate around their own pivot, e.g. when a vehicle is rigged
+    PIVOT_NAMES = re.compile(r"wheel|tire|tyre|axle|rotor|propeller|door|hinge|steer|turret|blade|pivot", re.IGNORECASE)
+    MAX_ATLAS_SIZE = 4096
+    ATLAS_PADDING = 2
+    # UVs outside [0, 1] by more than this tile the texture, an atlas cannot represent them
+    UV_TOLERANCE = 1e-3
+
+    def __init__(self, atlas=False):
+        """
+        :param atlas: Also merge textured materials into atlases.
+        :type atlas: bool
+        """
+        self.atlas = atlas
+        self.stats = OptimizationStats()
+
+    @staticmethod
+    def socket_value(value):
+        """
+        :return: A comparable form of a socket default value.
+        """
+        if isinstance(value, str):
+            return value
+        try:
+            return tuple(round(float(item), 5) for item in value)
+        except (TypeError, ValueError):
+            pass
+        try:
+            return round(float(value), 5)
+        except (TypeError, ValueError):
+            return str(value)
+
+    @staticmethod
+    def image_signature(image, image_keys=None):
+        """
+        Describe the contents of an image, independently of its name: every part GLB imports
+        its own copy of a shared texture.
+        :param image: The image.
+        :param image_keys: Image pointer -> signature, so packed data is hashed once per pass.
+        :type image_keys: dict
+        :rtype: tuple
+        """
+        if image_keys is not None and image.as_pointer() in image_keys:
+            return image_keys[image.as_pointer()]
+        if image.packed_file is not None:
+            data = image.packed_file.data
+            source = ("packed", image.packed_file.size, hashlib.blake2b(data, digest_size=16).hexdigest())
+        else:
+            source = ("file", os.path.normcase(os.path.normpath(bpy.path.abspath(image.filepath, library=image.library))))
+        signature = source + (tuple(image.size), image.colorspace_settings.name, image.alpha_mode)
+        if image_keys is not None:
+            image_keys[image.as_pointer()] = signature
+        return signature
+
+    @staticmethod
+    def material_signature(material, ignore_images=False, image_keys=None):
+        """
+        Describe what a material renders like, independently of its name.
+        :param material: The material.
+        :param ignore_images: Leave the images of the texture nodes out, to find atlas candidates.
+        :type ignore_images: bool
+        :param image_keys: Cache of image_signature, shared over the materials of a pass.
+        :type image_keys: dict
+        :rtype: tuple
+        """
+        signature = [material.blend_method, DrawCallOptimizer.socket_value(material.diffuse_color),
+                     material.use_backface_culling]
+        if material.use_nodes and material.node_tree is not None:
+            for node in sorted(material.node_tree.nodes, key=lambda item: item.name):
+                image = ()
+                if node.type == 'TEX_IMAGE':
+                    image = () if ignore_images or node.image is None else DrawCallOptimizer.image_signature(node.image, image_keys)
+                    signature.append((node.interpolation, node.extension))
+                signature.append((node.name, node.bl_idname, image, tuple(
+                    DrawCallOptimizer.socket_value(getattr(socket, "default_value", ""))
+                    for socket in node.inputs if not socket.is_linked)))
+            signature.append(tuple(sorted(
+                (link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier)
+                for link in material.node_tree.links)))
+        return tuple(signature)
+
+    @staticmethod
+    def hierarchy(root):
+        """
+        :return: The root and all its children.
+        :rtype: list
+        """
+        return [root] + list(root.children_recursive)
+
+    @staticmethod
+    def moves_on_its_own(obj):
+        """
+        Check whether an object must stay separate because it moves or deforms independently.
+        :rtype: bool
+        """
+        if DrawCallOptimizer.PIVOT_NAMES.search(obj.name):
+            return True
+        animation = obj.animation_data
+        if animation is not None and (animation.action is not None or len(animation.nla_tracks) or len(animation.drivers)):
+            return True
+        if len(obj.constraints) or (obj.parent is not None and obj.parent.type == 'ARMATURE'):
+            return True
+        if obj.type == 'MESH':
+            if obj.data.shape_keys is not None:
+                return True
+            if any(modifier.type == 'ARMATURE' for modifier in obj.modifiers):
+                return True
+        return False
+
+    @staticmethod
+    def count(objects):
+        """
+        :return: The number of mesh objects and of their material slots.
+        :rtype: tuple
+        """
+        meshes = [obj for obj in objects if obj.type == 'MESH']
+        return len(meshes), sum(max(1, len(obj.material_slots)) for obj in meshes)
+
+    def optimize(self, roots):
+        """
+        Run the pass on imported models. Main thread only.
+        :param roots: The root objects of the imported models, each is optimized on its own.
+        :type roots: list
+        :return: What changed.
+        :rtype: OptimizationStats
+        """
+        roots = [root for root in roots if root is not None and root.name in bpy.data.objects]
+        objects = [obj for root in roots for obj in DrawCallOptimizer.hierarchy(root)]
+        self.stats.objects_before, self.stats.draw_calls_before = DrawCallOptimizer.count(objects)
+        with Tracer.span("optimize draw calls", objects=len(objects)):
+            self.merge_materials(objects)
+            targets = [self.join_static_parts(root) for root in roots]
+            for root in roots:
+                for obj in DrawCallOptimizer.hierarchy(root):
+                    if obj.type == 'MESH':
+                        DrawCallOptimizer.dedupe_slots(obj)
+            if self.atlas:
+                for target in targets:
+                    if target is not None:
+                        self.build_atlases(target)
+        objects = [obj for root in roots for obj in DrawCallOptimizer.hierarchy(root)]
+        self.stats.objects_after, self.stats.draw_calls_after = DrawCallOptimizer.count(objects)
+        log.info("Draw-call reduction: %s", self.stats.summary())
+        return self.stats
+
+    def merge_materials(self, objects):
+        """
+        Point every slot using a duplicate material to the first identical one and remove the
+        duplicates that are no longer used.
+        """
+        canonical = {}
+        replaced = set()
+        image_keys = {}
+        for obj in objects:
+            if obj.type != 'MESH':
+                continue
+            for slot in obj.material_slots:
+                material = slot.material
+                if material is None:
+                    continue
+                first = canonical.setdefault(DrawCallOptimizer.material_signature(material, image_keys=image_keys), material)
+                if first is not material:
+                    slot.material = first
+                    replaced.add(material)
+        for material in replaced:
+            if material.users == 0:
+                bpy.data.materials.remove(material)
+        self.stats.merged_materials += len(replaced)
+
+    @staticmethod
+    def dedupe_slots(obj):
+        """
+        Merge the material slots of a mesh that use the same material, remapping its faces.
+        """
+        mesh = obj.data
+        materials = list(mesh.materials)
+        unique = list(dict.fromkeys(materials))
+        if len(unique) == len(materials) or any(slot.link == 'OBJECT' for slot in obj.material_slots):
+            return
+        remap = np.array([unique.index(material) for material in materials], dtype=np.int32)
+        indices = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get("material_index", indices)
+        indices = remap[np.clip(indices, 0, len(remap) - 1)]
+        mesh.materials.clear()
+        for material in unique:
+            mesh.materials.append(material)
+        mesh.polygons.foreach_set("material_index", indices)
+        mesh.update()
+
+    def join_static_parts(self, root):
+        """
+        Join the mesh parts of a model that do not move on their own into a single object.
+        :param root: The root object of the model.
+        :return: The object the parts were joined into, None if nothing was joined.
+        :rtype: bpy.types.Object
+        """
+        joinable = []
+        stack = [root]
+        while stack:
+            obj = stack.pop()
+            if DrawCallOptimizer.moves_on_its_own(obj):
+                # The part and everything attached to it keep their own transform
+                continue
+            if obj.type == 'MESH':
+                joinable.append(obj)
+            stack.extend(obj.children)
+        if len(joinable) < 2:
+            return joinable[0] if joinable else None
+        target = root if root in joinable else joinable[0]
+        sources = [obj for obj in joinable if obj is not target]
+        # Parts staying separate keep their place when their parent is joined away
+        for source in sources:
+            for child in source.children:
+                if child not in sources:
+                    world = child.matrix_world.copy()
+                    child.parent = target
+                    child.matrix_world = world
+        with Tracer.span("join parts", root=root.name, parts=len(joinable)):
+            with bpy.context.temp_override(active_object=target, object=target, selected_objects=joinable,
+                                           selected_editable_objects=joinable):
+                bpy.ops.object.join()
+        return target
+
+    @staticmethod
+    def atlas_image(material):
+        """
+        Get the image of a material that can go in an atlas: one image texture, read with the
+        default UVs, feeding the base color.
+        :return: The image, None if the material does not qualify.
+        :rtype: bpy.types.Image
+        """
+        if material is None or not material.use_nodes or material.node_tree is None:
+            return None
+        textures = [node for node in material.node_tree.nodes if node.type == 'TEX_IMAGE']
+        if len(textures) != 1 or textures[0].image is None or textures[0].inputs["Vector"].is_linked:
+            return None
+        if not any(link.to_socket.name == "Base Color" for link in textures[0].outputs["Color"].links):
+            return None
+        image = textures[0].image
+        return image if image.size[0] > 0 and image.size[1] > 0 else None
+
+    @staticmethod
+    def pack_rectangles(sizes, padding, max_size):
+        """
+        Place rectangles on shelves in the smallest power of two square-ish atlas.
+        :param sizes: (width, height) of each rectangle.
+        :return: The atlas (width, height) and the (x, y) of each rectangle, None if they do not fit.
+        :rtype: tuple
+        """
+        order = sorted(range(len(sizes)), key=lambda index: -sizes[index][1])
+        area = sum((width + padding * 2) * (height + padding * 2) for width, height in sizes)
+        atlas_width = 1
+        while atlas_width * atlas_width < area or atlas_width < max(width for width, _ in sizes) + padding * 2:
+            atlas_width *= 2
+        while atlas_width <= max_size:
+            positions = [None] * len(sizes)
+            x = y = shelf_height = 0
+            for index in order:
+                width, height = sizes[index]
+                if x + width + padding * 2 > atlas_width:
+                    x, y, shelf_height = 0, y + shelf_height, 0
+                positions[index] = (x + padding, y + padding)
+                x += width + padding * 2
+                shelf_height = max(shelf_height, height + padding * 2)
+            atlas_height = 1
+            while atlas_height < y + shelf_height:
+                atlas_height *= 2
+            if atlas_height <= max_size:
+                return (atlas_width, atlas_height), positions
+            atlas_width *= 2
+        return None
+
+    def build_atlases(self, obj):
+        """
+        Merge the materials of a mesh that only differ by their base color image into one material
+        per group, with the images copied into an atlas and the UVs moved to match.
+        """
+        mesh = obj.data
+        uv_layer = mesh.uv_layers.active
+        if uv_layer is None:
+            return
+        materials = list(mesh.materials)
+        groups = {}
+        for index, material in enumerate(materials):
+            if DrawCallOptimizer.atlas_image(material) is not None:
+                groups.setdefault(DrawCallOptimizer.material_signature(material, ignore_images=True), []).append(index)
+
+        polygon_count = len(mesh.polygons)
+        material_indices = np.empty(polygon_count, dtype=np.int32)
+        mesh.polygons.foreach_get("material_index", material_indices)
+        loop_starts = np.empty(polygon_count, dtype=np.int32)
+        loop_totals = np.empty(polygon_count, dtype=np.int32)
+        mesh.polygons.foreach_get("loop_start", loop_starts)
+        mesh.polygons.foreach_get("loop_total", loop_totals)
+        # Loops are stored polygon after polygon
+        order = np.argsort(loop_starts)
+        loop_materials = np.repeat(material_indices[order], loop_totals[order])
+        uvs = np.empty(len(uv_layer.data) * 2, dtype=np.float32)
+        uv_layer.data.foreach_get("uv", uvs)
+        uvs = uvs.reshape(-1, 2)
+
+        built = 0
+        for indices in groups.values():
+            images = list(dict.fromkeys(DrawCallOptimizer.atlas_image(materials[index]) for index in indices))
+            if len(indices) < 2 or len(images) < 2:
+                continue
+            selected = np.isin(loop_materials, indices)
+            group_uvs = uvs[selected]
+            if len(group_uvs) and (group_uvs.min() < -self.UV_TOLERANCE or group_uvs.max() > 1 + self.UV_TOLERANCE):
+                log.debug("Not building an atlas for %s, its UVs repeat the texture", obj.name)
+                continue
+            packed = DrawCallOptimizer.pack_rectangles([tuple(image.size) for image in images],
+                                                       self.ATLAS_PADDING, self.MAX_ATLAS_SIZE)
+            if packed is None:
+                log.debug("Not building an atlas for %s, the images do not fit in %d pixels", obj.name, self.MAX_ATLAS_SIZE)
+                continue
+            (atlas_width, atlas_height), positions = packed
+            with Tracer.span("build atlas", object=obj.name, images=len(images)):
+                atlas_pixels = np.zeros((atlas_height, atlas_width, 4), dtype=np.float32)
+                for image, (x, y) in zip(images, positions):
+                    width, height = image.size
+                    pixels = np.empty(width * height * 4, dtype=np.float32)
+                    image.pixels.foreach_get(pixels)
+                    atlas_pixels[y:y + height, x:x + width] = pixels.reshape(height, width, 4)
+                atlas = bpy.data.images.new(f"{obj.name}_atlas", atlas_width, atlas_height, alpha=True)
+                atlas.colorspace_settings.name = images[0].colorspace_settings.name
+                atlas.pixels.foreach_set(atlas_pixels.ravel())
+                # Generated images are not saved with the file unless packed
+                atlas.pack()
+
+            # Move the UVs of every material of the group into the rectangle of its image
+            rectangles = {image: position for image, position in zip(images, positions)}
+            for index in indices:
+                image = DrawCallOptimizer.atlas_image(materials[index])
+                x, y = rectangles[image]
+                width, height = image.size
+                loops = loop_materials == index
+                uvs[loops, 0] = (x + uvs[loops, 0] * width) / atlas_width
+                uvs[loops, 1] = (y + uvs[loops, 1] * height) / atlas_height
+
+            atlas_material = materials[indices[0]].copy()
+            atlas_material.name = f"{obj.name}_atlas"
+            for node in atlas_material.node_tree.nodes:
+                if node.type == 'TEX_IMAGE':
+                    node.image = atlas
+            for index in indices:
+                materials[index] = atlas_material
+            built += 1
+
+        self.stats.atlases += built
+        if not built:
+            return
+        uv_layer.data.foreach_set("uv", uvs.ravel())
+        mesh.materials.clear()
+        for material in materials:
+            mesh.materials.append(material)
+        DrawCallOptimizer.dedupe_slots(obj)
+
+
+class OptimizeDrawCalls(bpy.types.Operator):
+    """
+    Operator to run the draw-call reduction pass on the selected models.
+    """
+    bl_idname = "object.aa_optimize_draw_calls"
+    bl_label = "Reduce Draw Calls"
+    bl_description = "Join the parts that do not move on their own and merge identical materials of the selected models"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    atlas: bpy.props.BoolProperty(name="Texture Atlas", default=False, description="Also merge materials that only differ by their image into a texture atlas")
+
+    def execute(self, context):
+        """
+        Executes the operator on the selected objects.
+        :param context: The context in which the operator is executed.
+        :return: A dictionary indicating the status of the execution.
+        """
+        selected = set(context.selected_objects)
+        roots = [obj for obj in selected if not any(parent in selected for parent in obj.parent_recursive)]
+        if not roots:
+            self.report({'ERROR'}, "Select the models to optimize")
+            return {'CANCELLED'}
+        stats = DrawCallOptimizer(self.atlas).optimize(roots)
+        AW_PT_AAPanel.message_handler("Draw calls reduced: " + stats.summary())
+        return {'FINISHED'}
@@ -0,0 +1,100 @@
+"""
+Export and upload worker, run by BackgroundExport in a headless Blender:
+    blender -b --factory-startup <selection.blend> --python export_worker.py -- --workspace <dir> --name <model> --upload <json>
+
+The API key is read from $AA_API_KEY. Progress and the upload response are printed on stdout.
+"""
+import argparse
+import json
+import os
+import sys
+import bpy
+
+if __package__:
+    from .aw_api_tool import AWAPITool
+    from .background_export import BackgroundExport
+    from .exporter import Exporter
+    from .transfer_policy import RetryBudget
+
+
+def parse_args(argv):
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    parser = argparse.ArgumentParser(prog="export_worker.py")
+    parser.add_argument("--workspace", required=True, help="Directory of the exported GLB")
+    parser.add_argument("--name", required=True, help="Name of the exported file and of the root object")
+    parser.add_argument("--roots", default="[]", help="JSON list of the names of the selected objects, all objects without a parent when empty")
+    parser.add_argument("--upload", required=True, help="JSON of the upload fields")
+    return parser.parse_args(argv)
+
+
+def link_objects(root_names=None):
+    """
+    The written .blend holds the objects without a scene, link them to the scene and select the
+    hierarchies of the selected objects. The other objects are dependencies pulled in by
+    libraries.write (modifier targets, constraint targets...), they stay unselected.
+    :param root_names: The names of the selected objects, every object without a parent when None.
+    :type root_names: list
+    :return: The selected roots.
+    :rtype: list
+    """
+    # Blender adds an empty scene when the opened file has none
+    scene = bpy.context.scene
+    for obj in bpy.data.objects:
+        if obj.name not in scene.objects:
+            scene.collection.objects.link(obj)
+    bpy.context.view_layer.update()
+    if root_names is None:
+        roots = [obj for obj in bpy.data.objects if obj.parent is None]
+    else:
+        roots = [bpy.data.objects[name] for name in root_names if name in bpy.data.objects]
+    selected = set(roots)
+    for root in roots:
+        selected.update(root.children_recursive)
+    for obj in bpy.context.view_layer.objects:
+        obj.select_set(obj in selected)
+    return roots
+
+
+def main(argv):
+    """
+    Export the opened selection and upload it.
+    :return: The process exit code.
+    :rtype: int
+    """
+    args = parse_args(argv)
+    upload = json.loads(args.upload)
+    try:
+        BackgroundExport.report("loading", 0.1)
+        roots = link_objects(json.loads(args.roots) or None)
+        if not roots:
+            BackgroundExport.report_result({"error": "The exported selection is empty"})
+            return 1
+        bpy.context.view_layer.objects.active = bpy.data.objects.get(args.name, roots[0])
+
+        BackgroundExport.report("exporting", 0.2)
+        if not Exporter().export_selected_object_and_children(args.workspace, args.name):
+            BackgroundExport.report_result({"error": "The GLB export failed"})
+            return 1
+
+        BackgroundExport.report("uploading", 0.7)
+        response = AWAPITool.send_model_to_api(
+            AWAPITool, os.environ.get("AA_API_KEY", ""), args.workspace, args.name, upload["server_name"],
+            upload["symmetry"], upload["model_type"], upload["improvements"], upload["author"], budget=RetryBudget())
+        if isinstance(response, str):
+            BackgroundExport.report_result({"error": response})
+            return 1
+        BackgroundExport.report("done", 1.0)
+        BackgroundExport.report_result({"status_code": response.status_code, "text": response.text})
+        return 0
+    except Exception as e:
+        BackgroundExport.report_result({"error": f"{type(e).__name__}: {e}"})
+        return 1
+
+
+if __name__ == "__main__":
+    # Run by Blender as a script: load the add-on as a package so its relative imports work
+    import importlib
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(addon_dir))
+    worker = importlib.import_module(os.path.basename(addon_dir) + ".export_worker")
+    sys.exit(worker.main(sys.argv))
@@ -2,6 +2,10 @@ import os
 import bpy
 
 from .global_values import GlobalValues
+from .bounds import BoundsService
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
 
 class Exporter:
     """
@@ -23,12 +27,14 @@ class Exporter:
         for child in obj.children:  # Iterate over all children of the object
             self.select_object_and_children(child)  # Recursively select children
 
-    def export_selected_object_and_children(self, path):
+    def export_selected_object_and_children(self, path, file_name=None):
         """
         Export the selected object along with all its children to a GLB file.
 
         :param path: The path to the directory where the model file will be saved.
         :type path: str
+        :param file_name: The name of the file, defaults to the name of the first selected object.
+        :type file_name: str
         :return: True if the export is successful, False otherwise.
         :rtype: bool
         """
@@ -37,7 +43,7 @@ class Exporter:
 
         # Ensure at least one object is selected
         if not selected_objects:
-            print("At least one object must be selected")
+            log.warning("At least one object must be selected")
             return False
 
         # Deselect all objects to start clean
@@ -49,23 +55,17 @@ class Exporter:
 
         # Construct the file path using the name of the first selected object
         first_selected_object = selected_objects[0]
-        file_path = os.path.join(path, first_selected_object.name)
-        
-        GlobalValues.size = first_selected_object.dimensions
-        #Get the size of the largest object
-        for obj in selected_objects:
-            if obj.dimensions.z > GlobalValues.size.z:
-                GlobalValues.size = obj.dimensions
-
+        file_path = os.path.join(path, file_name or first_selected_object.name)
         
-        print("Size of the object: " + str(GlobalValues.size))
+        # Size of the whole exported hierarchy, used to scale the returned model
+        GlobalValues.sent_model_size = BoundsService.dimensions(selected_objects)
+        log.debug("Size of the object: %s", GlobalValues.sent_model_size)
         # Export the selected objects and their children
         try:
             bpy.ops.export_scene.gltf(filepath=file_path, use_selection=True)
-            print("Exported to: " + file_path)
+            log.info("Exported to %s", file_path, extra={"fields": {"stage": "export"}})
         except Exception as e:
-            print(e)
-            print("Error exporting to: " + file_path)
+            log.error("Error exporting to %s: %s", file_path, e)
             return False
 
         return True
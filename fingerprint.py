@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import bpy
+import numpy as np
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class GeometryFingerprint:
+    """
+    Content hash of an export hierarchy: evaluated vertices, faces, UVs, material assignments,
+    the images the materials use, armatures, transforms and the upload fields. Arrays are read
+    with foreach_get and hashed as raw buffers, so hashing is much cheaper than exporting.
+    Two hierarchies with the same fingerprint export to the same GLB.
+    """
+    DIGEST_SIZE = 16
+
+    @staticmethod
+    def update_array(digest, collection, attribute, dtype, components=1):
+        """
+        Hash one attribute of a bpy collection.
+        :param digest: The hash to update.
+        :param collection: e.g. mesh.vertices.
+        :param attribute: e.g. "co".
+        :param dtype: The numpy type of the attribute.
+        :param components: Values per element.
+        """
+        values = np.empty(len(collection) * components, dtype=dtype)
+        collection.foreach_get(attribute, values)
+        digest.update(attribute.encode('utf-8'))
+        digest.update(values.tobytes())
+
+    @staticmethod
+    def update_image(digest, image, hashed_images):
+        """
+        Hash an image once: the packed bytes, the file size and time, or the pixels of
+        generated and edited images.
+        """
+        if image.name_full in hashed_images:
+            return
+        hashed_images.add(image.name_full)
+        digest.update(b'image' + image.name_full.encode('utf-8'))
+        digest.update(str(tuple(image.size)).encode('utf-8'))
+        if image.packed_file is not None:
+            digest.update(hashlib.blake2b(image.packed_file.data, digest_size=GeometryFingerprint.DIGEST_SIZE).digest())
+        elif image.source == 'FILE' and not image.is_dirty:
+            path = bpy.path.abspath(image.filepath)
+            try:
+                stat = os.stat(path)
+                digest.update(f"{path}|{stat.st_size}|{stat.st_mtime_ns}".encode('utf-8'))
+            except OSError:
+                digest.update(path.encode('utf-8'))
+        elif image.has_data:
+            pixels = np.empty(len(image.pixels), dtype=np.float32)
+            image.pixels.foreach_get(pixels)
+            digest.update(pixels.tobytes())
+
+    @staticmethod
+    def update_material(digest, material, hashed_images):
+        """
+        Hash the settings and image textures of a material.
+        """
+        digest.update(b'material' + material.name_full.encode('utf-8'))
+        digest.update(np.array(material.diffuse_color, dtype=np.float32).tobytes())
+        if material.node_tree is None:
+            return
+        for node in material.node_tree.nodes:
+            digest.update(node.bl_idname.encode('utf-8'))
+            for socket in node.inputs:
+                value = getattr(socket, "default_value", None)
+                if value is None or socket.is_linked:
+                    continue
+                try:
+                    digest.update(np.array(value, dtype=np.float32).tobytes())
+                except (TypeError, ValueError):
+                    digest.update(str(value).encode('utf-8'))
+            if node.type == 'TEX_IMAGE' and node.image is not None:
+                GeometryFingerprint.update_image(digest, node.image, hashed_images)
+        for link in material.node_tree.links:
+            digest.update(f"{link.from_node.name}.{link.from_socket.identifier}>{link.to_node.name}.{link.to_socket.identifier}".encode('utf-8'))
+
+    @staticmethod
+    def update_mesh(digest, obj, depsgraph, hashed_images):
+        """
+        Hash the evaluated mesh of an object, modifiers applied like the exporter does.
+        """
+        eval_obj = obj.evaluated_get(depsgraph)
+        mesh = eval_obj.to_mesh()
+        try:
+            GeometryFingerprint.update_array(digest, mesh.vertices, "co", np.float32, 3)
+            GeometryFingerprint.update_array(digest, mesh.loops, "vertex_index", np.int32)
+            GeometryFingerprint.update_array(digest, mesh.polygons, "loop_total", np.int32)
+            GeometryFingerprint.update_array(digest, mesh.polygons, "material_index", np.int32)
+            for uv_layer in mesh.uv_layers:
+                GeometryFingerprint.update_array(digest, uv_layer.data, "uv", np.float32, 2)
+            for group in obj.vertex_groups:
+                digest.update(b'group' + group.name.encode('utf-8'))
+        finally:
+            eval_obj.to_mesh_clear()
+        for slot in obj.material_slots:
+            if slot.material is not None:
+                GeometryFingerprint.update_material(digest, slot.material, hashed_images)
+
+    @staticmethod
+    def compute(objects, upload_fields=None, depsgraph=None):
+        """
+        Fingerprint an export hierarchy.
+        :param objects: The objects of the hierarchy (see Preflight.collect_hierarchy).
+        :type objects: list
+        :param upload_fields: Upload settings that change the result, e.g. the model type and symmetry.
+        :type upload_fields: dict
+        :param depsgraph: The depsgraph used to evaluate modifiers, defaults to the current one.
+        :return: The fingerprint as a hex string.
+        :rtype: str
+        """
+        if depsgraph is None:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+        digest = hashlib.blake2b(digest_size=GeometryFingerprint.DIGEST_SIZE)
+        digest.update(json.dumps(upload_fields or {}, sort_keys=True).encode('utf-8'))
+        hashed_images = set()
+        for obj in sorted(objects, key=lambda item: item.name_full):
+            parent = obj.parent.name_full if obj.parent is not None else ""
+            digest.update(f"{obj.name_full}|{obj.type}|{parent}".encode('utf-8'))
+            digest.update(np.array(obj.matrix_world, dtype=np.float32).tobytes())
+            if obj.type == 'MESH':
+                GeometryFingerprint.update_mesh(digest, obj, depsgraph, hashed_images)
+            elif obj.type == 'ARMATURE':
+                bones = obj.data.bones
+                digest.update("|".join(bone.name for bone in bones).encode('utf-8'))
+                GeometryFingerprint.update_array(digest, bones, "head_local", np.float32, 3)
+                GeometryFingerprint.update_array(digest, bones, "tail_local", np.float32, 3)
+        return digest.hexdigest()
+
+
+class UploadCache:
+    """
+    Persistent map of fingerprint -> model ID of the models already uploaded, kept in the
+    Blender user config folder so it survives restarts. Entries are keyed by the hashed API key
+    as well, a model uploaded with one account is not reused for another.
+    """
+    FILE_NAME = "upload_cache.json"
+    MAX_ENTRIES = 500
+
+    _entries = None
+    _path = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def path():
+        """
+        Resolved once on the main thread by register, the poll thread writes the cache too.
+        :return: The path of the cache file.
+        :rtype: str
+        """
+        if UploadCache._path is None:
+            folder = bpy.utils.user_resource('CONFIG', path="animate_anything", create=True)
+            UploadCache._path = os.path.join(folder, UploadCache.FILE_NAME)
+        return UploadCache._path
+
+    @staticmethod
+    def register():
+        UploadCache.path()
+
+    @staticmethod
+    def key(api_key, fingerprint):
+        """
+        :return: The cache key of a fingerprint uploaded with an API key.
+        :rtype: str
+        """
+        account = hashlib.blake2b(api_key.encode('utf-8'), digest_size=8).hexdigest()
+        return account + ":" + fingerprint
+
+    @staticmethod
+    def load():
+        """
+        Read the cache file once.
+        :rtype: dict
+        """
+        if UploadCache._entries is None:
+            try:
+                with open(UploadCache.path(), 'r', encoding='utf-8') as file:
+                    UploadCache._entries = json.load(file)
+            except (OSError, ValueError):
+                UploadCache._entries = {}
+        return UploadCache._entries
+
+    @staticmethod
+    def get(api_key, fingerprint):
+        """
+        :param api_key: The API key the model would be uploaded with.
+        :param fingerprint: The fingerprint of the hierarchy.
+        :return: The entry (model_id, model_name, uploaded) or None.
+        :rtype: dict
+        """
+        with UploadCache._lock:
+            return UploadCache.load().get(UploadCache.key(api_key, fingerprint))
+
+    @staticmethod
+    def store(api_key, fingerprint, model_id, model_name):
+        """
+        Remember the model ID returned for a fingerprint uploaded with an API key.
+        """
+        with UploadCache._lock:
+            entries = UploadCache.load()
+            entries[UploadCache.key(api_key, fingerprint)] = {"model_id": model_id, "model_name": model_name, "uploaded": time.time()}
+            if len(entries) > UploadCache.MAX_ENTRIES:
+                oldest = sorted(entries, key=lambda key: entries[key]["uploaded"])
+                for key in oldest[:len(entries) - UploadCache.MAX_ENTRIES]:
+                    del entries[key]
+            UploadCache.save()
+
+    @staticmethod
+    def forget(api_key, fingerprint):
+        """
+        Drop an entry, e.g. when the model ID is no longer valid.
+        """
+        with UploadCache._lock:
+            if UploadCache.load().pop(UploadCache.key(api_key, fingerprint), None) is not None:
+                UploadCache.save()
+
+    @staticmethod
+    def forget_model(model_id):
+        """
+        Drop the entries pointing to a model ID the service does not know.
+        """
+        with UploadCache._lock:
+            entries = UploadCache.load()
+            stale = [key for key, entry in entries.items() if entry["model_id"] == model_id]
+            for key in stale:
+                del entries[key]
+            if stale:
+                UploadCache.save()
+
+    @staticmethod
+    def save():
+        """
+        Write the cache file, called with the lock held.
+        """
+        try:
+            with open(UploadCache.path(), 'w', encoding='utf-8') as file:
+                json.dump(UploadCache._entries, file)
+        except OSError as e:
+            log.warning("Could not save the upload cache: %s", e)
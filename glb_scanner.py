@@ -0,0 +1,185 @@
+import json
+import os
+import struct
+import threading
+
+
+class GLBInfo:
+    """
+    What a GLB file contains, read from its JSON chunk only.
+
+    Attributes:
+        path (str): The file.
+        file_size (int): Size of the file in bytes.
+        bin_bytes (int): Size of the binary chunk.
+        animations (int): Number of animations.
+        nodes (int): Number of nodes.
+        meshes (int): Number of meshes.
+        skins (int): Number of skins.
+        materials (int): Number of materials.
+        images (int): Number of images.
+        accessors (int): Number of accessors.
+        vertex_count (int): Vertices over all mesh primitives.
+        accessor_bytes (int): Bytes of vertex, index and animation data.
+        animation_bytes (int): Bytes of the keyframe data.
+        image_bytes (int): Bytes of the embedded (compressed) images.
+        error (str): Why the file could not be read, empty if it could.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file_size = 0
+        self.bin_bytes = 0
+        self.animations = 0
+        self.nodes = 0
+        self.meshes = 0
+        self.skins = 0
+        self.materials = 0
+        self.images = 0
+        self.accessors = 0
+        self.vertex_count = 0
+        self.accessor_bytes = 0
+        self.animation_bytes = 0
+        self.image_bytes = 0
+        self.error = ""
+
+    @property
+    def has_animation(self):
+        return self.animations > 0 and self.animation_bytes > 0
+
+    @property
+    def data_bytes(self):
+        """
+        Rough size of the data the import will create, used to plan memory.
+        """
+        return self.accessor_bytes + self.image_bytes
+
+    def summary(self):
+        return (f"{os.path.basename(self.path)}: {self.animations} animations, {self.nodes} nodes, "
+                f"{self.meshes} meshes, {self.vertex_count} vertices, {self.data_bytes / (1024 * 1024):.1f} MB")
+
+
+class GLBScanner:
+    """
+    Pure-Python reader of the GLB container. Reads the 12 byte header and the JSON chunk and
+    seeks past the binary chunk, so scanning a file costs a few kilobytes of reading and can
+    run on the download thread.
+    Results are cached by path, size and modification time.
+    """
+    MAGIC = b'glTF'
+    CHUNK_JSON = 0x4E4F534A
+    CHUNK_BIN = 0x004E4942
+    COMPONENT_SIZES = {5120: 1, 5121: 1, 5122: 2, 5123: 2, 5125: 4, 5126: 4}
+    TYPE_COMPONENTS = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT2": 4, "MAT3": 9, "MAT4": 16}
+    MAX_CACHED = 4096
+
+    _cache = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def scan(path):
+        """
+        Read what a GLB file contains.
+        :param path: The file.
+        :type path: str
+        :return: The information, with error set if the file is not a readable GLB.
+        :rtype: GLBInfo
+        """
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            info = GLBInfo(path)
+            info.error = str(e)
+            return info
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with GLBScanner._lock:
+            if key in GLBScanner._cache:
+                return GLBScanner._cache[key]
+
+        info = GLBInfo(path)
+        info.file_size = stat.st_size
+        try:
+            document = GLBScanner.read_json_chunk(path, info)
+            GLBScanner.count(document, info)
+        except (OSError, ValueError, KeyError, TypeError, IndexError, struct.error) as e:
+            info.error = str(e) or type(e).__name__
+
+        with GLBScanner._lock:
+            if len(GLBScanner._cache) >= GLBScanner.MAX_CACHED:
+                GLBScanner._cache.clear()
+            GLBScanner._cache[key] = info
+        return info
+
+    @staticmethod
+    def read_json_chunk(path, info):
+        """
+        Read the JSON chunk of a GLB file and the length of its binary chunk.
+        :rtype: dict
+        """
+        with open(path, 'rb') as file:
+            header = file.read(12)
+            if len(header) < 12 or header[:4] != GLBScanner.MAGIC:
+                raise ValueError("not a GLB file")
+            length = struct.unpack_from('<I', header, 8)[0]
+            chunk_length, chunk_type = struct.unpack('<II', file.read(8))
+            if chunk_type != GLBScanner.CHUNK_JSON:
+                raise ValueError("the first chunk is not JSON")
+            document = json.loads(file.read(chunk_length))
+            position = 20 + chunk_length
+            if position + 8 <= length:
+                file.seek(position)
+                bin_length, bin_type = struct.unpack('<II', file.read(8))
+                if bin_type == GLBScanner.CHUNK_BIN:
+                    info.bin_bytes = bin_length
+        return document
+
+    @staticmethod
+    def accessor_size(accessor):
+        """
+        :return: The size in bytes of the data of an accessor.
+        :rtype: int
+        """
+        return (accessor.get("count", 0) * GLBScanner.COMPONENT_SIZES.get(accessor.get("componentType"), 4)
+                * GLBScanner.TYPE_COMPONENTS.get(accessor.get("type"), 1))
+
+    @staticmethod
+    def count(document, info):
+        """
+        Fill the counts and sizes of a GLBInfo from a parsed glTF document.
+        """
+        accessors = document.get("accessors", [])
+        info.animations = len(document.get("animations", []))
+        info.nodes = len(document.get("nodes", []))
+        info.meshes = len(document.get("meshes", []))
+        info.skins = len(document.get("skins", []))
+        info.materials = len(document.get("materials", []))
+        info.images = len(document.get("images", []))
+        info.accessors = len(accessors)
+        info.accessor_bytes = sum(GLBScanner.accessor_size(accessor) for accessor in accessors)
+
+        for mesh in document.get("meshes", []):
+            for primitive in mesh.get("primitives", []):
+                position = primitive.get("attributes", {}).get("POSITION")
+                if position is not None:
+                    info.vertex_count += accessors[position].get("count", 0)
+
+        keyframe_accessors = set()
+        for animation in document.get("animations", []):
+            for sampler in animation.get("samplers", []):
+                keyframe_accessors.add(sampler.get("input"))
+                keyframe_accessors.add(sampler.get("output"))
+        info.animation_bytes = sum(GLBScanner.accessor_size(accessors[index])
+                                   for index in keyframe_accessors if index is not None)
+
+        buffer_views = document.get("bufferViews", [])
+        for image in document.get("images", []):
+            if "bufferView" in image:
+                info.image_bytes += buffer_views[image["bufferView"]].get("byteLength", 0)
+
+    @staticmethod
+    def clear():
+        """
+        Forget all cached scans.
+        """
+        with GLBScanner._lock:
+            GLBScanner._cache.clear()
@@ -7,6 +7,11 @@ class GlobalValues:
 
     Attributes:
         sendedModel_id (str): The ID of the sent model.
+        sent_job_id (str): The job of the upload of that model, its polling, download and import are traced under it.
+        sent_model_size (mathutils.Vector): World-space size of the sent hierarchy.
+        decimation (DecimationResult): Mapping of the last decimated proxy sent, used to transfer the rig back.
     """
     sendedModel_id = ""
+    sent_job_id = ""
     sent_model_size = mathutils.Vector((0,0,0))
+    decimation = None
@@ -0,0 +1,42 @@
+from .global_values import GlobalValues
+
+
+class ImportJob:
+    """
+    The state of one model import: the size to scale to, the scale factors computed from the
+    first model and the layout of the animation clips. Every importer has its own, so the timers
+    of several results can interleave without changing each other's layout or scale.
+
+    Attributes:
+        job_id (str): The job being imported.
+        model_id (str): The ID of the model, empty if unknown.
+        name (str): The name of the model, used for the asset library.
+        target_size (mathutils.Vector): World-space size the model is scaled to, defaults to a copy of the sent hierarchy's size.
+        model_scale (float): Scale factor of the first static or vehicle model, -1 until computed.
+        clip_scale (float): Scale factor of the first animation clip, -1 until computed.
+        offset_x (float): X position of the next clip.
+        offset_y (float): Y position of the current row of clips.
+        current_index (int): Index of the next clip to import.
+    """
+
+    def __init__(self, job_id="", target_size=None, model_id="", name=""):
+        """
+        :param job_id: The job being imported.
+        :type job_id: str
+        :param target_size: The size to scale to, read from GlobalValues.sent_model_size when None.
+        :type target_size: mathutils.Vector
+        :param model_id: The ID of the model.
+        :type model_id: str
+        :param name: The name of the model.
+        :type name: str
+        """
+        self.job_id = job_id
+        self.model_id = model_id
+        self.name = name
+        # Copied so later uploads or panel redraws do not change the size of a running import
+        self.target_size = (target_size if target_size is not None else GlobalValues.sent_model_size).copy()
+        self.model_scale = -1
+        self.clip_scale = -1
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+        self.current_index = 0
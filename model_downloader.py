@@ -1,17 +1,45 @@
 from urllib.parse import urlparse
 import json
 import os
-import requests
 import bpy
+import requests
 
 from .aa_panel import AW_PT_AAPanel 
+from .tracing import Tracer
+from .transfer_policy import TransferPolicy, RetryBudget
+from .asset_integrity import IntegrityError, StreamVerifier
+from .glb_scanner import GLBScanner
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
 
 class ModelDownloader:
     """
     A class for downloading 3D models and textures from URLs.
+    Files are streamed to disk and verified while they are written. Files that fail are
+    downloaded again, up to MAX_REQUEUE times, before the import starts.
     """
-    def __init__(self, data):
+    CHUNK_SIZE = 256 * 1024
+    MAX_REQUEUE = 2
+
+    def __init__(self, data, base_dir=None, job_id="", budget=None):
+        """
+        :param data: The processed model JSON.
+        :param base_dir: The directory files are downloaded to, defaults to the Blender temp directory.
+        :type base_dir: str
+        :param job_id: The job the download belongs to, used for tracing.
+        :type job_id: str
+        :param budget: The retry budget of the job, shared by all of its files.
+        :type budget: RetryBudget
+        """
         self.data = data
+        self.job_id = job_id
+        self.budget = budget if budget is not None else RetryBudget()
+        self.failed = []
+        # (folder, path, size, md5) of every downloaded file, see AssetManifest.record
+        self.files = []
+        self.callback = None
+        self.base_dir = base_dir if base_dir is not None else bpy.app.tempdir
        
 
     def download_file(self, url, filename, folder):
@@ -19,21 +47,44 @@ class ModelDownloader:
         Download a file from a URL to an absolute path.
         :param url: The URL to download from.
         :param filename: The filename to save the file as.
+        :raises IntegrityError: If the file is truncated or not of the expected format.
         """
-        temp_dir = bpy.app.tempdir
+        temp_dir = self.base_dir
         abs_path = os.path.join(temp_dir, folder, filename)
-        response = requests.get(url, timeout=10)
         #create a folder if it does not exist
         if not os.path.exists(os.path.join(temp_dir, folder)):
             os.makedirs(os.path.join(temp_dir, folder))
         #check if a file exists and change the name
         if os.path.exists(abs_path):
             abs_path = os.path.join(temp_dir, "new_" + filename)
-            
-        with open(abs_path, 'wb') as file:
-            file.write(response.content)
-        print(f"Downloaded {abs_path}")
+
+        part_path = abs_path + ".part"
+        with Tracer.span("download file", "transfer", job_id=self.job_id, file=filename, folder=folder) as span:
+            with TransferPolicy.request("GET", url, budget=self.budget, timeout=10, stream=True) as response:
+                span.set(status=response.status_code)
+                response.raise_for_status()
+                verifier = StreamVerifier.from_response(filename, response)
+                try:
+                    with open(part_path, 'wb') as file:
+                        for chunk in response.iter_content(ModelDownloader.CHUNK_SIZE):
+                            verifier.update(chunk)
+                            file.write(chunk)
+                    verifier.finish()
+                except Exception:
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    raise
+            span.set(bytes=verifier.length)
+        # Only complete files get their final name, the importer never sees a partial one
+        os.replace(part_path, abs_path)
+        self.files.append((folder, abs_path, verifier.length, verifier.md5.hexdigest()))
+        if abs_path.endswith('.glb'):
+            # Read the contents now, on this thread, so the importer can plan without opening the file
+            GLBScanner.scan(abs_path)
+        log.debug("Downloaded %s", abs_path, extra={"fields": {"bytes": verifier.length}})
         AW_PT_AAPanel.message_handler("Downloaded " + os.path.splitext(os.path.basename(abs_path))[0])
+        if self.callback is not None:
+            self.callback(folder, abs_path)
 
    
     def find_generic_files(self, json_data, extension):
@@ -94,42 +145,78 @@ class ModelDownloader:
         """
         Parse the data to extract model and texture URLs and download them to an absolute path.
         This method expects 'data' to be a list.
+        :param callback: Called on this thread with (folder, path) as soon as each file is downloaded and verified.
+        :type callback: callable
         """
+        self.callback = callback
         # Check if data is a string and convert it to a list if necessary
         if isinstance(self.data, str):
             self.data = json.loads(self.data)
             
-        # Extract specific parts of the data
-        for item in self.data:
-            original_model = item.get('original_model', {})
-            preprocessed_model = item.get('preprocessed_model', {})
-            parts = item.get('model', {}).get('parts', {})
-            rig = item.get('model', {}).get('rig', {})
-            texture = item.get('textures', {})
-            material = preprocessed_model.get('material', {})
-            #get the model files 
-            AW_PT_AAPanel.message_handler("Downloading model files")
-
-            self.get_all_files(original_model, "original_model")
-
-            self.get_all_files(preprocessed_model, "preprocessed_model")
-            #put the texture files in the preprocessed_model folder
-            self.get_all_files(texture, "preprocessed_model")
-
-
-            self.get_all_files(parts, "parts")
-            #put the texture files in the parts folder
-            self.get_all_files(texture, "parts")
-            #put the material files in the parts folder
-            self.get_all_files(material, "parts")
-            #get the animation files
-            self.get_all_files(rig, "animations")
-            
-        
-            
-            
-            
-                
+        self.failed = []
+        self.files = []
+        with Tracer.span("download", job_id=self.job_id):
+            # Extract specific parts of the data
+            for item in self.data:
+                original_model = item.get('original_model', {})
+                preprocessed_model = item.get('preprocessed_model', {})
+                parts = item.get('model', {}).get('parts', {})
+                rig = item.get('model', {}).get('rig', {})
+                texture = item.get('textures', {})
+                material = preprocessed_model.get('material', {})
+                #get the model files 
+                AW_PT_AAPanel.message_handler("Downloading model files")
+
+                self.get_all_files(original_model, "original_model")
+
+                self.get_all_files(preprocessed_model, "preprocessed_model")
+                #put the texture files in the preprocessed_model folder
+                self.get_all_files(texture, "preprocessed_model")
+
+
+                self.get_all_files(parts, "parts")
+                #put the texture files in the parts folder
+                self.get_all_files(texture, "parts")
+                #put the material files in the parts folder
+                self.get_all_files(material, "parts")
+                #get the animation files
+                self.get_all_files(rig, "animations")
+
+            self.retry_failed()
+
+    def try_download(self, url, filename, folder):
+        """
+        Download a file, queueing it for another attempt if it fails.
+        :return: True if the file was downloaded.
+        :rtype: bool
+        """
+        try:
+            self.download_file(url, filename, folder)
+            return True
+        except (requests.RequestException, IntegrityError, OSError) as e:
+            log.warning("Download of %s failed: %s", filename, e)
+            self.failed.append((url, filename, folder, e))
+            return False
+
+    def retry_failed(self):
+        """
+        Download the failed files again, after all the others so one bad file does not hold up the rest.
+        :raises IntegrityError: If some files still fail after MAX_REQUEUE rounds or the retry budget is spent.
+        """
+        for _ in range(ModelDownloader.MAX_REQUEUE):
+            if not self.failed:
+                return
+            queue, self.failed = self.failed, []
+            for url, filename, folder, error in queue:
+                if not self.budget.consume():
+                    self.failed.append((url, filename, folder, error))
+                    continue
+                AW_PT_AAPanel.message_handler("Downloading " + filename + " again")
+                self.try_download(url, filename, folder)
+        if self.failed:
+            names = ", ".join(filename for _, filename, _, _ in self.failed)
+            raise IntegrityError(f"Could not download {len(self.failed)} files: {names} ({self.failed[-1][3]})")
+
     def get_all_files(self, model_data, folder):
             # Extract GLB file paths
             glb_file_paths = self.find_generic_files(model_data, '.glb')
@@ -137,8 +224,8 @@ class ModelDownloader:
 
             for url in glbUrl:
                 name = self.get_clean_filename_from_url(url)
-                print("gbl url -> " + name)
-                self.download_file(url, name,folder)
+                log.debug("GLB url -> %s", name)
+                self.try_download(url, name,folder)
                 
             #Extract FBX file paths
             #fbx_file_paths = self.find_generic_files(model_data, '.fbx')
@@ -153,39 +240,39 @@ class ModelDownloader:
             objUrl = self.find_generic_urls(obj_file_paths, '.obj')
             for url in objUrl:
                 name = self.get_clean_filename_from_url(url)
-                print("obj url -> " + name)
-                self.download_file(url, name,folder)
+                log.debug("OBJ url -> %s", name)
+                self.try_download(url, name,folder)
                 
             #Extract MTL file paths
             mtl_file_paths = self.find_generic_files(model_data, '.mtl')
             mtlUrl = self.find_generic_urls(mtl_file_paths, '.mtl')
             for url in mtlUrl:
                 name = self.get_clean_filename_from_url(url)
-                print("mtl url -> " + name)
-                self.download_file(url, name,folder)
+                log.debug("MTL url -> %s", name)
+                self.try_download(url, name,folder)
                 
             # Extract png file paths
             png_file_paths = self.find_generic_files(model_data, '.png')
             pngUrl = self.find_generic_urls(png_file_paths, '.png')
             for url in pngUrl:
                 name = self.get_clean_filename_from_url(url)
-                print("png url -> " + name)
-                self.download_file(url, name,folder)
+                log.debug("PNG url -> %s", name)
+                self.try_download(url, name,folder)
                 
             # Extract jpg file paths
             jpg_file_paths = self.find_generic_files(model_data, '.jpg')
             jpgUrl = self.find_generic_urls(jpg_file_paths, '.jpg')
             for url in jpgUrl:
                 name = self.get_clean_filename_from_url(url)
-                print("jpg url -> " + name)
-                self.download_file(url, name,folder)
+                log.debug("JPG url -> %s", name)
+                self.try_download(url, name,folder)
                 
             # Extract jpeg file paths
             jpeg_file_paths = self.find_generic_files(model_data, '.jpeg')
             jpegUrl = self.find_generic_urls(jpeg_file_paths, '.jpeg')
             for url in jpegUrl:
                 name = self.get_clean_filename_from_url(url)
-                print("jpeg url -> " + name)
-                self.download_file(url, name,folder)
+                log.debug("JPEG url -> %s", name)
+                self.try_download(url, name,folder)
                 
     
\ No newline at end of file
@@ -1,11 +1,15 @@
 import threading
 import bpy
-import os
-import shutil
+import requests
 # Local application imports
 from .global_values import GlobalValues
 from .aw_api_tool import AWAPITool
 from .api_key_manager import APIKeyManager
+from .asset_manifest import AssetManifest
+from .tracing import Tracer
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
 
 class ModelReturn(bpy.types.Operator):
     """
@@ -15,15 +19,23 @@ class ModelReturn(bpy.types.Operator):
     bl_idname = "wm.getlastmodel"
     bl_label = "Get Last Model"
 
-    def async_get_model(self, api_key, model_id):
+    offline: bpy.props.BoolProperty(name="From Library", default=False, description="Import the last downloaded copy from the local asset manifest instead of downloading it")
+
+    def async_get_model(self, api_key, model_id, job_id=""):
         """
         Asynchronously gets the model using the provided API key and model ID.
         :param api_key: The API key used to authenticate the request.
         :param model_id: The ID of the model to retrieve.
+        :param job_id: The job the download and import are traced under, a new one when empty.
         """
-        response = AWAPITool.getModelProcessed(AWAPITool, api_key, model_id)
+        if job_id:
+            Tracer.set_job(job_id)
+        try:
+            response = AWAPITool.getModelProcessed(AWAPITool, api_key, model_id)
+        except requests.RequestException as e:
+            response = f"Request failed: {e}"
         bpy.app.timers.register(
-            lambda: AWAPITool.handle_received_response(AWAPITool, response))
+            lambda: AWAPITool.handle_received_response(AWAPITool, response, model_id, job_id))
         #threading.Thread(target=AWAPITool.handle_received_response, args=(AWAPITool, response)).start()
 
     def execute(self, context):
@@ -33,35 +45,33 @@ class ModelReturn(bpy.types.Operator):
         :return: A dictionary indicating the status of the execution.
         """
         
-        #clean the temp folder
-        temp_dir = bpy.app.tempdir
-        # Iterate over each item in the temporary directory
-        for item in os.listdir(temp_dir):
-            item_path = os.path.join(temp_dir, item)
-            try:
-                # Check if the item is a file and delete it
-                if os.path.isfile(item_path):
-                    os.unlink(item_path)
-                # Check if the item is a directory and delete it along with its contents
-                elif os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
-            except Exception as e:
-                print(e)
-                    
         wm = context.window_manager
-        api_key = APIKeyManager.get_api_key(bpy.types.RenderEngine)
-        if APIKeyManager.api_key == "":
-            self.report({'ERROR'}, "Missing API Key")
-            return {'CANCELLED'}
         if wm.my_last_model != "":
-            print("Getting last model from window" + wm.my_last_model)
+            log.debug("Getting last model from window %s", wm.my_last_model)
+            if wm.my_last_model != GlobalValues.sendedModel_id:
+                # Not the model uploaded in this session, its download is a job of its own
+                GlobalValues.sent_job_id = ""
             GlobalValues.sendedModel_id = wm.my_last_model
 
         if GlobalValues.sendedModel_id == "":
             self.report({'ERROR'}, "Missing Model ID")
             return {'CANCELLED'}
 
-        print("Getting last model" + GlobalValues.sendedModel_id)
+        if self.offline:
+            entry = AssetManifest.latest(GlobalValues.sendedModel_id)
+            if entry is None or not AssetManifest.is_complete(entry):
+                self.report({'ERROR'}, "This model is not in the local library, download it first")
+                return {'CANCELLED'}
+            log.info("Importing model %s from the library", GlobalValues.sendedModel_id)
+            AWAPITool.import_local(entry)
+            return {'FINISHED'}
+
+        api_key = APIKeyManager.get_api_key(bpy.types.RenderEngine)
+        if APIKeyManager.api_key == "":
+            self.report({'ERROR'}, "Missing API Key")
+            return {'CANCELLED'}
+
+        log.info("Getting model %s", GlobalValues.sendedModel_id)
         threading.Thread(target=self.async_get_model, args=(
-           api_key, GlobalValues.sendedModel_id)).start()
+           api_key, GlobalValues.sendedModel_id, GlobalValues.sent_job_id)).start()
         return {'FINISHED'}
@@ -0,0 +1,413 @@
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import bpy
+
+from .aa_panel import AW_PT_AAPanel
+from .rig_pruner import RigPruner
+from .tracing import Tracer
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class PointCacheBake:
+    """
+    Bakes the deformation of imported animation clips to Alembic so they play back without
+    evaluating the armature.
+
+    The clip is written to a temporary .blend with bpy.data.libraries.write and a "blender -b"
+    process exports its deformed meshes to an .abc file, reporting the Alembic object path of
+    every mesh on stdout. When it ends, each deformed mesh gets a proxy sharing its mesh data
+    with a Mesh Sequence Cache modifier reading the baked vertex positions. The proxies replace
+    the rigged meshes in the viewport, and use_cache switches back to the rig for editing.
+
+    Attributes:
+        clip_name (str): The root object of the clip.
+        meshes (list): Names of the deformed meshes being baked.
+        cache_path (str): The .abc file written by the process.
+        frame_start (int): First baked frame.
+        frame_end (int): Last baked frame.
+        stage (str): The current stage reported by the process.
+        progress (float): Progress between 0 and 1.
+        result (dict): The result printed by the process, None until it ended.
+    """
+    PROGRESS_PREFIX = "AA_PROGRESS "
+    RESULT_PREFIX = "AA_RESULT "
+    WORKER_SCRIPT = "cache_worker.py"
+    FOLDER = "aa_cache"
+    STATE_KEY = "aa_point_cache"
+    PROXY_SUFFIX = "_cache"
+    MODIFIER = "AA Point Cache"
+    POLL_SECONDS = 0.5
+    # Bake processes running at once, the others wait
+    MAX_PROCESSES = 2
+    # Lines of the process output kept to report failures
+    LOG_LINES = 40
+
+    pending = []
+    running = []
+
+    def __init__(self, clip, scene):
+        """
+        :param clip: The root object of the clip.
+        :type clip: bpy.types.Object
+        :param scene: The scene whose frame rate the cache is baked at.
+        :type scene: bpy.types.Scene
+        """
+        self.clip_name = clip.name
+        self.meshes = [obj.name for obj in PointCacheBake.deformed_meshes(clip)]
+        self.frame_start, self.frame_end = PointCacheBake.frame_range(clip, scene)
+        self.fps = scene.render.fps
+        self.fps_base = scene.render.fps_base
+        file_name = re.sub(r'[^\w\-.]', '_', clip.name)
+        self.cache_path = os.path.join(PointCacheBake.folder(), f"{file_name}_{uuid.uuid4().hex[:8]}.abc")
+        self.temp_dir = tempfile.mkdtemp(prefix="aa_cache_")
+        self.blend_path = os.path.join(self.temp_dir, "clip.blend")
+        self.process = None
+        self.reader = None
+        self.stage = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.log = []
+        self.started = time.perf_counter_ns()
+
+    @staticmethod
+    def deformed_meshes(clip):
+        """
+        :return: The meshes of a clip deformed by an armature.
+        :rtype: list
+        """
+        return [obj for obj in [clip] + list(clip.children_recursive) if obj.type == 'MESH' and any(
+            modifier.type == 'ARMATURE' for modifier in obj.modifiers)]
+
+    @staticmethod
+    def frame_range(clip, scene):
+        """
+        :return: The frames covered by the actions of the clip, the scene range if it has none.
+        :rtype: tuple
+        """
+        ranges = [action.frame_range for obj in [clip] + list(clip.children_recursive) if obj.type == 'ARMATURE'
+                  for action in RigPruner.actions(obj)]
+        if not ranges:
+            return scene.frame_start, scene.frame_end
+        return int(math.floor(min(start for start, _ in ranges))), int(math.ceil(max(end for _, end in ranges)))
+
+    @staticmethod
+    def folder():
+        """
+        :return: The folder of the caches, next to the saved .blend or in Blender's user data folder.
+        :rtype: str
+        """
+        if bpy.data.filepath:
+            folder = os.path.join(os.path.dirname(bpy.data.filepath), PointCacheBake.FOLDER)
+            os.makedirs(folder, exist_ok=True)
+            return folder
+        return bpy.utils.user_resource('DATAFILES', path=os.path.join("animate_anything", "caches"), create=True)
+
+    @staticmethod
+    def state(clip):
+        """
+        :return: The cache of a clip: the file, the proxies, the rigged meshes and whether the cache is in use. None if not baked.
+        :rtype: dict
+        """
+        state = clip.get(PointCacheBake.STATE_KEY)
+        return json.loads(state) if state is not None else None
+
+    @staticmethod
+    def selected_clips(context):
+        """
+        :return: The root objects above the selected objects.
+        :rtype: list
+        """
+        clips = []
+        for obj in context.selected_objects:
+            while obj.parent is not None:
+                obj = obj.parent
+            if obj not in clips:
+                clips.append(obj)
+        return clips
+
+    @staticmethod
+    def bake(clips, scene):
+        """
+        Queue the bake of clips. The clips are written right away, so later edits do not change the bake. Main thread only.
+        :param clips: The root objects of the clips.
+        :type clips: list
+        :return: The queued bakes.
+        :rtype: list
+        """
+        jobs = []
+        for clip in clips:
+            # Bake the rig, not a previous cache
+            if PointCacheBake.state(clip) is not None:
+                PointCacheBake.use_cache(clip, False)
+            job = PointCacheBake(clip, scene)
+            if not job.meshes:
+                log.info("Not baking %s, it has no deformed mesh", clip.name)
+                shutil.rmtree(job.temp_dir, ignore_errors=True)
+                continue
+            objects = {clip} | set(clip.children_recursive)
+            with Tracer.span("write clip", clip=clip.name, objects=len(objects)):
+                bpy.data.libraries.write(job.blend_path, objects, path_remap='ABSOLUTE', fake_user=True)
+            PointCacheBake.pending.append(job)
+            jobs.append(job)
+        if jobs and not bpy.app.timers.is_registered(PointCacheBake.poll):
+            bpy.app.timers.register(PointCacheBake.poll)
+        return jobs
+
+    def start(self):
+        """
+        Start the process baking the clip.
+        """
+        worker = os.path.join(os.path.dirname(os.path.abspath(__file__)), PointCacheBake.WORKER_SCRIPT)
+        command = [bpy.app.binary_path, "-b", "--factory-startup", self.blend_path, "--python", worker, "--",
+                   "--output", self.cache_path, "--meshes", json.dumps(self.meshes),
+                   "--start", str(self.frame_start), "--end", str(self.frame_end),
+                   "--fps", str(self.fps), "--fps-base", str(self.fps_base)]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        stdin=subprocess.DEVNULL, text=True, bufsize=1)
+        self.stage = "starting"
+        self.reader = threading.Thread(target=self.read_output, daemon=True)
+        self.reader.start()
+        PointCacheBake.running.append(self)
+
+    def read_output(self):
+        """
+        Parse the progress and the result printed by the process. Runs on its own thread.
+        """
+        for line in self.process.stdout:
+            line = line.rstrip()
+            if line.startswith(PointCacheBake.PROGRESS_PREFIX):
+                try:
+                    update = json.loads(line[len(PointCacheBake.PROGRESS_PREFIX):])
+                except ValueError:
+                    continue
+                self.stage = update.get("stage", self.stage)
+                self.progress = float(update.get("progress", self.progress))
+            elif line.startswith(PointCacheBake.RESULT_PREFIX):
+                try:
+                    self.result = json.loads(line[len(PointCacheBake.RESULT_PREFIX):])
+                except ValueError:
+                    continue
+            else:
+                self.log = (self.log + [line])[-PointCacheBake.LOG_LINES:]
+        self.process.wait()
+
+    @property
+    def finished(self):
+        return self.process is not None and self.process.poll() is not None and not self.reader.is_alive()
+
+    def finish(self):
+        """
+        Swap the clip for its cache, or report why the bake failed. Main thread only.
+        """
+        Tracer.record("bake point cache", "stage", self.started, time.perf_counter_ns() - self.started, None,
+                      {"clip": self.clip_name, "exit_code": self.process.returncode})
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        result = self.result or {"error": f"The bake process exited with code {self.process.returncode}"}
+        clip = bpy.data.objects.get(self.clip_name)
+        if "error" not in result and clip is None:
+            result = {"error": "The clip was deleted during the bake"}
+        if "error" in result:
+            log.error("Baking %s failed: %s\n%s", self.clip_name, result["error"], "\n".join(self.log))
+            AW_PT_AAPanel.message_handler(f"Baking {self.clip_name} failed: {result['error']}")
+            return
+        PointCacheBake.build_proxies(clip, self.cache_path, result["object_paths"])
+        AW_PT_AAPanel.message_handler(f"{self.clip_name} plays from its cache, frames {self.frame_start}-{self.frame_end}")
+
+    @staticmethod
+    def build_proxies(clip, cache_path, object_paths):
+        """
+        Replace the deformed meshes of a clip by proxies reading the cache, removing the proxies,
+        the cache file datablock and the .abc file of a previous bake.
+        :param clip: The root object of the clip.
+        :param cache_path: The .abc file.
+        :type cache_path: str
+        :param object_paths: Mesh name -> path of its shape in the Alembic file.
+        :type object_paths: dict
+        """
+        previous = PointCacheBake.state(clip)
+        if previous is not None:
+            for name in previous["proxies"]:
+                proxy = bpy.data.objects.get(name)
+                if proxy is not None:
+                    bpy.data.objects.remove(proxy)
+            PointCacheBake.remove_cache(previous["cache"])
+        cache = bpy.data.cache_files.load(cache_path)
+        proxies = []
+        originals = []
+        for name, object_path in object_paths.items():
+            original = bpy.data.objects.get(name)
+            if original is None:
+                continue
+            # Shares the mesh data, the modifier only replaces the vertex positions
+            proxy = bpy.data.objects.new(original.name + PointCacheBake.PROXY_SUFFIX, original.data)
+            for collection in original.users_collection:
+                collection.objects.link(proxy)
+            proxy.parent = original.parent
+            proxy.parent_type = 'OBJECT'
+            proxy.matrix_parent_inverse = original.matrix_parent_inverse.copy()
+            proxy.matrix_basis = original.matrix_basis.copy()
+            modifier = proxy.modifiers.new(PointCacheBake.MODIFIER, 'MESH_SEQUENCE_CACHE')
+            modifier.cache_file = cache
+            modifier.object_path = object_path
+            modifier.read_data = {'VERT'}
+            proxies.append(proxy.name)
+            originals.append(original.name)
+        clip[PointCacheBake.STATE_KEY] = json.dumps({"cache": cache_path, "proxies": proxies, "originals": originals, "enabled": False})
+        PointCacheBake.use_cache(clip, True)
+        log.info("Baked %s to %s", clip.name, cache_path, extra={"fields": {"meshes": len(proxies)}})
+
+    @staticmethod
+    def remove_cache(cache_path):
+        """
+        Remove the cache file datablocks of an .abc file that nothing uses anymore, then the file.
+        :param cache_path: The .abc file.
+        :type cache_path: str
+        """
+        target = os.path.normcase(os.path.abspath(cache_path))
+        caches = [cache for cache in bpy.data.cache_files
+                  if os.path.normcase(os.path.abspath(bpy.path.abspath(cache.filepath))) == target]
+        if any(cache.users for cache in caches):
+            # Still read by something else, e.g. a copy of the proxies
+            return
+        for cache in caches:
+            bpy.data.cache_files.remove(cache)
+        try:
+            os.remove(cache_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("Could not remove the previous cache %s: %s", cache_path, e)
+
+    @staticmethod
+    def use_cache(clip, enabled):
+        """
+        Show the cached proxies and stop evaluating the rigged meshes, or the other way around for editing.
+        :param clip: The root object of a baked clip.
+        :param enabled: True to play from the cache.
+        :type enabled: bool
+        :return: False if the clip has no cache.
+        :rtype: bool
+        """
+        state = PointCacheBake.state(clip)
+        if state is None:
+            return False
+        for name in state["originals"]:
+            obj = bpy.data.objects.get(name)
+            if obj is not None:
+                obj.hide_viewport = enabled
+        for name in state["proxies"]:
+            obj = bpy.data.objects.get(name)
+            if obj is not None:
+                obj.hide_viewport = not enabled
+        state["enabled"] = enabled
+        clip[PointCacheBake.STATE_KEY] = json.dumps(state)
+        return True
+
+    @staticmethod
+    def poll():
+        """
+        Timer starting the queued bakes and swapping in the finished ones.
+        :return: Seconds until the next call, None when nothing is left.
+        """
+        for job in list(PointCacheBake.running):
+            if job.finished:
+                PointCacheBake.running.remove(job)
+                job.finish()
+        while PointCacheBake.pending and len(PointCacheBake.running) < PointCacheBake.MAX_PROCESSES:
+            PointCacheBake.pending.pop(0).start()
+        if not PointCacheBake.running:
+            return None
+        job = PointCacheBake.running[0]
+        status = f"Baking {job.clip_name} in the background: {job.stage} ({job.progress * 100:.0f}%)"
+        if AW_PT_AAPanel.loading_status != status:
+            AW_PT_AAPanel.message_handler(status)
+        return PointCacheBake.POLL_SECONDS
+
+    @staticmethod
+    def cancel_all():
+        """
+        Stop the bake processes, e.g. when the add-on is disabled.
+        """
+        for job in PointCacheBake.running:
+            if job.process.poll() is None:
+                job.process.terminate()
+        for job in PointCacheBake.running + PointCacheBake.pending:
+            shutil.rmtree(job.temp_dir, ignore_errors=True)
+        PointCacheBake.running.clear()
+        PointCacheBake.pending.clear()
+        if bpy.app.timers.is_registered(PointCacheBake.poll):
+            bpy.app.timers.unregister(PointCacheBake.poll)
+
+    @staticmethod
+    def report(stage, progress):
+        """
+        Print a progress update, called in the process.
+        """
+        print(PointCacheBake.PROGRESS_PREFIX + json.dumps({"stage": stage, "progress": progress}), flush=True)
+
+    @staticmethod
+    def report_result(result):
+        """
+        Print the result of the bake, called in the process.
+        :type result: dict
+        """
+        print(PointCacheBake.RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+class BakePointCache(bpy.types.Operator):
+    """
+    Operator to bake the selected clips to Alembic in the background and play them from the cache.
+    """
+    bl_idname = "object.aa_bake_point_cache"
+    bl_label = "Bake Point Cache"
+    bl_description = "Bake the deformation of the selected clips to an Alembic cache in the background and play them from it"
+
+    def execute(self, context):
+        """
+        Executes the operator on the selected clips.
+        :param context: The context in which the operator is executed.
+        :return: A dictionary indicating the status of the execution.
+        """
+        if not context.selected_objects:
+            self.report({'ERROR'}, "Select the clips to bake")
+            return {'CANCELLED'}
+        jobs = PointCacheBake.bake(PointCacheBake.selected_clips(context), context.scene)
+        if not jobs:
+            self.report({'ERROR'}, "The selected clips have no mesh deformed by an armature")
+            return {'CANCELLED'}
+        AW_PT_AAPanel.message_handler(f"Baking {len(jobs)} clips in the background")
+        return {'FINISHED'}
+
+
+class ToggleCacheProxy(bpy.types.Operator):
+    """
+    Operator to switch the selected baked clips between the cache and the rig.
+    """
+    bl_idname = "object.aa_toggle_cache_proxy"
+    bl_label = "Toggle Cache / Rig"
+    bl_description = "Switch the selected baked clips between playing from the cache and the rig, e.g. to edit the animation"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        """
+        Executes the operator on the selected clips.
+        :param context: The context in which the operator is executed.
+        :return: A dictionary indicating the status of the execution.
+        """
+        toggled = [clip for clip in PointCacheBake.selected_clips(context) if PointCacheBake.state(clip) is not None]
+        if not toggled:
+            self.report({'ERROR'}, "The selected clips have no cache, bake them first")
+            return {'CANCELLED'}
+        for clip in toggled:
+            PointCacheBake.use_cache(clip, not PointCacheBake.state(clip)["enabled"])
+        return {'FINISHED'}
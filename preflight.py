@@ -0,0 +1,212 @@
+import time
+import bpy
+import numpy as np
+
+from .bounds import BoundsService
+
+
+class PreflightReport:
+    """
+    The result of a preflight analysis over an export hierarchy.
+
+    Attributes:
+        roots (list): Names of the root objects that were analysed.
+        vertex_budget (int): The maximum number of evaluated vertices allowed.
+        object_count (int): Number of objects in the hierarchy.
+        mesh_count (int): Number of mesh objects in the hierarchy.
+        vertex_count (int): Total evaluated vertex count.
+        triangle_count (int): Total evaluated triangle count.
+        material_count (int): Number of distinct materials used by faces.
+        modifier_count (int): Number of modifiers enabled in the viewport.
+        degenerate_face_count (int): Number of faces with (near) zero area.
+        face_count (int): Total evaluated face count.
+        bounds_min (numpy.ndarray): World-space minimum corner.
+        bounds_max (numpy.ndarray): World-space maximum corner.
+        per_object (list): Tuples of (name, vertices, triangles, modifiers).
+        over_budget (bool): True if the evaluated vertex count exceeds the budget.
+        errors (list): Reasons the hierarchy cannot be sent.
+        warnings (list): Problems that do not block sending.
+        elapsed (float): Analysis time in seconds.
+    """
+
+    def __init__(self, roots, vertex_budget):
+        self.roots = [root.name for root in roots]
+        self.vertex_budget = vertex_budget
+        self.object_count = 0
+        self.mesh_count = 0
+        self.vertex_count = 0
+        self.triangle_count = 0
+        self.material_count = 0
+        self.modifier_count = 0
+        self.degenerate_face_count = 0
+        self.face_count = 0
+        self.bounds_min = np.full(3, np.inf)
+        self.bounds_max = np.full(3, -np.inf)
+        self.per_object = []
+        self.over_budget = False
+        self.errors = []
+        self.warnings = []
+        self.elapsed = 0.0
+
+    @property
+    def passed(self):
+        """
+        True if the hierarchy can be exported and uploaded.
+        """
+        return not self.errors
+
+    @property
+    def dimensions(self):
+        """
+        World-space size of the hierarchy as a numpy array (zero if there is no geometry).
+        """
+        if self.mesh_count == 0:
+            return np.zeros(3)
+        return self.bounds_max - self.bounds_min
+
+    def heaviest_objects(self, count=3):
+        """
+        Get the objects with the most vertices.
+        :param count: The number of objects to return.
+        :type count: int
+        :return: A list of (name, vertices, triangles, modifiers) tuples.
+        :rtype: list
+        """
+        return sorted(self.per_object, key=lambda entry: entry[1], reverse=True)[:count]
+
+    def summary(self):
+        """
+        Build a single line description of the report.
+        :return: The summary text.
+        :rtype: str
+        """
+        size = self.dimensions
+        text = (f"{self.mesh_count} meshes, {self.vertex_count} vertices, {self.triangle_count} triangles, "
+                f"{self.material_count} materials, {self.modifier_count} modifiers, "
+                f"{self.degenerate_face_count} degenerate faces, "
+                f"size {size[0]:.3f} x {size[1]:.3f} x {size[2]:.3f} "
+                f"({self.elapsed * 1000.0:.1f} ms)")
+        if self.errors:
+            text += " - " + " ".join(self.errors)
+        return text
+
+
+class Preflight:
+    """
+    Analyses the whole export hierarchy before anything is exported or uploaded.
+    Mesh data is read from the evaluated depsgraph with foreach_get so the cost
+    stays in the milliseconds even on scenes with millions of vertices.
+    """
+    # Faces with an area below this value are reported as degenerate
+    DEGENERATE_AREA = 1e-10
+    # Warn when more than this fraction of the faces is degenerate
+    DEGENERATE_RATIO_WARNING = 0.01
+
+    def collect_hierarchy(self, roots):
+        """
+        Collect the root objects and all of their descendants, without duplicates.
+        :param roots: The objects selected for export.
+        :type roots: list
+        :return: The objects of the export hierarchy.
+        :rtype: list
+        """
+        seen = set()
+        objects = []
+        for root in roots:
+            for obj in [root] + list(root.children_recursive):
+                if obj.name_full not in seen:
+                    seen.add(obj.name_full)
+                    objects.append(obj)
+        return objects
+
+    def analyse(self, roots, vertex_budget=100000, depsgraph=None):
+        """
+        Analyse the export hierarchy and decide if it can be sent.
+        :param roots: The objects selected for export.
+        :type roots: list
+        :param vertex_budget: The maximum number of evaluated vertices.
+        :type vertex_budget: int
+        :param depsgraph: The depsgraph used to evaluate modifiers, defaults to the current one.
+        :type depsgraph: bpy.types.Depsgraph
+        :return: The preflight report.
+        :rtype: PreflightReport
+        """
+        start = time.perf_counter()
+        report = PreflightReport(roots, vertex_budget)
+        if depsgraph is None:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+
+        used_materials = set()
+        for obj in self.collect_hierarchy(roots):
+            report.object_count += 1
+            if obj.type != 'MESH':
+                continue
+            self.analyse_mesh_object(obj, depsgraph, report, used_materials)
+        report.material_count = len(used_materials)
+
+        if report.mesh_count == 0:
+            report.errors.append("The selection does not contain any mesh.")
+        elif report.vertex_count > vertex_budget:
+            report.over_budget = True
+            report.errors.append(f"The model has {report.vertex_count} vertices and exceeds {vertex_budget} vertices.")
+        elif not np.any(report.dimensions > 0.0):
+            report.errors.append("The model has no size.")
+
+        if report.face_count and report.degenerate_face_count > report.face_count * self.DEGENERATE_RATIO_WARNING:
+            report.warnings.append(f"{report.degenerate_face_count} of {report.face_count} faces have no area.")
+
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    def analyse_mesh_object(self, obj, depsgraph, report, used_materials):
+        """
+        Add the evaluated geometry of one mesh object to the report.
+        :param obj: The mesh object.
+        :type obj: bpy.types.Object
+        :param depsgraph: The depsgraph used to evaluate modifiers.
+        :type depsgraph: bpy.types.Depsgraph
+        :param report: The report to fill in.
+        :type report: PreflightReport
+        :param used_materials: Names of the materials used so far, updated in place.
+        :type used_materials: set
+        """
+        modifiers = sum(1 for modifier in obj.modifiers if modifier.show_viewport)
+        eval_obj = obj.evaluated_get(depsgraph)
+        mesh = eval_obj.to_mesh()
+        try:
+            vertex_count = len(mesh.vertices)
+            face_count = len(mesh.polygons)
+            mesh.calc_loop_triangles()
+            triangle_count = len(mesh.loop_triangles)
+
+            if vertex_count:
+                co = np.empty(vertex_count * 3, dtype=np.float32)
+                mesh.vertices.foreach_get("co", co)
+                co = co.reshape(-1, 3)
+                matrix = np.array(eval_obj.matrix_world, dtype=np.float64)
+                world = co @ matrix[:3, :3].T + matrix[:3, 3]
+                # Warm the bounds cache, the exporter needs the same bounds right after
+                BoundsService.store(obj, world)
+                report.bounds_min = np.minimum(report.bounds_min, world.min(axis=0))
+                report.bounds_max = np.maximum(report.bounds_max, world.max(axis=0))
+
+            if face_count:
+                areas = np.empty(face_count, dtype=np.float32)
+                mesh.polygons.foreach_get("area", areas)
+                report.degenerate_face_count += int(np.count_nonzero(areas <= self.DEGENERATE_AREA))
+
+                material_indices = np.empty(face_count, dtype=np.int32)
+                mesh.polygons.foreach_get("material_index", material_indices)
+                slots = obj.material_slots
+                for index in np.unique(material_indices):
+                    if index < len(slots) and slots[index].material is not None:
+                        used_materials.add(slots[index].material.name_full)
+        finally:
+            eval_obj.to_mesh_clear()
+
+        report.mesh_count += 1
+        report.vertex_count += vertex_count
+        report.face_count += face_count
+        report.triangle_count += triangle_count
+        report.modifier_count += modifiers
+        report.per_object.append((obj.name, vertex_count, triangle_count, modifiers))
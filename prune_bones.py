@@ -0,0 +1,29 @@
+import bpy
+
+from .rig_pruner import RigPruner
+from .aa_panel import AW_PT_AAPanel
+
+
+class PruneBones(bpy.types.Operator):
+    """
+    Operator to prune the unused bones of the selected rigs.
+    """
+    bl_idname = "object.aa_prune_bones"
+    bl_label = "Prune Unused Bones"
+    bl_description = "Remove or stop deforming the bones of the selected rigs that have no weights, no keys and no used children"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    mode: bpy.props.EnumProperty(name="Mode", items=RigPruner.MODES[1:], default='NON_DEFORM')
+
+    def execute(self, context):
+        """
+        Executes the operator on the selected objects.
+        :param context: The context in which the operator is executed.
+        :return: A dictionary indicating the status of the execution.
+        """
+        results = RigPruner(self.mode).prune_all(context.selected_objects)
+        if not results:
+            self.report({'ERROR'}, "Select a rig or a model with a rig")
+            return {'CANCELLED'}
+        AW_PT_AAPanel.message_handler("Pruned " + "; ".join(result.summary() for result in results))
+        return {'FINISHED'}
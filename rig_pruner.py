@@ -0,0 +1,278 @@
+import re
+import time
+import bpy
+
+from .tracing import Tracer
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class PruneResult:
+    """
+    What pruning a rig changed.
+
+    Attributes:
+        armature (str): The name of the armature object.
+        bones_before (int): Bones before pruning, only the deforming ones when they stop deforming.
+        pruned (list): Names of the unused bones that were removed or stopped deforming.
+        vertex_groups (int): Empty vertex groups removed from the deformed meshes.
+        deform_before (float): Median time to evaluate the pose and the deformed meshes before pruning, in milliseconds.
+        deform_after (float): The same after pruning.
+    """
+
+    def __init__(self, armature):
+        self.armature = armature
+        self.bones_before = 0
+        self.pruned = []
+        self.vertex_groups = 0
+        self.deform_before = 0.0
+        self.deform_after = 0.0
+
+    def summary(self):
+        return (f"{self.armature}: {len(self.pruned)} of {self.bones_before} bones and {self.vertex_groups} vertex groups "
+                f"pruned, deform {self.deform_before:.2f} -> {self.deform_after:.2f} ms per frame")
+
+
+class RigPruner:
+    """
+    Finds the bones of an imported rig that drive nothing and removes them or stops them from
+    deforming, so the armature modifier has less to do on every frame.
+
+    A bone is used if it has weights on a deformed mesh, is keyed in one of the actions of the
+    armature, is referenced by a constraint, a driver or a bone-parented object, or has a used
+    bone below it. Vertex groups without any weight are removed from the deformed meshes.
+    """
+    MODES = [('OFF', "Off", "Keep every bone"),
+             ('NON_DEFORM', "Disable deform", "Keep unused bones but stop them from deforming"),
+             ('REMOVE', "Remove", "Remove unused bones")]
+    # Weights below this do not move a vertex visibly
+    WEIGHT_EPSILON = 1e-4
+    # Evaluations timed before and after pruning, the median is reported
+    TIMING_SAMPLES = 10
+    BONE_PATH = re.compile(r'pose\.bones\["((?:[^"\\]|\\.)*)"\]')
+
+    def __init__(self, mode='NON_DEFORM', measure=True):
+        """
+        :param mode: 'NON_DEFORM' to clear use_deform on unused bones, 'REMOVE' to delete them.
+        :type mode: str
+        :param measure: Time the deformation before and after pruning.
+        :type measure: bool
+        """
+        self.mode = mode
+        self.measure = measure
+
+    @staticmethod
+    def armatures(roots):
+        """
+        :return: The armatures in the hierarchies of the given objects.
+        :rtype: list
+        """
+        found = []
+        for root in roots:
+            for obj in [root] + list(root.children_recursive):
+                if obj.type == 'ARMATURE' and obj not in found:
+                    found.append(obj)
+        return found
+
+    @staticmethod
+    def deformed_meshes(armature):
+        """
+        :return: The meshes deformed by an armature modifier using the armature.
+        :rtype: list
+        """
+        return [obj for obj in bpy.data.objects if obj.type == 'MESH' and any(
+            modifier.type == 'ARMATURE' and modifier.object == armature for modifier in obj.modifiers)]
+
+    @staticmethod
+    def action_fcurves(action):
+        """
+        :return: The F-curves of an action, for layered and legacy actions.
+        :rtype: list
+        """
+        if hasattr(action, "layers") and len(action.layers):
+            return [fcurve for layer in action.layers for strip in layer.strips
+                    for channelbag in getattr(strip, "channelbags", ()) for fcurve in channelbag.fcurves]
+        return list(getattr(action, "fcurves", ()))
+
+    @staticmethod
+    def actions(armature):
+        """
+        :return: The active action and the actions of the NLA strips of an armature.
+        :rtype: list
+        """
+        animation = armature.animation_data
+        if animation is None:
+            return []
+        actions = [animation.action] if animation.action is not None else []
+        for track in animation.nla_tracks:
+            for strip in track.strips:
+                if strip.action is not None and strip.action not in actions:
+                    actions.append(strip.action)
+        return actions
+
+    @staticmethod
+    def bone_names(data_path):
+        """
+        :return: The bones a data path such as 'pose.bones["Hip"].rotation_quaternion' refers to.
+        :rtype: list
+        """
+        return [name.replace('\\"', '"').replace('\\\\', '\\') for name in RigPruner.BONE_PATH.findall(data_path)]
+
+    @staticmethod
+    def weighted_groups(mesh_object):
+        """
+        The weights are not exposed to foreach_get, so the vertices are walked once, stopping as
+        soon as every group has a weight. Call it once per mesh and reuse the result.
+        :return: The names of the vertex groups with a weight on at least one vertex.
+        :rtype: set
+        """
+        groups = len(mesh_object.vertex_groups)
+        used = set()
+        for vertex in mesh_object.data.vertices:
+            for element in vertex.groups:
+                if element.weight > RigPruner.WEIGHT_EPSILON:
+                    used.add(element.group)
+            if len(used) >= groups:
+                break
+        return {group.name for group in mesh_object.vertex_groups if group.index in used}
+
+    @staticmethod
+    def used_bones(armature, meshes, weighted=None):
+        """
+        Find the bones of an armature that drive something.
+        :param armature: The armature object.
+        :param meshes: The meshes it deforms.
+        :param weighted: Mesh name -> its weighted_groups, computed here when None.
+        :type weighted: dict
+        :return: The names of the used bones, including the parents of used bones.
+        :rtype: set
+        """
+        bones = armature.data.bones
+        if weighted is None:
+            weighted = {mesh_object.name: RigPruner.weighted_groups(mesh_object) for mesh_object in meshes}
+        used = set()
+        for mesh_object in meshes:
+            used |= weighted[mesh_object.name]
+        for action in RigPruner.actions(armature):
+            for fcurve in RigPruner.action_fcurves(action):
+                used.update(RigPruner.bone_names(fcurve.data_path))
+        for pose_bone in armature.pose.bones:
+            if len(pose_bone.constraints):
+                used.add(pose_bone.name)
+                for constraint in pose_bone.constraints:
+                    if getattr(constraint, "target", None) == armature and getattr(constraint, "subtarget", ""):
+                        used.add(constraint.subtarget)
+        for obj in bpy.data.objects:
+            if obj.parent == armature and obj.parent_type == 'BONE':
+                used.add(obj.parent_bone)
+            for constraint in obj.constraints:
+                if getattr(constraint, "target", None) == armature and getattr(constraint, "subtarget", ""):
+                    used.add(constraint.subtarget)
+        owners = [armature, armature.data] + list(meshes) + [
+            mesh_object.data.shape_keys for mesh_object in meshes if mesh_object.data.shape_keys is not None]
+        for owner in owners:
+            if owner.animation_data is None:
+                continue
+            for driver in owner.animation_data.drivers:
+                used.update(RigPruner.bone_names(driver.data_path))
+                for variable in driver.driver.variables:
+                    for target in variable.targets:
+                        if target.id == armature:
+                            if target.bone_target:
+                                used.add(target.bone_target)
+                            used.update(RigPruner.bone_names(target.data_path))
+        # A bone moves the bones below it, keep the chain up to the root
+        for name in list(used):
+            bone = bones.get(name)
+            while bone is not None and bone.parent is not None and bone.parent.name not in used:
+                used.add(bone.parent.name)
+                bone = bone.parent
+        return {name for name in used if name in bones}
+
+    @staticmethod
+    def time_deform(armature, meshes, samples):
+        """
+        Time the re-evaluation of the pose and the deformed meshes, like on a frame change.
+        :return: The median time in milliseconds.
+        :rtype: float
+        """
+        view_layer = bpy.context.view_layer
+        timings = []
+        for _ in range(samples):
+            armature.update_tag(refresh={'OBJECT', 'DATA'})
+            for mesh_object in meshes:
+                mesh_object.update_tag(refresh={'DATA'})
+            start = time.perf_counter()
+            view_layer.update()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2]
+
+    def prune(self, armature):
+        """
+        Prune the unused bones of an armature and the empty vertex groups of its meshes. Main thread only.
+        :param armature: The armature object.
+        :type armature: bpy.types.Object
+        :rtype: PruneResult
+        """
+        result = PruneResult(armature.name)
+        meshes = RigPruner.deformed_meshes(armature)
+        bones = armature.data.bones
+        result.bones_before = len(bones) if self.mode == 'REMOVE' else sum(1 for bone in bones if bone.use_deform)
+        with Tracer.span("prune rig", armature=armature.name, bones=len(bones)):
+            if self.measure:
+                result.deform_before = RigPruner.time_deform(armature, meshes, self.TIMING_SAMPLES)
+            weighted = {mesh_object.name: RigPruner.weighted_groups(mesh_object) for mesh_object in meshes}
+            used = RigPruner.used_bones(armature, meshes, weighted)
+            if self.mode == 'REMOVE':
+                # Unused bones that do not deform are removed too
+                result.pruned = [bone.name for bone in bones if bone.name not in used]
+                if result.pruned:
+                    RigPruner.remove_bones(armature, result.pruned)
+            elif self.mode == 'NON_DEFORM':
+                result.pruned = [bone.name for bone in bones if bone.name not in used and bone.use_deform]
+                for name in result.pruned:
+                    bones[name].use_deform = False
+            for mesh_object in meshes:
+                # Removing bones does not touch the weights, the groups found above are still the weighted ones
+                for group in list(mesh_object.vertex_groups):
+                    if group.name not in weighted[mesh_object.name]:
+                        mesh_object.vertex_groups.remove(group)
+                        result.vertex_groups += 1
+            if self.measure:
+                result.deform_after = RigPruner.time_deform(armature, meshes, self.TIMING_SAMPLES)
+        log.info("Pruned rig %s", result.summary())
+        return result
+
+    @staticmethod
+    def remove_bones(armature, names):
+        """
+        Delete bones in edit mode, restoring the active object and mode afterwards.
+        """
+        view_layer = bpy.context.view_layer
+        previous = view_layer.objects.active
+        previous_mode = previous.mode if previous is not None else 'OBJECT'
+        if previous_mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        view_layer.objects.active = armature
+        bpy.ops.object.mode_set(mode='EDIT')
+        try:
+            edit_bones = armature.data.edit_bones
+            for name in names:
+                bone = edit_bones.get(name)
+                if bone is not None:
+                    edit_bones.remove(bone)
+        finally:
+            bpy.ops.object.mode_set(mode='OBJECT')
+            view_layer.objects.active = previous
+            if previous is not None and previous_mode != 'OBJECT':
+                bpy.ops.object.mode_set(mode=previous_mode)
+
+    def prune_all(self, roots):
+        """
+        Prune every armature in the hierarchies of the given objects.
+        :rtype: list
+        """
+        return [self.prune(armature) for armature in RigPruner.armatures(roots)]
+
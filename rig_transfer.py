@@ -0,0 +1,40 @@
+import bpy
+
+from .decimator import MeshDecimator
+from .global_values import GlobalValues
+from .aa_panel import AW_PT_AAPanel
+
+
+class RigTransfer(bpy.types.Operator):
+    """
+    Operator to transfer the rig returned for a decimated proxy back to the full-resolution mesh.
+    Select the full-resolution mesh, then the returned rigged mesh so it is the active object.
+    """
+    bl_idname = "wm.aa_transfer_rig"
+    bl_label = "Transfer Rig To Original"
+    bl_description = "Copy the weights and armature of the returned rig to the full-resolution mesh"
+
+    def execute(self, context):
+        """
+        Executes the operator to transfer the rig.
+        :param context: The context in which the operator is executed.
+        :return: A dictionary indicating the status of the execution.
+        """
+        result = GlobalValues.decimation
+        if result is None:
+            self.report({'ERROR'}, "No decimated model was sent in this session")
+            return {'CANCELLED'}
+
+        rigged = context.active_object
+        originals = [obj for obj in context.selected_objects if obj != rigged and obj.type == 'MESH']
+        if rigged is None or rigged.type != 'MESH' or not originals:
+            self.report({'ERROR'}, "Select the original mesh and then the rigged mesh")
+            return {'CANCELLED'}
+
+        decimator = MeshDecimator()
+        transferred = [obj.name for obj in originals if decimator.transfer_rig(result, obj, rigged)]
+        if not transferred:
+            self.report({'ERROR'}, "The selected meshes do not match the decimated model")
+            return {'CANCELLED'}
+        AW_PT_AAPanel.message_handler("Rig transferred to " + ", ".join(transferred))
+        return {'FINISHED'}
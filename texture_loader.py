@@ -0,0 +1,202 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+import bpy
+import numpy as np
+from bpy.app.handlers import persistent
+
+from .tracing import Tracer
+from .aa_logging import get_logger
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+log = get_logger(__name__)
+
+
+class DecodedTexture:
+    """
+    The pixels of a texture file, decoded off the main thread.
+
+    Attributes:
+        path (str): The file.
+        width (int): Width in pixels, after downscaling.
+        height (int): Height in pixels, after downscaling.
+        pixels (numpy.ndarray): Flat float32 RGBA values, bottom row first like Image.pixels.
+        data (bytes): The file to pack, the original one or a PNG of the downscaled pixels.
+    """
+
+    def __init__(self, path, width, height, pixels, data):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+        self.data = data
+
+
+class TextureLoader:
+    """
+    Loads texture files with the decoding done by a pool of worker threads.
+
+    Pillow decodes, and optionally downscales, each file into a float buffer while releasing the
+    GIL, so the files decode in parallel. The main thread only creates the image, copies the
+    buffer in with pixels.foreach_set and packs the file bytes read, or for downscaled textures
+    encoded, by the worker. Blender does not ship Pillow: without it, or
+    for formats it cannot read, files are opened on the main thread with bpy.ops.image.open as
+    before, and the panel says so.
+    """
+    MAX_WORKERS = 4
+    EXTENSIONS = ('.png', '.jpg', '.jpeg')
+    # Set on the images created from decoded pixels, they are read from their packed file once the blend file is opened again
+    PACKED_KEY = "aa_decoded"
+
+    _executor = None
+
+    @staticmethod
+    def available():
+        """
+        :return: True if textures can be decoded off the main thread.
+        :rtype: bool
+        """
+        return Image is not None
+
+    @staticmethod
+    def executor():
+        """
+        :return: The shared pool of decoding threads.
+        :rtype: ThreadPoolExecutor
+        """
+        if TextureLoader._executor is None:
+            TextureLoader._executor = ThreadPoolExecutor(max_workers=TextureLoader.MAX_WORKERS, thread_name_prefix="aa_texture")
+        return TextureLoader._executor
+
+    @staticmethod
+    def decode(path, max_size=0):
+        """
+        Decode a texture file. Safe to call on any thread.
+        :param path: The file.
+        :type path: str
+        :param max_size: Downscale so the longest side is at most this many pixels, 0 keeps the full size.
+        :type max_size: int
+        :return: The pixels, None if the file has to be opened by Blender.
+        :rtype: DecodedTexture
+        """
+        if Image is None:
+            return None
+        try:
+            with Tracer.span("decode texture", "texture", file=os.path.basename(path)) as span:
+                with Image.open(path) as image:
+                    original_size = image.size
+                    if max_size:
+                        # JPEG files decode at a reduced scale directly
+                        image.draft('RGB', (max_size, max_size))
+                    image = image.convert('RGBA')
+                    if max_size and max(image.size) > max_size:
+                        image.thumbnail((max_size, max_size))
+                    width, height = image.size
+                    if image.size != original_size:
+                        # Packed here, encoding on the main thread would cost as much as decoding
+                        buffer = io.BytesIO()
+                        image.save(buffer, format='PNG')
+                        data = buffer.getvalue()
+                    else:
+                        with open(path, 'rb') as file:
+                            data = file.read()
+                    # Blender stores the bottom row first
+                    pixels = np.asarray(image, dtype=np.uint8)[::-1]
+                pixels = pixels.astype(np.float32).ravel()
+                pixels *= 1.0 / 255.0
+                span.set(width=width, height=height, bytes=len(data))
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            log.debug("Could not decode %s, Blender will open it: %s", path, e)
+            return None
+        return DecodedTexture(path, width, height, pixels, data)
+
+    @staticmethod
+    def decode_async(path, max_size=0):
+        """
+        Start decoding a texture file on the pool.
+        :rtype: concurrent.futures.Future
+        """
+        return TextureLoader.executor().submit(TextureLoader.decode, path, max_size)
+
+    @staticmethod
+    def create_image(texture):
+        """
+        Create an image from decoded pixels. Main thread only.
+        :type texture: DecodedTexture
+        :rtype: bpy.types.Image
+        """
+        image = bpy.data.images.new(os.path.basename(texture.path), texture.width, texture.height, alpha=True)
+        image.pixels.foreach_set(texture.pixels)
+        image.filepath_raw = texture.path
+        image.update()
+        # A generated image is not saved with the file. Pack the bytes prepared by the worker, pack()
+        # would encode the pixels again here, and read them back from the packed file on load
+        image.pack(data=texture.data, data_len=len(texture.data))
+        image[TextureLoader.PACKED_KEY] = True
+        return image
+
+    @staticmethod
+    def open(path, texture=None):
+        """
+        Add a texture to the file. Main thread only.
+        :param path: The file.
+        :param texture: Its decoded pixels, None to let Blender open the file.
+        :type texture: DecodedTexture
+        """
+        if texture is None:
+            bpy.ops.image.open(filepath=path)
+        else:
+            TextureLoader.create_image(texture)
+
+    @staticmethod
+    def load_all(paths, max_size=0):
+        """
+        Load texture files, decoding them in parallel. Main thread only.
+        :param paths: The files.
+        :type paths: list
+        :param max_size: Downscale so the longest side is at most this many pixels, 0 keeps the full size.
+        :type max_size: int
+        """
+        if not TextureLoader.available():
+            if paths:
+                log.info("Pillow is not installed, decoding %d textures on the main thread", len(paths))
+            for path in paths:
+                TextureLoader.open(path)
+            return
+        futures = [(path, TextureLoader.decode_async(path, max_size)) for path in paths]
+        for path, future in futures:
+            TextureLoader.open(path, future.result())
+
+    @staticmethod
+    @persistent
+    def on_load(*args):
+        """
+        Images created from decoded pixels are saved as generated images holding a packed file,
+        turn them into file images so Blender loads the packed file.
+        """
+        for image in bpy.data.images:
+            if image.get(TextureLoader.PACKED_KEY) and image.source == 'GENERATED' and image.packed_file is not None:
+                image.source = 'FILE'
+
+    @staticmethod
+    def register():
+        bpy.app.handlers.load_post.append(TextureLoader.on_load)
+
+    @staticmethod
+    def unregister():
+        if TextureLoader.on_load in bpy.app.handlers.load_post:
+            bpy.app.handlers.load_post.remove(TextureLoader.on_load)
+        TextureLoader.shutdown()
+
+    @staticmethod
+    def shutdown():
+        """
+        Stop the decoding threads, e.g. when the add-on is disabled.
+        """
+        if TextureLoader._executor is not None:
+            TextureLoader._executor.shutdown(wait=False)
+            TextureLoader._executor = None
@@ -0,0 +1,44 @@
+import bpy
+
+from .tracing import Tracer
+from .aa_panel import AW_PT_AAPanel
+
+
+class TraceExport(bpy.types.Operator):
+    """
+    Operator to save the collected stage and transfer timings as a Chrome trace,
+    to open in chrome://tracing or ui.perfetto.dev.
+    """
+    bl_idname = "wm.aa_export_trace"
+    bl_label = "Export Trace"
+    bl_description = "Save the timings of the uploads, downloads and imports as a Chrome trace JSON"
+
+    filepath: bpy.props.StringProperty(subtype='FILE_PATH', default="animate_anything_trace.json")
+    filter_glob: bpy.props.StringProperty(default="*.json", options={'HIDDEN'})
+
+    def invoke(self, context, event):
+        """
+        Opens the file browser to pick the output file.
+        """
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        """
+        Executes the operator to write the trace.
+        :param context: The context in which the operator is executed.
+        :return: A dictionary indicating the status of the execution.
+        """
+        if not Tracer.enabled:
+            self.report({'ERROR'}, "Tracing is disabled (AA_TRACE=0)")
+            return {'CANCELLED'}
+        if Tracer.event_count() == 0:
+            self.report({'WARNING'}, "Nothing was traced yet")
+            return {'CANCELLED'}
+        try:
+            count = Tracer.export_chrome_trace(bpy.path.abspath(self.filepath))
+        except OSError as e:
+            self.report({'ERROR'}, "Could not write the trace: " + str(e))
+            return {'CANCELLED'}
+        AW_PT_AAPanel.message_handler(f"Saved {count} trace spans")
+        return {'FINISHED'}
@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class Span:
+    """
+    A timed section of work, use it as a context manager.
+    Extra fields can be added with set() while the span is open.
+    """
+    __slots__ = ("name", "category", "job_id", "args", "start")
+
+    def __init__(self, name, category, job_id, args):
+        self.name = name
+        self.category = category
+        self.job_id = job_id
+        self.args = args
+        self.start = 0
+
+    def set(self, **args):
+        """
+        Add fields to the span, e.g. the number of bytes transferred.
+        """
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc_value}"
+        Tracer.record(self.name, self.category, self.start, end - self.start, self.job_id, self.args)
+        return False
+
+
+class NullSpan:
+    """
+    Span used while tracing is disabled.
+    """
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class Tracer:
+    """
+    Collects spans of every stage and file transfer in a bounded in-memory buffer and exports
+    them as Chrome trace JSON (also readable by Perfetto).
+    Recording a span is a couple of clock reads and a deque append, cheap enough to stay on.
+    Set AA_TRACE=0 in the environment to disable it.
+    """
+    enabled = os.environ.get("AA_TRACE", "1") != "0"
+    MAX_EVENTS = 200000
+
+    _events = deque(maxlen=MAX_EVENTS)
+    _thread_names = {}
+    _local = threading.local()
+    _null_span = NullSpan()
+
+    @staticmethod
+    def span(name, category="stage", job_id=None, **args):
+        """
+        Create a span.
+        :param name: The name of the stage, e.g. "upload".
+        :type name: str
+        :param category: The category, e.g. "stage" or "transfer".
+        :type category: str
+        :param job_id: The job the work belongs to, defaults to the job set on the current thread.
+        :type job_id: str
+        :return: A context manager.
+        :rtype: Span
+        """
+        if not Tracer.enabled:
+            return Tracer._null_span
+        return Span(name, category, job_id, args)
+
+    @staticmethod
+    def set_job(job_id):
+        """
+        Set the job of the spans created on the current thread without an explicit job.
+        :param job_id: The job ID.
+        :type job_id: str
+        """
+        Tracer._local.job_id = job_id
+
+    @staticmethod
+    def current_job():
+        """
+        :return: The job set on the current thread, empty if none.
+        :rtype: str
+        """
+        return getattr(Tracer._local, "job_id", "")
+
+    @staticmethod
+    def record(name, category, start_ns, duration_ns, job_id=None, args=None):
+        """
+        Store a finished span.
+        """
+        thread = threading.current_thread()
+        if thread.ident not in Tracer._thread_names:
+            Tracer._thread_names[thread.ident] = thread.name
+        if job_id is None:
+            job_id = getattr(Tracer._local, "job_id", "")
+        Tracer._events.append((name, category, start_ns, duration_ns, thread.ident, job_id, args))
+
+    @staticmethod
+    def clear():
+        """
+        Drop all collected spans.
+        """
+        Tracer._events.clear()
+
+    @staticmethod
+    def event_count():
+        """
+        :return: The number of collected spans.
+        :rtype: int
+        """
+        return len(Tracer._events)
+
+    @staticmethod
+    def to_chrome_trace():
+        """
+        Build the Chrome trace document of the collected spans.
+        :return: The trace, ready for json.dump.
+        :rtype: dict
+        """
+        pid = os.getpid()
+        events = []
+        for ident, thread_name in list(Tracer._thread_names.items()):
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": ident, "args": {"name": thread_name}})
+        for name, category, start_ns, duration_ns, ident, job_id, args in list(Tracer._events):
+            event_args = dict(args) if args else {}
+            if job_id:
+                event_args["job_id"] = job_id
+            events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start_ns / 1000.0,
+                "dur": duration_ns / 1000.0,
+                "pid": pid,
+                "tid": ident,
+                "args": event_args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    @staticmethod
+    def export_chrome_trace(path):
+        """
+        Write the collected spans as Chrome trace JSON.
+        :param path: The output file.
+        :type path: str
+        :return: The number of spans written.
+        :rtype: int
+        """
+        trace = Tracer.to_chrome_trace()
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(trace, file)
+        return sum(1 for event in trace["traceEvents"] if event["ph"] == "X")
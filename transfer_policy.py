@@ -0,0 +1,353 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+
+from .tracing import Tracer
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised instead of sending a request to an endpoint that keeps failing.
+    """
+
+
+class RetryBudgetExceeded(requests.RequestException):
+    """
+    Raised when a job has used all of its retries.
+    """
+
+
+class RetryBudget:
+    """
+    Number of retries a single job may spend over all of its requests, so a job with
+    60 files survives a few dropped connections but a dead network fails it quickly.
+    Shared between the threads of the job.
+
+    Attributes:
+        limit (int): The number of retries allowed.
+        used (int): The number of retries spent.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit if limit is not None else TransferPolicy.JOB_RETRY_BUDGET
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def consume(self):
+        """
+        Spend one retry.
+        :return: False if the budget is exhausted.
+        :rtype: bool
+        """
+        with self._lock:
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+    @property
+    def remaining(self):
+        return max(0, self.limit - self.used)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one endpoint.
+    After FAILURE_THRESHOLD consecutive retryable failures the circuit opens and requests fail
+    immediately for RESET_SECONDS. Then a single trial request is let through: success closes
+    the circuit, failure opens it again.
+
+    Attributes:
+        endpoint (str): The host and path the breaker guards.
+        failures (int): Consecutive failures.
+        opened_at (float): Monotonic time the circuit opened, 0 while closed.
+    """
+    FAILURE_THRESHOLD = 5
+    RESET_SECONDS = 30.0
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """
+        :return: "closed", "open" or "half-open".
+        :rtype: str
+        """
+        if self.opened_at == 0.0:
+            return "closed"
+        if time.monotonic() - self.opened_at < CircuitBreaker.RESET_SECONDS:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        """
+        Check if a request may be sent.
+        :rtype: bool
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = 0.0
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= CircuitBreaker.FAILURE_THRESHOLD:
+                if self.opened_at == 0.0 or self.trial_running:
+                    log.warning("Circuit opened for %s after %d failures", self.endpoint, self.failures)
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+class TransferPolicy:
+    """
+    Shared retry policy of the upload, poll and download requests.
+
+    Idempotent requests are retried on connection errors, timeouts and 500/502/503/504 responses,
+    with exponential backoff and full jitter. A 429 is only retried when the server sends
+    Retry-After (a 429 without it means the credits are used up). Any other response is returned
+    to the caller unchanged. Uploads are not idempotent: they are only retried when the connection
+    could not be established, on a 503 and on a 429 with Retry-After. Never after a read timeout,
+    a connection dropped once it was open, or a 502/504, which a gateway may return after the
+    server accepted the whole body.
+    """
+    MAX_ATTEMPTS = 5
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 30.0
+    JOB_RETRY_BUDGET = 20
+    # Requests in flight at once over all jobs
+    MAX_CONNECTIONS = 8
+    # Statuses retried for requests that are not idempotent, the server did not take the request
+    RETRY_STATUSES = (503,)
+    IDEMPOTENT_RETRY_STATUSES = (500, 502, 503, 504)
+
+    _breakers = {}
+    _lock = threading.Lock()
+    _connections = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+    @staticmethod
+    def connection():
+        """
+        Get the global connection limit. Every attempt of request takes it, a streamed response
+        holds it until it is closed, so read it in a with block:
+            with TransferPolicy.request("GET", url, stream=True) as response:
+        :rtype: threading.BoundedSemaphore
+        """
+        return TransferPolicy._connections
+
+    @staticmethod
+    def send(method, url, **kwargs):
+        """
+        Send one attempt holding a connection. A streamed response keeps the connection until
+        it is closed, any other response gives it back at once.
+        :rtype: requests.Response
+        """
+        # The limit in force when the attempt started, set_max_connections may replace it
+        slot = TransferPolicy.connection()
+        slot.acquire()
+        try:
+            response = requests.request(method, url, **kwargs)
+        except BaseException:
+            slot.release()
+            raise
+        if not kwargs.get("stream"):
+            slot.release()
+            return response
+        close = response.close
+        released = threading.Event()
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released.is_set():
+                    released.set()
+                    slot.release()
+        response.close = close_and_release
+        return response
+
+    @staticmethod
+    def set_max_connections(count):
+        """
+        Change the global connection limit, requests already waiting keep the old limit.
+        :type count: int
+        """
+        TransferPolicy.MAX_CONNECTIONS = max(1, count)
+        TransferPolicy._connections = threading.BoundedSemaphore(TransferPolicy.MAX_CONNECTIONS)
+
+    @staticmethod
+    def breaker(url):
+        """
+        Get the circuit breaker of the endpoint of a URL. Query strings and file names are
+        ignored, so all the file downloads from one host share a breaker.
+        :rtype: CircuitBreaker
+        """
+        parsed = urlparse(url)
+        path = parsed.path if "." not in parsed.path.rsplit("/", 1)[-1] else parsed.path.rsplit("/", 1)[0]
+        endpoint = parsed.netloc + path
+        with TransferPolicy._lock:
+            if endpoint not in TransferPolicy._breakers:
+                TransferPolicy._breakers[endpoint] = CircuitBreaker(endpoint)
+            return TransferPolicy._breakers[endpoint]
+
+    @staticmethod
+    def reset():
+        """
+        Forget the state of every circuit breaker.
+        """
+        with TransferPolicy._lock:
+            TransferPolicy._breakers.clear()
+
+    @staticmethod
+    def backoff(attempt, retry_after=None):
+        """
+        Get the delay before a retry.
+        :param attempt: The number of the failed attempt, from 0.
+        :type attempt: int
+        :param retry_after: The Retry-After header of the response, if any.
+        :type retry_after: str
+        :return: Seconds to wait.
+        :rtype: float
+        """
+        if retry_after:
+            try:
+                return min(float(retry_after), TransferPolicy.BACKOFF_MAX)
+            except ValueError:
+                pass
+        ceiling = min(TransferPolicy.BACKOFF_MAX, TransferPolicy.BACKOFF_BASE * (2 ** attempt))
+        return random.uniform(0.0, ceiling)
+
+    @staticmethod
+    def not_connected(error):
+        """
+        Check whether a request failed before a connection to the server was established, so
+        nothing of it can have reached the server.
+        :type error: requests.RequestException
+        :rtype: bool
+        """
+        seen = set()
+        stack = [error]
+        while stack:
+            cause = stack.pop()
+            if cause is None or id(cause) in seen:
+                continue
+            seen.add(id(cause))
+            # NameResolutionError is a NewConnectionError as well
+            if isinstance(cause, (NewConnectionError, ConnectTimeoutError, requests.ConnectTimeout)):
+                return True
+            stack.extend([getattr(cause, "reason", None), cause.__cause__, cause.__context__])
+            stack.extend(arg for arg in getattr(cause, "args", ()) if isinstance(arg, BaseException))
+        return False
+
+    @staticmethod
+    def is_retryable_error(error, idempotent):
+        """
+        Classify an exception raised by requests. Requests that must not be repeated are only
+        retried if they failed before connecting: a dropped connection may come after the whole
+        body was sent.
+        :type error: requests.RequestException
+        :type idempotent: bool
+        :rtype: bool
+        """
+        if isinstance(error, (requests.ConnectTimeout, requests.exceptions.SSLError)):
+            return idempotent or isinstance(error, requests.ConnectTimeout)
+        if isinstance(error, (requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+            # The request may have been processed, only safe to repeat if idempotent
+            return idempotent
+        if isinstance(error, requests.ConnectionError):
+            return idempotent or TransferPolicy.not_connected(error)
+        return False
+
+    @staticmethod
+    def is_retryable_response(response, idempotent):
+        """
+        Classify a response.
+        :type response: requests.Response
+        :type idempotent: bool
+        :rtype: bool
+        """
+        if response.status_code == 429:
+            return "Retry-After" in response.headers
+        statuses = TransferPolicy.IDEMPOTENT_RETRY_STATUSES if idempotent else TransferPolicy.RETRY_STATUSES
+        return response.status_code in statuses
+
+    @staticmethod
+    def request(method, url, budget=None, idempotent=True, max_attempts=None, **kwargs):
+        """
+        Send a request following the policy.
+        :param method: "GET" or "POST".
+        :param url: The URL.
+        :param budget: The retry budget of the job, retries are unlimited up to max_attempts without one.
+        :type budget: RetryBudget
+        :param idempotent: False for requests that must not be repeated once they reached the server.
+        :param max_attempts: Attempts of this request, defaults to MAX_ATTEMPTS.
+        :param kwargs: Passed to requests.request.
+        :return: The response, which may still be an error response.
+        :rtype: requests.Response
+        :raises CircuitOpenError: If the endpoint is failing.
+        :raises RetryBudgetExceeded: If the job has no retries left.
+        :raises requests.RequestException: If the last attempt failed.
+        """
+        breaker = TransferPolicy.breaker(url)
+        max_attempts = max_attempts or TransferPolicy.MAX_ATTEMPTS
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"{breaker.endpoint} is failing, not retrying for now")
+            retry_after = None
+            try:
+                response = TransferPolicy.send(method, url, **kwargs)
+            except requests.RequestException as e:
+                # Only failures worth retrying say something about the health of the endpoint
+                if not TransferPolicy.is_retryable_error(e, idempotent):
+                    raise
+                breaker.record_failure()
+                failure = e
+                response = None
+            else:
+                if not TransferPolicy.is_retryable_response(response, idempotent):
+                    # The endpoint answered, whatever the status means is up to the caller
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                failure = response
+                retry_after = response.headers.get("Retry-After")
+
+            attempt += 1
+            if attempt >= max_attempts:
+                if response is not None:
+                    return response
+                raise failure
+            if budget is not None and not budget.consume():
+                if response is not None:
+                    return response
+                raise RetryBudgetExceeded(f"Retry budget of {budget.limit} used up, last error: {failure}")
+            delay = TransferPolicy.backoff(attempt - 1, retry_after)
+            reason = f"status {response.status_code}" if response is not None else type(failure).__name__
+            if response is not None:
+                # Give the connection back, the backoff sends nothing
+                response.close()
+            log.warning("Retrying %s %s in %.1f s (%s, attempt %d of %d)", method, url.split('?')[0], delay, reason, attempt + 1, max_attempts)
+            with Tracer.span("retry wait", "transfer", reason=reason, attempt=attempt):
+                time.sleep(delay)
@@ -0,0 +1,174 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+import bpy
+from .aa_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class JobWorkspace:
+    """
+    A directory owned by a single upload or download job.
+
+    Attributes:
+        job_id (str): The unique ID of the job.
+        path (str): The absolute path of the directory, with a trailing separator.
+    """
+
+    def __init__(self, job_id, path):
+        self.job_id = job_id
+        self.path = path
+
+    def join(self, *parts):
+        """
+        Build a path inside the workspace.
+        :return: The absolute path.
+        :rtype: str
+        """
+        return os.path.join(self.path, *parts)
+
+    def release(self):
+        """
+        Mark the job as finished, its files may now be removed by the cleanup.
+        """
+        WorkspaceManager.release(self)
+
+
+class WorkspaceManager:
+    """
+    Creates a workspace directory per job under the Blender temp directory and removes old
+    ones on a background thread, keeping the total size and age within budget.
+    Workspaces of jobs that are still running are never removed.
+    """
+    ROOT_NAME = "aa_jobs"
+    # Total size of the finished workspaces kept on disk
+    MAX_TOTAL_BYTES = 2 * 1024 * 1024 * 1024
+    # Finished workspaces older than this are removed
+    MAX_AGE_SECONDS = 24 * 60 * 60
+
+    _active = set()
+    _lock = threading.Lock()
+    _cleanup_thread = None
+
+    @staticmethod
+    def root():
+        """
+        Get the directory holding all the workspaces.
+        :return: The absolute path.
+        :rtype: str
+        """
+        return os.path.join(bpy.app.tempdir, WorkspaceManager.ROOT_NAME)
+
+    @staticmethod
+    def create(prefix="job"):
+        """
+        Create the workspace of a new job and schedule a cleanup of the old ones.
+        :param prefix: A prefix describing the job, e.g. "upload" or "download".
+        :type prefix: str
+        :return: The new workspace.
+        :rtype: JobWorkspace
+        """
+        job_id = f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        path = os.path.join(WorkspaceManager.root(), job_id)
+        os.makedirs(path, exist_ok=True)
+        with WorkspaceManager._lock:
+            WorkspaceManager._active.add(job_id)
+        WorkspaceManager.schedule_cleanup()
+        return JobWorkspace(job_id, path + os.sep)
+
+    @staticmethod
+    def release(workspace):
+        """
+        Mark a job as finished.
+        :param workspace: The workspace of the job.
+        :type workspace: JobWorkspace
+        """
+        with WorkspaceManager._lock:
+            WorkspaceManager._active.discard(workspace.job_id)
+
+    @staticmethod
+    def is_active(job_id):
+        """
+        Check if a job is still using its workspace.
+        :param job_id: The ID of the job.
+        :type job_id: str
+        :rtype: bool
+        """
+        with WorkspaceManager._lock:
+            return job_id in WorkspaceManager._active
+
+    @staticmethod
+    def schedule_cleanup():
+        """
+        Start a background cleanup unless one is already running.
+        """
+        with WorkspaceManager._lock:
+            thread = WorkspaceManager._cleanup_thread
+            if thread is not None and thread.is_alive():
+                return
+            # Resolve the path here, bpy should not be touched from the cleanup thread
+            thread = threading.Thread(target=WorkspaceManager.cleanup, args=(WorkspaceManager.root(),), daemon=True)
+            WorkspaceManager._cleanup_thread = thread
+        thread.start()
+
+    @staticmethod
+    def cleanup(root, max_bytes=None, max_age=None):
+        """
+        Remove finished workspaces that are too old, then the oldest ones until the total size fits the budget.
+        :param root: The directory holding all the workspaces.
+        :type root: str
+        :param max_bytes: The size budget, defaults to MAX_TOTAL_BYTES.
+        :type max_bytes: int
+        :param max_age: The age budget in seconds, defaults to MAX_AGE_SECONDS.
+        :type max_age: float
+        """
+        max_bytes = WorkspaceManager.MAX_TOTAL_BYTES if max_bytes is None else max_bytes
+        max_age = WorkspaceManager.MAX_AGE_SECONDS if max_age is None else max_age
+        if not os.path.isdir(root):
+            return
+
+        now = time.time()
+        finished = []
+        total = 0
+        for entry in os.scandir(root):
+            if not entry.is_dir(follow_symlinks=False) or WorkspaceManager.is_active(entry.name):
+                continue
+            size = WorkspaceManager.directory_size(entry.path)
+            modified = entry.stat(follow_symlinks=False).st_mtime
+            finished.append((modified, size, entry))
+            total += size
+
+        # Oldest first
+        finished.sort(key=lambda item: item[0])
+        for modified, size, entry in finished:
+            if now - modified <= max_age and total <= max_bytes:
+                break
+            # A job may have been restarted with the same directory in the meantime
+            if WorkspaceManager.is_active(entry.name):
+                continue
+            try:
+                shutil.rmtree(entry.path)
+                total -= size
+            except OSError as e:
+                log.warning("Could not remove workspace %s: %s", entry.path, e)
+
+    @staticmethod
+    def directory_size(path):
+        """
+        Get the total size of the files in a directory tree.
+        :param path: The directory.
+        :type path: str
+        :return: The size in bytes.
+        :rtype: int
+        """
+        total = 0
+        for directory, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(directory, name))
+                except OSError:
+                    pass
+        return total